@@ -1,5 +1,6 @@
 import os
-from flask import Flask, send_from_directory, request, jsonify, abort
+from flask import Flask, request, jsonify, abort, Response
+from werkzeug.security import safe_join
 from flask_cors import CORS
 from pathlib import Path
 from models import db
@@ -8,6 +9,9 @@ from blueprints.products import products_bp
 from blueprints.orders import orders_bp
 from blueprints.product_search import product_search_bp
 from product_search import VectorProductIndex
+from services.image_variants import is_immutable_name, parse_widths, send_image
+from services.metrics import metrics
+from services.serialization import OrjsonProvider
 DB_CONFIG = {
     'host': os.getenv('DB_HOST', 'localhost'),
     'port': int(os.getenv('DB_PORT', 3306)),
@@ -16,13 +20,16 @@ DB_CONFIG = {
     'database': os.getenv("DB_NAME", "xiangyipackage"),
     'charset': 'utf8mb4'
 }
-def create_app(config_name='development'):
+def create_app(config_name='development', load_index=True):
     app = Flask(__name__)
+    # jsonify / request.get_json 使用 orjson（未安装时退化为标准库）
+    app.json = OrjsonProvider(app)
     
     # 根据配置类型设置配置
     if config_name == 'testing':
         app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        # 压测等场景可通过 TEST_DATABASE_URL 指定本地文件数据库，供多个进程共享
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('TEST_DATABASE_URL', 'sqlite:///:memory:')
     else:
         # 使用统一的数据库配置
         app.config['SQLALCHEMY_DATABASE_URI'] = (
@@ -55,6 +62,18 @@ def create_app(config_name='development'):
         os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', '摄像师拍摄素材')
     )
     
+    # 图片缩略图缓存：/uploads 与 /dataset-images 支持 ?w=<宽度>
+    app.config['IMAGE_VARIANT_WIDTHS'] = parse_widths(os.getenv('IMAGE_VARIANT_WIDTHS', '128,256,512,1024'))
+    app.config['IMAGE_VARIANT_CACHE_DIR'] = os.getenv(
+        'IMAGE_VARIANT_CACHE_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'image_variants')
+    )
+    app.config['IMAGE_VARIANT_CACHE_MAX_MB'] = int(os.getenv('IMAGE_VARIANT_CACHE_MAX_MB', 2048))
+    # 图片文件交给前端代理发送：x-accel（nginx）/ x-sendfile（Apache、lighttpd），为空时由 Flask 直接发送；
+    # 只对 X-Image-Offload 请求头等于 IMAGE_OFFLOAD_SECRET（由代理设置）的请求生效，未配置密钥时不启用
+    app.config['IMAGE_OFFLOAD'] = os.getenv('IMAGE_OFFLOAD', '').strip().lower()
+    app.config['IMAGE_OFFLOAD_SECRET'] = os.getenv('IMAGE_OFFLOAD_SECRET', '')
+    
     # 确保上传目录存在
     if not app.config['TESTING']:
         os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'size_images'), exist_ok=True)
@@ -67,8 +86,8 @@ def create_app(config_name='development'):
     # 初始化扩展
     db.init_app(app)
 
-    # 初始化向量索引
-    if not app.config['TESTING']:
+    # 初始化向量索引（增量同步等离线脚本不需要全量加载，可传 load_index=False）
+    if not app.config['TESTING'] and load_index:
         # VectorProductIndex 初始化时会自动从数据库加载向量
         # 不再使用文件持久化，因为数据库是唯一的数据源
         product_index = VectorProductIndex()
@@ -87,7 +106,10 @@ def create_app(config_name='development'):
     # 添加静态文件路由
     @app.route('/uploads/<path:filename>')
     def serve_upload(filename):
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        return send_image(app, path, immutable=is_immutable_name(filename))
 
     @app.route('/dataset-images/<path:filename>')
     def serve_dataset_image(filename):
@@ -98,8 +120,7 @@ def create_app(config_name='development'):
         requested_path = os.path.realpath(os.path.join(dataset_root, filename))
         if not requested_path.startswith(safe_root) or not os.path.isfile(requested_path):
             abort(404)
-        directory, basename = os.path.split(requested_path)
-        return send_from_directory(directory, basename)
+        return send_image(app, requested_path)
 
     # 健康检查接口
     @app.route('/api/health', methods=['GET'])
@@ -118,9 +139,15 @@ def create_app(config_name='development'):
                 'error': str(e)
             }), 503
 
-    return app
+    # Prometheus 指标接口
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics_endpoint():
+        """以 Prometheus 文本格式输出搜索各阶段耗时、embedding 调用和索引加载等指标"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
-app = create_app()
+    return app
 
+# 不在导入时创建应用：gunicorn 使用 wsgi:app，离线脚本自行调用 create_app
 if __name__ == '__main__':
+    app = create_app(os.getenv('FLASK_CONFIG', 'development'))
     app.run(host='0.0.0.0', port=5000,debug=True)
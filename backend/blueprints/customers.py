@@ -1,10 +1,13 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import cross_origin
 from models import db, Customer, BalanceTransaction
+from models.customer import pinyin_keys
 from pypinyin import lazy_pinyin
+from sqlalchemy import or_
 import re
 import os
 import json
+from services.serialization import dicts_for
 # Please install OpenAI SDK first: `pip3 install openai`
 from dotenv import load_dotenv
 from openai import OpenAI
@@ -109,37 +112,71 @@ def parse_address_text():
     address_info = parse_address(data['text'])
     return jsonify(address_info), 200
 
+# 客户列表分页：每页默认 / 最大数量
+CUSTOMER_LIST_DEFAULT_LIMIT = 50
+CUSTOMER_LIST_MAX_LIMIT = 200
+
+def customer_search_filters(name_query, phone_query):
+    """
+    姓名 / 电话前缀检索条件，均可走索引：
+    姓名按原文前缀、全拼前缀（zhangs）或首字母前缀（zs）匹配，电话按号码前缀匹配；
+    纯汉字查询只按原文匹配，避免 张 同时命中 章、彰 等同音字
+    """
+    filters = []
+    name_query = (name_query or '').strip()
+    if name_query:
+        conditions = [Customer.name.startswith(name_query, autoescape=True)]
+        # 与存储的拼音键同样的转换：汉字先转拼音（张s -> zhangs），再做规范化
+        pinyin_query = pinyin_keys(name_query)[0] if re.search('[A-Za-z]', name_query) else ''
+        if pinyin_query:
+            conditions.append(Customer.name_pinyin.startswith(pinyin_query, autoescape=True))
+            conditions.append(Customer.name_initials.startswith(pinyin_query, autoescape=True))
+        filters.append(or_(*conditions))
+    phone_query = (phone_query or '').strip()
+    if phone_query:
+        filters.append(Customer.phone.startswith(phone_query, autoescape=True))
+    return filters
+
+def _customer_list_dicts(customers):
+    customer_list = dicts_for(customers)
+    for customer, customer_dict in zip(customers, customer_list):
+        # 未回填拼音键的旧数据现场计算
+        customer_dict['pinyin'] = customer.name_pinyin or get_pinyin(customer.name)
+    return customer_list
+
 @customers_bp.route('', methods=['GET', 'OPTIONS'])
 @cross_origin()
 def get_customers():
-    """获取客户列表"""
-    # 获取查询参数
-    name_query = request.args.get('name', '').lower()
-    phone_query = request.args.get('phone', '')
-    sort_by = request.args.get('sort', 'pinyin')  # 默认按拼音排序
-    sort_order = request.args.get('order', 'asc')
-    
-    # 获取所有客户
-    customers = Customer.query.order_by(Customer.id.desc()).all()
-    
-    # 转换为字典列表并添加拼音
-    customer_list = []
-    for customer in customers:
-        customer_dict = customer.to_dict()
-        customer_dict['pinyin'] = get_pinyin(customer.name)
-        customer_list.append(customer_dict)
-    
-    # 如果有名字搜索 - 支持中文和拼音搜索
-    if name_query:
-        customer_list = [c for c in customer_list if 
-                        c['pinyin'].startswith(name_query) or  # 拼音搜索
-                        c['name'].lower().startswith(name_query)]  # 中文搜索
-    
-    # 如果有电话号码搜索
-    if phone_query:
-        customer_list = [c for c in customer_list if c['phone'] and c['phone'].startswith(phone_query)]
-    
-    return jsonify(customer_list), 200
+    """
+    获取客户列表，按 id 倒序。
+    Query Parameters:
+        name (str): 姓名前缀，支持中文、全拼和拼音首字母
+        phone (str): 电话号码前缀
+        limit (int): 每页数量（默认 50，最大 200）；提供 limit 或 cursor 时返回分页结果
+            {'items': [...], 'next_cursor': str|null, 'has_more': bool}，否则返回全部匹配的客户列表
+        cursor (str): 上一页返回的 next_cursor
+    """
+    query = Customer.query.filter(*customer_search_filters(request.args.get('name'), request.args.get('phone')))
+
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        customers = query.order_by(Customer.id.desc()).all()
+        return jsonify(_customer_list_dicts(customers)), 200
+
+    try:
+        limit = min(max(int(request.args.get('limit', CUSTOMER_LIST_DEFAULT_LIMIT)), 1), CUSTOMER_LIST_MAX_LIMIT)
+        if request.args.get('cursor'):
+            query = query.filter(Customer.id < int(request.args['cursor']))
+    except ValueError:
+        return jsonify({'error': 'limit 和 cursor 必须为整数'}), 400
+
+    customers = query.order_by(Customer.id.desc()).limit(limit + 1).all()
+    has_more = len(customers) > limit
+    customers = customers[:limit]
+    return jsonify({
+        'items': _customer_list_dicts(customers),
+        'next_cursor': str(customers[-1].id) if has_more else None,
+        'has_more': has_more,
+    }), 200
 
 @customers_bp.route('/<int:customer_id>', methods=['GET', 'OPTIONS'])
 @cross_origin()
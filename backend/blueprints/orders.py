@@ -7,6 +7,13 @@ from flask_cors import cross_origin
 from werkzeug.utils import secure_filename
 import pandas as pd
 import os
+import math
+import base64
+from sqlalchemy import and_, event, func, or_
+from sqlalchemy.orm import Session
+from services.metrics import metrics
+from services.search_cache import TTLCache
+from services.serialization import row_cache
 
 orders_bp = Blueprint('orders', __name__, url_prefix='/api/orders')
 
@@ -99,6 +106,109 @@ def create_order():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# 游标分页：每页默认 / 最大数量
+ORDER_LIST_DEFAULT_LIMIT = 20
+ORDER_LIST_MAX_LIMIT = 200
+
+# 各筛选条件组合的订单总数缓存；key 带上缓存代数，订单写入提交后递增代数。
+# 配置 SEARCH_CACHE_REDIS_URL 时代数和总数都存放在 Redis 中，所有 worker 同时失效；
+# 未配置时只对本进程生效，其他进程的写入靠 TTL 兜底
+order_count_cache = TTLCache(
+    maxsize=int(os.getenv('ORDER_COUNT_CACHE_SIZE', 256)),
+    ttl=float(os.getenv('ORDER_COUNT_CACHE_TTL', 60)),
+    redis_url=os.getenv('SEARCH_CACHE_REDIS_URL'),
+    namespace='order_count',
+)
+
+@event.listens_for(Session, 'after_flush')
+def _mark_orders_changed(session, flush_context):
+    if any(isinstance(row, Order) for row in list(session.new) + list(session.dirty) + list(session.deleted)):
+        session.info['orders_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_order_counts(session):
+    # 提交后再递增代数；提交前读到旧代数的请求写入的旧总数不会再被命中
+    if session.info.pop('orders_changed', False):
+        order_count_cache.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_order_changes(session):
+    session.info.pop('orders_changed', None)
+
+def _order_list_filters(args):
+    """订单列表的筛选条件及其缓存 key；日期格式错误时抛出 ValueError"""
+    filters = []
+    customer_id = args.get('customer_id', type=int)
+    status = args.get('status')
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    if customer_id:
+        filters.append(Order.customer_id == customer_id)
+    if status:
+        filters.append(Order.status == status)
+    if start_date:
+        try:
+            filters.append(Order.created_at >= datetime.strptime(start_date, '%Y-%m-%d'))
+        except ValueError:
+            raise ValueError('开始日期格式错误，请使用YYYY-MM-DD格式')
+    if end_date:
+        try:
+            # 将结束日期设置为当天的23:59:59
+            end_datetime = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+            filters.append(Order.created_at <= end_datetime)
+        except ValueError:
+            raise ValueError('结束日期格式错误，请使用YYYY-MM-DD格式')
+    cache_key = json.dumps([customer_id, status, start_date, end_date], ensure_ascii=False)
+    return filters, cache_key
+
+def count_orders(filters, cache_key):
+    """按筛选条件统计订单数，结果缓存在 order_count_cache 中"""
+    generation = order_count_cache.generation()
+    cache_key = None if generation is None else f'{generation}:{cache_key}'
+    total = order_count_cache.get(cache_key) if cache_key else None
+    metrics.inc('order_count_cache_total', result='miss' if total is None else 'hit')
+    if total is None:
+        # customer_id 有外键约束，统计时不需要 JOIN customers
+        total = db.session.query(func.count(Order.id)).filter(*filters).scalar()
+        if cache_key:
+            order_count_cache.set(cache_key, total)
+    return total
+
+def encode_order_cursor(created_at, order_id):
+    """把最后一行的 (created_at, id) 编码为不透明的游标字符串"""
+    payload = json.dumps([created_at.isoformat() if created_at else None, order_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_order_cursor(cursor):
+    """解析游标，返回 (created_at, id)；格式错误时抛出 ValueError"""
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return (datetime.fromisoformat(created_at) if created_at else None), int(order_id)
+    except Exception as e:
+        raise ValueError('无效的分页游标') from e
+
+def _order_keyset_filter(created_at, order_id):
+    """按 (created_at DESC, id DESC) 排序时位于游标之后的行；created_at 为空的行排在最后"""
+    if created_at is None:
+        return and_(Order.created_at.is_(None), Order.id < order_id)
+    return or_(
+        Order.created_at < created_at,
+        and_(Order.created_at == created_at, Order.id < order_id),
+        Order.created_at.is_(None),
+    )
+
+def _order_rows_to_dicts(rows):
+    """(Order, 客户姓名, 客户电话) 行转换为响应字典"""
+    orders_data = []
+    for order, customer_name, customer_phone in rows:
+        order_dict = row_cache.as_dict(order)
+        order_dict.update({
+            'customer_name': customer_name,
+            'customer_phone': customer_phone,
+        })
+        orders_data.append(order_dict)
+    return orders_data
+
 @orders_bp.route('', methods=['GET'])
 @cross_origin()
 def list_orders():
@@ -113,69 +223,62 @@ def list_orders():
         end_date (str): 结束日期，格式：YYYY-MM-DD，可选
         sort (str): 排序字段，可选，默认按创建时间倒序
         order (str): 排序方向，可选，asc或desc，默认desc
+        limit (int): 游标分页的每页数量（默认 20，最大 200）；提供 limit 或 cursor 时按 created_at、id 倒序
+            返回 {'items': [...], 'next_cursor': str|null, 'has_more': bool, 'total': int}，忽略 page / sort
+        cursor (str): 上一页返回的 next_cursor
     """
     try:
+        try:
+            filters, cache_key = _order_list_filters(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # 客户姓名、电话与订单在同一条查询中取出
+        query = (db.session.query(Order, Customer.name, Customer.phone)
+                 .join(Customer, Order.customer_id == Customer.id)
+                 .filter(*filters))
+
+        if 'limit' in request.args or 'cursor' in request.args:
+            try:
+                limit = min(max(int(request.args.get('limit', ORDER_LIST_DEFAULT_LIMIT)), 1), ORDER_LIST_MAX_LIMIT)
+                if request.args.get('cursor'):
+                    query = query.filter(_order_keyset_filter(*decode_order_cursor(request.args['cursor'])))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            rows = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1).all()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            return jsonify({
+                'items': _order_rows_to_dicts(rows),
+                'next_cursor': encode_order_cursor(rows[-1][0].created_at, rows[-1][0].id) if has_more else None,
+                'has_more': has_more,
+                'total': count_orders(filters, cache_key),
+            })
+
         # 获取查询参数
-        page = request.args.get('page', 1, type=int)
+        page = max(request.args.get('page', 1, type=int), 1)
         per_page = request.args.get('per_page', 10, type=int)
-        customer_id = request.args.get('customer_id', type=int)
-        status = request.args.get('status')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
+        if per_page < 1:
+            per_page = 10
         sort_field = request.args.get('sort', 'created_at')
         sort_order = request.args.get('order', 'desc')
 
-        # 构建查询
-        query = Order.query.join(Customer, Order.customer_id == Customer.id)
-
-        # 应用过滤条件
-        if customer_id:
-            query = query.filter(Order.customer_id == customer_id)
-        if status:
-            query = query.filter(Order.status == status)
-        
-        # 应用日期范围筛选
-        if start_date:
-            try:
-                start_datetime = datetime.strptime(start_date, '%Y-%m-%d')
-                query = query.filter(Order.created_at >= start_datetime)
-            except ValueError:
-                return jsonify({'error': '开始日期格式错误，请使用YYYY-MM-DD格式'}), 400
-                
-        if end_date:
-            try:
-                # 将结束日期设置为当天的23:59:59
-                end_datetime = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-                query = query.filter(Order.created_at <= end_datetime)
-            except ValueError:
-                return jsonify({'error': '结束日期格式错误，请使用YYYY-MM-DD格式'}), 400
-
-        # 应用排序
+        # 应用排序（id 作为相同值时的次序，保证翻页稳定）
         sort_column = getattr(Order, sort_field, Order.created_at)
         if sort_order == 'desc':
-            query = query.order_by(sort_column.desc())
+            query = query.order_by(sort_column.desc(), Order.id.desc())
         else:
-            query = query.order_by(sort_column.asc())
+            query = query.order_by(sort_column.asc(), Order.id.asc())
 
-        # 执行分页查询
-        paginated_orders = query.paginate(page=page, per_page=per_page, error_out=False)
-        
-        # 准备响应数据
-        orders_data = []
-        for order in paginated_orders.items:
-            order_dict = order.to_dict()
-            customer = Customer.query.get(order.customer_id)
-            if customer:
-                order_dict.update({
-                    'customer_name': customer.name,
-                    'customer_phone': customer.phone,
-                })
-            orders_data.append(order_dict)
+        # 总数走缓存，不再每次执行 COUNT(*)
+        total = count_orders(filters, cache_key)
+        rows = query.offset((page - 1) * per_page).limit(per_page).all()
 
         return jsonify({
-            'orders': orders_data,
-            'total': paginated_orders.total,
-            'pages': paginated_orders.pages,
+            'orders': _order_rows_to_dicts(rows),
+            'total': total,
+            'pages': math.ceil(total / per_page),
             'current_page': page,
             'per_page': per_page
         })
@@ -1,10 +1,12 @@
 from flask import Blueprint, request, jsonify, current_app
 import os
-import oss2
 import uuid
 from datetime import datetime
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 
+from services.storage import BATCH_DELETE_SIZE, MAX_UPLOAD_SIZE, get_storage, open_upload_stream
+
 oss_bp = Blueprint('oss', __name__, url_prefix='/api/oss')
 
 # 允许的文件类型
@@ -14,77 +16,54 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def get_oss_client():
-    """获取OSS客户端"""
-    # 从环境变量获取OSS配置
-    access_key_id = os.getenv('OSS_ACCESS_KEY_ID')
-    access_key_secret = os.getenv('OSS_ACCESS_KEY_SECRET')
-    endpoint = os.getenv('OSS_ENDPOINT')
-    bucket_name = os.getenv('OSS_BUCKET_NAME')
-    
-    if not all([access_key_id, access_key_secret, endpoint, bucket_name]):
-        raise ValueError("OSS配置不完整，请检查环境变量")
-    
-    # 创建Auth对象
-    auth = oss2.Auth(access_key_id, access_key_secret)
-    
-    # 创建Bucket对象
-    bucket = oss2.Bucket(auth, endpoint, bucket_name)
-    
-    return bucket, bucket_name
+    """获取OSS客户端（应用内复用同一个 Bucket 和连接池）"""
+    storage = get_storage('oss')
+    return storage.bucket, storage.bucket_name
 
 @oss_bp.route('/upload', methods=['POST'])
 def upload_file():
-    """上传文件到OSS"""
+    """上传文件到OSS：请求体边解析边上传，大文件自动分片并发上传，不写本地临时文件"""
     try:
-        # 检查是否有文件
-        if 'file' not in request.files:
+        request.max_content_length = MAX_UPLOAD_SIZE
+        try:
+            filename, content_type, form, reader = open_upload_stream(request, 'file', MAX_UPLOAD_SIZE)
+        except BadRequest:
             return jsonify({'error': '没有文件'}), 400
         
-        file = request.files['file']
-        
         # 检查文件名
-        if file.filename == '':
+        if not filename:
             return jsonify({'error': '没有选择文件'}), 400
         
         # 检查文件类型
-        if not allowed_file(file.filename):
+        if not allowed_file(filename):
             return jsonify({'error': '不支持的文件类型'}), 400
         
         # 生成唯一文件名
-        original_filename = secure_filename(file.filename)
+        original_filename = secure_filename(filename)
         file_ext = original_filename.rsplit('.', 1)[1].lower()
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         unique_id = str(uuid.uuid4().hex[:8])
         new_filename = f"{timestamp}_{unique_id}.{file_ext}"
         
-        # 设置OSS存储路径
-        folder = request.form.get('folder', 'products')  # 默认存储在products文件夹
+        # 设置OSS存储路径（folder 字段需位于文件字段之前）
+        folder = form.get('folder', 'products')  # 默认存储在products文件夹
         oss_path = f"{folder}/{new_filename}"
         
-        # 获取OSS客户端
-        bucket, bucket_name = get_oss_client()
-        
         # 上传文件
-        result = bucket.put_object(oss_path, file)
-        
-        # 生成访问URL
-        endpoint = os.getenv('OSS_ENDPOINT')
-        # 移除http(s)://前缀
-        if endpoint.startswith('http://'):
-            endpoint = endpoint[7:]
-        elif endpoint.startswith('https://'):
-            endpoint = endpoint[8:]
-        
-        # 构建URL
-        url = f"https://{bucket_name}.{endpoint}/{oss_path}"
+        storage = get_storage('oss')
+        result = storage.upload_stream(oss_path, reader, content_type)
         
         return jsonify({
             'message': '文件上传成功',
-            'url': url,
+            'url': storage.url(oss_path),
             'path': oss_path,
-            'filename': new_filename
+            'filename': new_filename,
+            'size': result.size,
+            'sha256': result.sha256
         })
         
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'文件超过 {MAX_UPLOAD_SIZE // 1024 // 1024} MB'}), 413
     except Exception as e:
         current_app.logger.error(f"上传文件到OSS时出错: {e}")
         return jsonify({'error': f'上传失败: {str(e)}'}), 500
@@ -99,14 +78,31 @@ def delete_file():
         if not oss_path:
             return jsonify({'error': '未提供文件路径'}), 400
         
-        # 获取OSS客户端
-        bucket, _ = get_oss_client()
-        
         # 删除文件
-        bucket.delete_object(oss_path)
+        get_storage('oss').delete(oss_path)
         
         return jsonify({'message': '文件删除成功'})
         
     except Exception as e:
         current_app.logger.error(f"从OSS删除文件时出错: {e}")
-        return jsonify({'error': f'删除失败: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'删除失败: {str(e)}'}), 500
+
+@oss_bp.route('/batch-delete', methods=['POST'])
+def batch_delete_files():
+    """批量删除OSS文件，每 1000 个对象合并为一次 DeleteMultipleObjects 请求"""
+    try:
+        data = request.get_json(silent=True) or {}
+        paths = data.get('paths')
+        
+        if not isinstance(paths, list) or not paths or not all(isinstance(p, str) and p for p in paths):
+            return jsonify({'error': '未提供文件路径列表 (paths)'}), 400
+        if len(paths) > BATCH_DELETE_SIZE * 10:
+            return jsonify({'error': f'单次最多删除 {BATCH_DELETE_SIZE * 10} 个文件'}), 400
+        
+        deleted = get_storage('oss').delete_many(paths)
+        
+        return jsonify({'message': f'成功删除 {len(deleted)} 个文件', 'deleted': deleted})
+        
+    except Exception as e:
+        current_app.logger.error(f"批量删除OSS文件时出错: {e}")
+        return jsonify({'error': f'删除失败: {str(e)}'}), 500
@@ -1,4 +1,5 @@
 from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 import os
 import requests
@@ -7,9 +8,9 @@ import json
 import csv
 import io
 import time
+import math
 from product_search import VectorProductIndex# 导入向量搜索和产品信息
 from models import db, Product,ProductImage,Order# 导入Product模型
-from .oss import get_oss_client  # 导入OSS客户端
 import hashlib
 import uuid
 import ast
@@ -17,7 +18,16 @@ from flask_cors import cross_origin
 import shutil
 import json # 确保导入 json
 from flask import Response, stream_with_context # 确保导入 Response 和 stream_with_context
-from sqlalchemy import and_ # <--- 添加这一行
+from sqlalchemy import and_, func, or_ # <--- 添加这一行
+from datetime import datetime
+import base64
+from services.metrics import metrics, track_stages, stage_timer
+from services.lexical_index import ProductLexicalIndex
+from services.index_build import BuildCheckpoint, IndexBuildPipeline
+from services.rate_limiter import RateLimiter
+from services.serialization import rows_response
+from services.storage import MAX_UPLOAD_SIZE, get_storage, open_upload_stream
+import threading
 
 products_bp = Blueprint('products', __name__, url_prefix='/api/products')
 
@@ -28,18 +38,154 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# 商品列表可投影的字段；thumbnail 为主图（没有主图时取第一张商品图）
+LIST_PRODUCT_FIELDS = {
+    'id', 'name', 'description', 'price', 'sale_price', 'product_code', 'pattern', 'skirt_length',
+    'clothing_length', 'style', 'pants_length', 'sleeve_length', 'fashion_elements', 'craft', 'launch_season',
+    'main_material', 'color', 'size', 'size_img', 'good_img', 'factory_name', 'image_url', 'image_path',
+    'oss_path', 'sales_status', 'created_at', 'updated_at', 'thumbnail',
+}
+LIST_JSON_FIELDS = {'size_img', 'good_img'}
+LIST_DATETIME_FIELDS = {'created_at', 'updated_at'}
+DEFAULT_LIST_FIELDS = ['id', 'name', 'price', 'sale_price', 'product_code', 'sales_status', 'thumbnail', 'created_at']
+LIST_DEFAULT_LIMIT = 50
+LIST_MAX_LIMIT = 200
+# 出现任一分页/筛选/投影参数时返回分页结果，否则保持原来的全量列表响应
+LIST_QUERY_PARAMS = {'limit', 'cursor', 'fields', 'q', 'sales_status', 'factory_name', 'min_price', 'max_price'}
+
+def parse_list_fields(raw_fields):
+    """解析商品列表的 fields 参数（逗号分隔）；包含未知字段时抛出 ValueError"""
+    if not raw_fields:
+        return DEFAULT_LIST_FIELDS
+    fields = [f.strip() for f in raw_fields.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in LIST_PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+    return fields or DEFAULT_LIST_FIELDS
+
+def encode_list_cursor(created_at, product_id):
+    """把最后一行的 (created_at, id) 编码为不透明的游标字符串"""
+    payload = json.dumps([created_at.isoformat() if created_at else None, product_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_list_cursor(cursor):
+    """解析游标，返回 (created_at, id)；格式错误时抛出 ValueError"""
+    try:
+        created_at, product_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return (datetime.fromisoformat(created_at) if created_at else None), int(product_id)
+    except Exception as e:
+        raise ValueError('无效的分页游标') from e
+
+def _list_keyset_filter(created_at, product_id):
+    """按 (created_at DESC, id DESC) 排序时位于游标之后的行；created_at 为空的行排在最后（MySQL / SQLite 的降序规则）"""
+    if created_at is None:
+        return and_(Product.created_at.is_(None), Product.id < product_id)
+    return or_(
+        Product.created_at < created_at,
+        and_(Product.created_at == created_at, Product.id < product_id),
+        Product.created_at.is_(None),
+    )
+
+def _list_filters(args):
+    """商品列表的服务端筛选条件；参数格式错误时抛出 ValueError"""
+    filters = []
+    keyword = (args.get('q') or '').strip()
+    if keyword:
+        filters.append(or_(Product.name.contains(keyword, autoescape=True),
+                           Product.product_code.startswith(keyword, autoescape=True)))
+    statuses = [s.strip() for s in (args.get('sales_status') or '').split(',') if s.strip()]
+    if statuses:
+        filters.append(Product.sales_status.in_(statuses))
+    if args.get('factory_name'):
+        filters.append(Product.factory_name == args['factory_name'])
+    for name, op in (('min_price', '__ge__'), ('max_price', '__le__')):
+        if args.get(name):
+            try:
+                filters.append(getattr(Product.price, op)(float(args[name])))
+            except ValueError:
+                raise ValueError(f'{name} 必须为数字')
+    return filters
+
+def _list_item(row, fields):
+    item = {}
+    for field in fields:
+        if field == 'thumbnail':
+            item[field] = row.image_url or _first_image_url(row.good_img)
+        elif field in LIST_JSON_FIELDS:
+            item[field] = _parse_json_list(getattr(row, field))
+        elif field in LIST_DATETIME_FIELDS:
+            value = getattr(row, field)
+            item[field] = value.isoformat() if value else None
+        else:
+            item[field] = getattr(row, field)
+    return item
+
+def _parse_json_list(raw):
+    if not raw:
+        return []
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return []
+
+def _first_image_url(good_img):
+    images = _parse_json_list(good_img)
+    if not images:
+        return None
+    first = images[0]
+    return first.get('url') if isinstance(first, dict) else first
+
 # 获取产品列表
 @products_bp.route('', methods=['GET'])
 @cross_origin()
 def get_products():
+    """
+    获取产品列表，按 created_at、id 倒序。
+    不带参数时返回全部商品的完整字段（兼容旧版前端）；带任一下列参数时返回分页结果
+    {'items': [...], 'next_cursor': str|null, 'has_more': bool}：
+        limit (int): 每页数量，默认 50，最大 200
+        cursor (str): 上一页返回的 next_cursor
+        fields (str): 返回字段（逗号分隔），默认为轻量列表字段
+        q (str): 名称包含或货号前缀匹配
+        sales_status (str): 销售状态，可逗号分隔多个
+        factory_name (str): 工厂名称
+        min_price / max_price (float): 价格区间
+    """
     try:
-        # 使用ORM查询所有产品
-        products = Product.query.order_by(Product.created_at.desc()).all()
-        
-        # 将产品对象转换为字典列表
-        product_list = [product.to_dict() for product in products]
-        
-        return jsonify(product_list)
+        if not LIST_QUERY_PARAMS.intersection(request.args):
+            # 使用ORM查询所有产品
+            products = Product.query.order_by(Product.created_at.desc(), Product.id.desc()).all()
+            
+            # 拼接每行缓存的 JSON 片段（updated_at 变化时重新序列化）
+            return rows_response(products)
+
+        try:
+            fields = parse_list_fields(request.args.get('fields'))
+            limit = min(max(int(request.args.get('limit', LIST_DEFAULT_LIMIT)), 1), LIST_MAX_LIMIT)
+            filters = _list_filters(request.args)
+            if request.args.get('cursor'):
+                filters.append(_list_keyset_filter(*decode_list_cursor(request.args['cursor'])))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # 只查询需要的列；created_at、id 用于生成下一页游标
+        column_names = {'id', 'created_at'}
+        for field in fields:
+            column_names.update(('image_url', 'good_img') if field == 'thumbnail' else (field,))
+        columns = [getattr(Product, name) for name in sorted(column_names)]
+        rows = (db.session.query(*columns)
+                .filter(*filters)
+                .order_by(Product.created_at.desc(), Product.id.desc())
+                .limit(limit + 1)
+                .all())
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return jsonify({
+            'items': [_list_item(row, fields) for row in rows],
+            'next_cursor': encode_list_cursor(rows[-1].created_at, rows[-1].id) if has_more else None,
+            'has_more': has_more,
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -75,38 +221,12 @@ def add_product():
         
         # 处理尺码图片
         size_images = request.files.getlist('size_images')
-        size_img_urls = []
-        for image in size_images:
-            if image and allowed_file(image.filename):
-                filename = secure_filename(image.filename)
-                # 生成唯一文件名
-                unique_filename = f"{uuid.uuid4()}_{filename}"
-                # 创建按产品ID组织的目录
-                product_size_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'size_images', str(product_id))
-                os.makedirs(product_size_dir, exist_ok=True)
-                # 保存文件
-                image_path = os.path.join(product_size_dir, unique_filename)
-                image.save(image_path)
-                # 添加URL到列表
-                size_img_urls.append(f"/uploads/size_images/{product_id}/{unique_filename}")
-        
-        # 处理商品图片
+        size_img_urls = _save_uploaded_images(size_images, f"size_images/{product_id}")
+        
+        # 处理商品图片（按产品ID组织目录）
         good_images = request.files.getlist('good_images')
-        uploaded_img_objs = []
-        if good_images:
-            for image in good_images:
-                if image and allowed_file(image.filename):
-                    filename = secure_filename(image.filename)
-                    unique_filename = f"{uuid.uuid4()}_{filename}"
-                    # 创建按产品ID组织的目录
-                    product_good_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'good_images', str(product_id))
-                    os.makedirs(product_good_dir, exist_ok=True)
-                    image_path = os.path.join(product_good_dir, unique_filename)
-                    image.save(image_path)
-                    uploaded_img_objs.append({
-                        'url': f"/uploads/good_images/{product_id}/{unique_filename}",
-                        'tag': None
-                    })
+        uploaded_img_objs = [{'url': url, 'tag': None}
+                             for url in _save_uploaded_images(good_images, f"good_images/{product_id}")]
 
         # 解析前端传来的 good_img（带标签）
         existing_img_objs = []
@@ -126,13 +246,12 @@ def add_product():
             try:
                 # 添加到向量索引
                 product_index = current_app.config['PRODUCT_INDEX']
+                storage = get_storage('local')
+                new_image_records = []
                 if existing_img_objs or uploaded_img_objs:  # 使用第一张商品图片作为索引
                     for good_img_url in existing_img_objs + uploaded_img_objs:
-                        image_path = os.path.join(
-                            current_app.config['UPLOAD_FOLDER'],
-                            'good_images',
-                            str(product_id),
-                            os.path.basename(good_img_url['url'].split('/')[-1])
+                        image_path = storage.local_path(
+                            f"good_images/{product_id}/{os.path.basename(good_img_url['url'].split('/')[-1])}"
                         )
                         # 创建产品信息对象
                         feature = product_index.extract_feature(image_path)
@@ -143,7 +262,9 @@ def add_product():
                             original_path=image_path
                         )
                         db.session.add(product_image)
+                        new_image_records.append((product_image, feature))
                     db.session.commit()
+                    _publish_images_to_index(product_index, new_image_records)
                     current_app.logger.info(f"已将产品 {product.id} 添加到向量索引")
             except Exception as e:
                 current_app.logger.error(f"添加产品到向量索引时出错: {e}")
@@ -172,38 +293,13 @@ def update_product(product_id):
         # 处理尺码图片
         size_images = request.files.getlist('size_images')
         if size_images:
-            size_img_urls = []
-            for image in size_images:
-                if image and allowed_file(image.filename):
-                    filename = secure_filename(image.filename)
-                    # 生成唯一文件名
-                    unique_filename = f"{uuid.uuid4()}_{filename}"
-                    # 保存文件
-                    image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'size_images', unique_filename)
-                    os.makedirs(os.path.dirname(image_path), exist_ok=True)
-                    image.save(image_path)
-                    # 添加URL到列表
-                    size_img_urls.append(f"/uploads/size_images/{unique_filename}")
             # 只有在有新图片上传时才更新
-            product.size_img = json.dumps(size_img_urls)
+            product.size_img = json.dumps(_save_uploaded_images(size_images, 'size_images'))
         
-        # 处理商品图片
+        # 处理商品图片（按产品ID组织目录）
         good_images = request.files.getlist('good_images')
-        uploaded_img_objs: list = []
-        if good_images:
-            for image in good_images:
-                if image and allowed_file(image.filename):
-                    filename = secure_filename(image.filename)
-                    unique_filename = f"{uuid.uuid4()}_{filename}"
-                    # 创建按产品ID组织的目录
-                    product_good_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'good_images', str(product_id))
-                    os.makedirs(product_good_dir, exist_ok=True)
-                    image_path = os.path.join(product_good_dir, unique_filename)
-                    image.save(image_path)
-                    uploaded_img_objs.append({
-                        'url': f"/uploads/good_images/{product_id}/{unique_filename}",
-                        'tag': None
-                    })
+        uploaded_img_objs: list = [{'url': url, 'tag': None}
+                                   for url in _save_uploaded_images(good_images, f"good_images/{product_id}")]
 
         # 解析前端传来的 good_img（带标签）
         existing_img_objs = []
@@ -223,25 +319,12 @@ def update_product(product_id):
 
         db.session.commit()
 
-        # 如果配置了向量搜索且有新的商品图片
-        if current_app.config.get('PRODUCT_INDEX') and good_images:
+        # 商品图片有变化时同步向量索引
+        if current_app.config.get('PRODUCT_INDEX') and (uploaded_img_objs or existing_img_objs):
             try:
-                # 创建产品信息对象
-                product_info = ProductInfo(
-                    id=product.id,
-                    name=product.name,
-                    attributes={},
-                    price=float(product.price),
-                    description=product.description or ''
-                )
-                
-                # 更新向量索引
-                product_index = current_app.config['PRODUCT_INDEX']
-                image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'good_images', os.path.basename(uploaded_img_objs[0]['url'].split('/')[-1]))
-                product_index.add_product(product_info, image_path)
-                
-                current_app.logger.info(f"已更新产品 {product.id} 的向量索引")
+                _reindex_product_images(product)
             except Exception as e:
+                db.session.rollback()
                 current_app.logger.error(f"更新产品向量索引时出错: {e}")
 
         return jsonify({'message': '产品更新成功'})
@@ -279,6 +362,7 @@ def delete_product(product_id):
 
         db.session.delete(product)
         db.session.commit()
+        _remove_products_from_index([product.id])
         return jsonify({'message': '产品删除成功'}), 200
     except Exception as e:
         db.session.rollback()
@@ -308,6 +392,7 @@ def batch_delete_products():
         
         num_deleted = Product.query.filter(Product.id.in_(product_ids)).delete(synchronize_session=False)
         db.session.commit()
+        _remove_products_from_index(product_ids)
         
         if num_deleted > 0:
             # 可选：如果需要清理文件系统中的图片文件夹，可以在这里添加逻辑
@@ -329,111 +414,234 @@ def batch_delete_products():
         current_app.logger.error(f"批量删除产品失败: {str(e)}")
         return jsonify({'error': '批量删除产品操作失败', 'details': str(e)}), 500
 
+# 搜索结果中可直接取自商品表的卡片字段
+SEARCH_PRODUCT_COLUMNS = {
+    'id': Product.id,
+    'name': Product.name,
+    'description': Product.description,
+    'price': Product.price,
+    'sale_price': Product.sale_price,
+    'product_code': Product.product_code,
+    'sales_status': Product.sales_status,
+    'image_url': Product.image_url,
+}
+# 搜索结果中来自命中图片的字段（thumbnail 优先使用 OSS 路径）
+SEARCH_HIT_FIELDS = {'similarity', 'image_path', 'original_path', 'oss_path', 'thumbnail',
+                     'score', 'vector_score', 'keyword_score', 'crop'}
+DEFAULT_SEARCH_FIELDS = ['id', 'name', 'description', 'price', 'similarity', 'image_path', 'original_path', 'oss_path']
+SEARCH_DEFAULT_TOP_K = 10
+SEARCH_MAX_TOP_K = 100
+
+# 搜索模式：vector 为纯向量检索；hybrid 将向量相似度与 keyword 的关键词得分加权融合；
+# multi_crop 对整图和网格裁剪分别检索（适合一张图中有多件衣物的买家照片）
+SEARCH_MODES = ('vector', 'hybrid', 'multi_crop')
+HYBRID_SCORE_FIELDS = ['score', 'vector_score', 'keyword_score']
+HYBRID_VECTOR_WEIGHT = float(os.getenv('HYBRID_VECTOR_WEIGHT', 0.7))
+HYBRID_KEYWORD_WEIGHT = float(os.getenv('HYBRID_KEYWORD_WEIGHT', 0.3))
+# 关键词召回的候选商品数上限
+HYBRID_KEYWORD_CANDIDATES = 200
+# 多裁剪搜索默认网格（行x列）：默认按上装/下装/鞋包切成 3 条横带
+MULTI_CROP_DEFAULT_GRID = os.getenv('MULTI_CROP_GRID', '3x1')
+
+def get_lexical_index():
+    """获取（首次调用时创建）应用级的商品关键词索引"""
+    index = current_app.config.get('LEXICAL_INDEX')
+    if index is None:
+        index = current_app.config.setdefault('LEXICAL_INDEX', ProductLexicalIndex())
+    return index
+
+def parse_search_fields(raw_fields):
+    """解析 fields 参数（逗号分隔），返回字段列表；包含未知字段时抛出 ValueError"""
+    if not raw_fields:
+        return DEFAULT_SEARCH_FIELDS
+    fields = [f.strip() for f in raw_fields.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in SEARCH_PRODUCT_COLUMNS and f not in SEARCH_HIT_FIELDS]
+    if unknown:
+        raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+    return fields or DEFAULT_SEARCH_FIELDS
+
+def fetch_search_product_rows(product_ids, fields):
+    """按 fields 中的商品字段做一次列投影查询，返回 {product_id: row}"""
+    if not product_ids:
+        return {}
+    product_fields = [f for f in fields if f in SEARCH_PRODUCT_COLUMNS]
+    columns = [Product.id] + [SEARCH_PRODUCT_COLUMNS[f] for f in product_fields if f != 'id']
+    rows = db.session.query(*columns).filter(Product.id.in_(list(product_ids))).all()
+    return {row.id: row for row in rows}
+
+def build_search_results(hits, fields, rows_by_id=None):
+    """
+    将向量检索命中（已按相似度降序）组装为商品卡片列表
+    每个商品只保留相似度最高的命中；商品字段通过一次按列投影的查询获取（或使用已查询的 rows_by_id）
+    """
+    best_hits = {}
+    for hit in hits:
+        best_hits.setdefault(hit['product_id'], hit)
+    if not best_hits:
+        return []
+    if rows_by_id is None:
+        rows_by_id = fetch_search_product_rows(best_hits, fields)
+
+    results = []
+    for product_id, hit in best_hits.items():
+        row = rows_by_id.get(product_id)
+        if row is None:  # 商品已被删除
+            continue
+        item = {}
+        for field in fields:
+            if field in SEARCH_PRODUCT_COLUMNS:
+                item[field] = getattr(row, field)
+            elif field == 'thumbnail':
+                item[field] = hit.get('oss_path') or hit.get('image_path')
+            else:
+                item[field] = hit.get(field)
+        results.append(item)
+    return results
+
+def build_grouped_search_results(groups, fields):
+    """多裁剪搜索的分组结果：所有裁剪命中的商品只查询一次数据库"""
+    product_ids = {hit['product_id'] for group in groups for hit in group['hits']}
+    rows_by_id = fetch_search_product_rows(product_ids, fields)
+    return [
+        {'crop': group['crop'], 'box': group['box'],
+         'results': build_search_results(group['hits'], fields, rows_by_id)}
+        for group in groups
+    ]
+
+def parse_hybrid_weights(raw_vector_weight, raw_keyword_weight):
+    """解析混合搜索的权重（未提供时使用默认值，0 表示不使用该得分）；权重非法时抛出 ValueError"""
+    weights = []
+    for name, raw, default in (('vector_weight', raw_vector_weight, HYBRID_VECTOR_WEIGHT),
+                               ('keyword_weight', raw_keyword_weight, HYBRID_KEYWORD_WEIGHT)):
+        try:
+            weight = default if raw is None or raw == '' else float(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f'{name} 必须为数字')
+        if not math.isfinite(weight) or weight < 0:
+            raise ValueError(f'{name} 必须为非负数')
+        weights.append(weight)
+    if not any(weights):
+        raise ValueError('vector_weight 和 keyword_weight 不能同时为 0')
+    return tuple(weights)
+
+def parse_crop_grid(raw_grid):
+    """解析 grid 参数（如 "3x1" 表示 3 行 1 列），行列数限制在 1~4"""
+    rows, sep, cols = (raw_grid or MULTI_CROP_DEFAULT_GRID).lower().partition('x')
+    rows, cols = int(rows), int(cols or 1)
+    if not (1 <= rows <= 4 and 1 <= cols <= 4):
+        raise ValueError('grid 的行列数必须在 1~4 之间')
+    return rows, cols
+
 # 搜索产品
 @products_bp.route('/search', methods=['POST'])
 @cross_origin()
 def search_products():
+    # 统计请求总耗时及各阶段（upload_read/preprocess/embed/faiss/hydrate/serialize）耗时
+    with track_stages('search_stage_seconds'), metrics.timer('search_request_seconds'):
+        return _search_products()
+
+def _search_products():
     try:
-        print("=" * 60)
-        print("products.py: search_products() 被调用")
         # 检查是否配置了向量搜索
         if 'PRODUCT_INDEX' not in current_app.config:
-            print("ERROR: PRODUCT_INDEX 未配置")
+            current_app.logger.error("PRODUCT_INDEX 未配置")
             return jsonify({'error': '向量搜索未配置'}), 500
         product_index = current_app.config['PRODUCT_INDEX']
-        print(f"product_index.index.ntotal = {product_index.index.ntotal}")
-        print(f"len(faiss_id_to_db_id_map) = {len(product_index.faiss_id_to_db_id_map)}")
+
+        json_body = request.get_json(silent=True) or {}
+        param = lambda name: request.values.get(name) or json_body.get(name)
+        mode = param('mode') or 'vector'
+        keyword = (param('keyword') or '').strip()
+        try:
+            if mode not in SEARCH_MODES:
+                raise ValueError(f"不支持的搜索模式: {mode}")
+            fields = parse_search_fields(param('fields'))
+            top_k = param('top_k')
+            top_k = SEARCH_DEFAULT_TOP_K if top_k in (None, '') else int(top_k)
+            if not 1 <= top_k <= SEARCH_MAX_TOP_K:
+                raise ValueError(f'top_k 必须在 1~{SEARCH_MAX_TOP_K} 之间')
+            if mode == 'hybrid':
+                if not keyword:
+                    raise ValueError('混合搜索需要提供 keyword')
+                vector_weight, keyword_weight = parse_hybrid_weights(param('vector_weight'), param('keyword_weight'))
+                if not param('fields'):
+                    fields = DEFAULT_SEARCH_FIELDS + HYBRID_SCORE_FIELDS
+            elif mode == 'multi_crop':
+                crop_rows, crop_cols = parse_crop_grid(param('grid'))
+                overlap = float(param('overlap') or 0.15)
+                if not 0 <= overlap <= 0.5:
+                    raise ValueError('overlap 必须在 0~0.5 之间')
+                # group=crop 按裁剪分组返回；group=fused 合并为一个列表
+                group = param('group') or 'crop'
+                if group not in ('crop', 'fused'):
+                    raise ValueError(f"不支持的 group: {group}")
+                if group == 'fused' and not param('fields'):
+                    fields = DEFAULT_SEARCH_FIELDS + ['crop']
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        def run_search(extract_feature):
+            """按搜索模式执行检索；extract_feature 返回查询向量（图片或文本）"""
+            if mode == 'hybrid':
+                with stage_timer('keyword'):
+                    keyword_scores = get_lexical_index().search(keyword, limit=HYBRID_KEYWORD_CANDIDATES)
+                return product_index.hybrid_search(extract_feature(), keyword_scores, top_k,
+                                                   vector_weight, keyword_weight)
+            if product_index.index.ntotal == 0:
+                return []
+            return product_index.search_by_feature(extract_feature(), top_k)
+
         # 处理图片上传
         if 'image' in request.files:
             file = request.files['image']
-            print(f"接收到图片文件: {file.filename}")
             if file and allowed_file(file.filename):
                 filename = secure_filename(file.filename)
-                filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                print(f"图片已保存到: {filepath}")
-
-                # 使用向量索引搜索相似产品
-                print("开始搜索相似产品...")
-                results = product_index.search_similar_images(filepath, top_k=10)
-                print(f"搜索结果数量: {len(results)}")
-                print("=" * 60)
-  
-                # 清理上传的文件
-                os.remove(filepath)
-                # 获取产品详细信息
-                product_ids = [result.get('product_id') for result in results]
-                products = Product.query.filter(Product.id.in_(product_ids)).all()
-                 
-                # 将产品对象转换为字典
-                product_list = []
-                # Create a dictionary for quick lookup of products by id
-                products_dict = {p.id: p for p in products}
-
-                temp_product_list = [] # 临时列表，可能包含重复的 product_id
-        
-                for result in results:
-                    product_id = result.get('product_id')
-                    product = products_dict.get(product_id)
-                    if product:
-                        product_data = {
-                            'id': product.id,
-                            'name': product.name,
-                            'description': product.description,
-                            'price': product.price, 
-                            'similarity': result.get('similarity'),
-                            'image_path': result.get('image_path'),
-                            'original_path': result.get('original_path'),
-                            'oss_path': result.get('oss_path')
-                        }
-                        temp_product_list.append(product_data)
-                
-                # 按相似度排序（确保后续去重时保留相似度最高的）
-                temp_product_list.sort(key=lambda x: x.get('similarity', 0), reverse=True)
-
-                # 去重：确保每个 product_id 只出现一次，保留相似度最高的
-                final_product_list = []
-                seen_product_ids = set()
-                for item in temp_product_list:
-                    if item['id'] not in seen_product_ids:
-                        final_product_list.append(item)
-                        seen_product_ids.add(item['id'])
-                
-                # 最终列表已经是按相似度排序的（因为原始列表已排序，且我们按顺序添加）
-                # 如果需要再次确认排序，可以取消下面这行注释，但通常不需要
-                # final_product_list.sort(key=lambda x: x.get('similarity', 0), reverse=True)
-                print(final_product_list)
-                return jsonify(final_product_list)
-        
-        # 处理文本搜索
-        elif 'query' in request.json:
-            query = request.json['query']
-            
-            # 使用向量索引搜索相关产品
-            results = product_index.search_by_text(query, top_k=10)
-            
-            # 获取产品详细信息
-            product_ids = [result.get('product_id') for result in results]
-            products = Product.query.filter(Product.id.in_(product_ids)).all()
-            
-            # 将产品对象转换为字典
-            product_list = []
-            for product in products:
-                product_dict = product.to_dict()
-                # 添加相似度分数
-                for result in results:
-                    if result.id == product.id:
-                        product_dict['similarity'] = result.similarity
-                        break
-                product_list.append(product_dict)
-            
-            # 按相似度排序
-            product_list.sort(key=lambda x: x.get('similarity', 0), reverse=True)
-            
-            return jsonify(product_list)
+                # 使用唯一文件名，避免并发请求互相覆盖查询图片
+                query_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'queries')
+                os.makedirs(query_dir, exist_ok=True)
+                filepath = os.path.join(query_dir, f"{uuid.uuid4().hex}_{filename}")
+                with stage_timer('upload_read'):
+                    file.save(filepath)
+                try:
+                    if mode == 'multi_crop':
+                        groups = product_index.search_multi_crop(filepath, top_k, crop_rows, crop_cols, overlap)
+                    else:
+                        hits = run_search(lambda: product_index.extract_feature(filepath))
+                finally:
+                    # 清理上传的文件
+                    os.remove(filepath)
+
+                if mode == 'multi_crop':
+                    with stage_timer('hydrate'):
+                        if group == 'fused':
+                            results = build_search_results(product_index.fuse_crop_results(groups, top_k), fields)
+                        else:
+                            results = build_grouped_search_results(groups, fields)
+                    with stage_timer('serialize'):
+                        return jsonify(results)
+
+                with stage_timer('hydrate'):
+                    results = build_search_results(hits, fields)
+                with stage_timer('serialize'):
+                    return jsonify(results)
         
+        # 处理文本搜索：文本与图片使用同一个多模态 embedding 空间，直接检索图片索引
+        elif 'query' in json_body or 'query' in request.values:
+            query = (param('query') or '').strip()
+            if not query:
+                return jsonify({'error': '搜索文本不能为空'}), 400
+            if mode == 'multi_crop':
+                return jsonify({'error': '多裁剪搜索需要上传图片'}), 400
+
+            hits = run_search(lambda: product_index.extract_text_feature(query))
+            with stage_timer('hydrate'):
+                results = build_search_results(hits, fields)
+            with stage_timer('serialize'):
+                return jsonify(results)
+
         return jsonify({'error': '未提供搜索参数'}), 400
     except Exception as e:
+        current_app.logger.error(f"搜索产品失败: {e}")
         return jsonify({'error': str(e)}), 500
 
 # 获取单个产品
@@ -456,58 +664,50 @@ def get_product(product_id):
 @products_bp.route('/upload_image', methods=['POST'])
 @cross_origin()
 def upload_product_image():
+    """上传商品图片到 OSS：请求体直接流式上传（大文件分片并发），不经过本地临时文件"""
     try:
-        # 检查是否有文件
-        if 'file' not in request.files:
+        request.max_content_length = MAX_UPLOAD_SIZE
+        try:
+            filename, content_type, _, reader = open_upload_stream(request, 'file', MAX_UPLOAD_SIZE)
+        except BadRequest:
             return jsonify({'error': '没有文件'}), 400
         
-        file = request.files['file']
-        
-        if file.filename == '':
+        if not filename:
             return jsonify({'error': '没有选择文件'}), 400
         
-        if file and allowed_file(file.filename):
+        if allowed_file(filename):
             # 生成安全的文件名
-            filename = secure_filename(file.filename)
+            filename = secure_filename(filename)
             
             # 生成唯一的文件名
             unique_filename = f"{uuid.uuid4().hex}_{filename}"
             
-            # 保存到临时目录
-            temp_dir = Path(current_app.config['UPLOAD_FOLDER']) / 'temp'
-            temp_dir.mkdir(exist_ok=True)
-            
-            temp_path = temp_dir / unique_filename
-            file.save(temp_path)
-            
             # 上传到OSS
             try:
-                oss_client = get_oss_client()
+                storage = get_storage('oss')
                 
                 # 设置OSS路径
                 oss_path = f"products/{unique_filename}"
                 
                 # 上传文件
-                oss_client.put_object_from_file(oss_path, str(temp_path))
-                
-                # 生成OSS URL
-                oss_url = f"https://your-bucket-name.oss-cn-region.aliyuncs.com/{oss_path}"
-                
-                # 清理临时文件
-                os.remove(temp_path)
+                result = storage.upload_stream(oss_path, reader, content_type)
                 
                 return jsonify({
                     'message': '图片上传成功',
                     'filename': unique_filename,
                     'oss_path': oss_path,
-                    'url': oss_url
+                    'url': storage.url(oss_path),
+                    'size': result.size,
+                    'sha256': result.sha256
                 })
+            except RequestEntityTooLarge:
+                raise
             except Exception as e:
-                # 清理临时文件
-                os.remove(temp_path)
                 return jsonify({'error': f'上传到OSS时出错: {str(e)}'}), 500
         
         return jsonify({'error': '不允许的文件类型'}), 400
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'文件超过 {MAX_UPLOAD_SIZE // 1024 // 1024} MB'}), 413
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -521,14 +721,14 @@ def delete_product_image(product_id, image_filename):
         
         # 从URL中提取实际的文件路径
         relative_path = image_filename.replace('uploads/', '')
-        image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], relative_path)
+        storage = get_storage('local')
         
         # 检查文件是否存在
-        if not os.path.exists(image_path):
+        if not storage.exists(relative_path):
             return jsonify({'error': '图片不存在'}), 404
             
         # 删除物理文件
-        os.remove(image_path)
+        storage.delete(relative_path)
         
         # 更新商品图片列表
         if product.good_img:
@@ -706,6 +906,7 @@ def upload_csv():
                 
                 # 处理图片文件夹中的图片
                 good_img_urls = []
+                storage = get_storage('local')
                 product_name = product_data.get('name', '') # 获取产品名称，用于匹配文件夹
                 
                 if product_name: # 确保产品名称存在
@@ -715,19 +916,11 @@ def upload_csv():
                         # 遍历特定产品图片文件夹中的文件
                         for filename in os.listdir(product_specific_images_folder):
                             if allowed_file(filename):
-                                # 生成唯一文件名
-                                unique_filename = f"{uuid.uuid4()}_{filename}"
-                                # 创建按产品ID组织的目录
-                                product_good_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'good_images', str(product_id))
-                                os.makedirs(product_good_dir, exist_ok=True)
-                                # 源文件路径
-                                image_path = os.path.join(product_specific_images_folder, filename)
-                                # 目标文件路径
-                                dest_path = os.path.join(product_good_dir, unique_filename)
-                                # 复制文件
-                                shutil.copy2(image_path, dest_path)
-                                # 添加URL到列表
-                                good_img_urls.append(f"/uploads/good_images/{product_id}/{unique_filename}")
+                                # 生成唯一文件名，按产品ID组织目录
+                                key = f"good_images/{product_id}/{uuid.uuid4()}_{filename}"
+                                # 复制文件并添加URL到列表
+                                storage.put_file(key, os.path.join(product_specific_images_folder, filename))
+                                good_img_urls.append(storage.url(key))
                     else:
                         current_app.logger.warning(f"产品 '{product_name}' 对应的图片文件夹 '{product_specific_images_folder}' 不存在或不是一个目录")
                 else:
@@ -739,7 +932,7 @@ def upload_csv():
                     product.image_url = good_img_urls[0]  # 使用第一张图片作为主图
                     db.session.commit()
                 
-                # 向量索引逻辑已移至 _add_images_to_vector_index 函数
+                # 向量索引由 /build-vector-index 的构建流水线统一处理
                 # upload_csv 函数不再直接处理向量索引的创建
                 
                 stats['success'] += 1
@@ -758,187 +951,209 @@ def upload_csv():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-# 辅助函数：将产品图片添加到向量索引
-def _add_images_to_vector_index(product_id, good_img_urls):
-    if not current_app.config.get('PRODUCT_INDEX') or not good_img_urls:
-        current_app.logger.info(f"Skipping vector indexing for product {product_id}: Product index not configured or no image URLs provided.")
+# 辅助函数：把上传的图片并发保存到本地存储 folder 目录下，返回 web 路径列表（跳过不允许的文件类型）
+def _save_uploaded_images(files, folder):
+    storage = get_storage('local')
+    items = [(f"{folder}/{uuid.uuid4()}_{secure_filename(image.filename)}", image)
+             for image in files if image and allowed_file(image.filename)]
+    return [storage.url(result.key) for result in storage.put_many(items)]
+
+# 辅助函数：将已提交的 ProductImage 记录同步到内存向量索引
+def _publish_images_to_index(product_index, image_records):
+    """image_records 为 (ProductImage, feature) 列表，需在 commit 之后调用以获得 id"""
+    if not image_records:
         return
+    product_index.add_images(
+        (image.id, image.product_id, image.image_path, image.original_path, image.oss_path, feature)
+        for image, feature in image_records
+    )
 
-    product_index = current_app.config['PRODUCT_INDEX']
-    images_to_index = []
+# 辅助函数：商品删除后从内存向量索引中移除其图片
+def _remove_products_from_index(product_ids):
+    product_index = current_app.config.get('PRODUCT_INDEX')
+    if not product_index:
+        return
     try:
-        for item in good_img_urls:
-            # item 可能是字符串或包含 url 键的字典
-            web_path = item['url'] if isinstance(item, dict) else item
-            if not isinstance(web_path, str):
-                continue
-            # 从 web_path 重建文件系统路径, 与保存文件时的方式保持一致
-            # web_path 示例: "/uploads/good_images/{product_id}/{unique_filename}"
-            filename = os.path.basename(web_path)
-            filesystem_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'good_images', str(product_id), filename)
-            
-            if not os.path.exists(filesystem_path):
-                current_app.logger.error(f"Image file not found for vector indexing: {filesystem_path} (derived from web_path: {web_path}) for product {product_id}")
-                continue
-            
-            try:
-                    feature = product_index.extract_feature(filesystem_path)
-                    product_image_record = ProductImage(
-                        product_id=product_id,
-                        image_path=web_path,  # 这是图片的 web 路径
-                        vector=feature.tobytes(),
-                        original_path=filesystem_path
-                    )
-                    images_to_index.append(product_image_record)
-            except Exception as feature_exc:
-                current_app.logger.error(f"Error extracting feature for image {filesystem_path} of product {product_id}: {feature_exc}")
-                continue # 继续处理其他图片
-
-        if images_to_index:
-            db.session.add_all(images_to_index)
-            db.session.commit()
-            current_app.logger.info(f"Successfully added {len(images_to_index)} images for product {product_id} to vector index and ProductImage table.")
-        else:
-            current_app.logger.info(f"No images were successfully processed for vector indexing for product {product_id}.")
-
+        removed = product_index.remove_products(product_ids)
+        if removed:
+            current_app.logger.info(f"已从向量索引中移除 {removed} 张图片")
     except Exception as e:
-        db.session.rollback() # 如果批量添加失败，则回滚
-        current_app.logger.error(f"Error adding images to vector index for product {product_id}: {e}")
+        current_app.logger.error(f"从向量索引中移除商品 {product_ids} 时出错: {e}")
 
-# 构建向量索引（用于图片相似度检索）
-@products_bp.route('/build-vector-index', methods=['GET'])
-@cross_origin() # 确保跨域支持
-def build_vector_index():
-    def event_stream_generator():
-        try:
-            # 初始化向量索引 (这部分逻辑可以保留在生成器外部或开始处，确保索引对象已准备好)
-            if 'PRODUCT_INDEX' not in current_app.config:
-                from product_search import VectorProductIndex
-                product_index = VectorProductIndex()
-                current_app.config['PRODUCT_INDEX'] = product_index
-            # else: product_index = current_app.config['PRODUCT_INDEX'] # 已在外部作用域定义
-            existing_product_id_tuples = db.session.query(ProductImage.product_id.distinct()).all()
-            existing_product_ids = {pid[0] for pid in existing_product_id_tuples} # 从元组中提取ID并放入集合
-            
-            products_to_process = Product.query.filter(
-                and_(
-                    Product.id.notin_(existing_product_ids),
-                    Product.good_img.isnot(None),
-                    Product.good_img != ''
-                )
-            ).all()
-            
-            total_count = len(products_to_process)
-            yield f"data: {json.dumps({'type': 'total', 'value': total_count})}\n\n"
+# 辅助函数：商品编辑后按当前 good_img 同步该商品的图片记录和内存向量索引
+def _reindex_product_images(product):
+    """
+    已不在 good_img 中的图片记录删除并从内存索引移除；新增的图片与构建一样交给 IndexBuildPipeline，
+    并发提取特征后批量写入 product_images 并追加到内存索引。返回 (移除的图片数, 新增的图片数)
+    """
+    product_index = current_app.config['PRODUCT_INDEX']
+    good_img = parse_list_field(product.good_img)
+    wanted = {item['url'] if isinstance(item, dict) else item for item in good_img}
+    indexed = db.session.query(ProductImage.id, ProductImage.image_path).filter(
+        ProductImage.product_id == product.id).all()
 
-            if total_count == 0:
-                yield f"data: {json.dumps({'type': 'complete', 'message': '所有产品的图片都已建立向量索引', 'products_processed': 0, 'errors': []})}\n\n"
+    stale_ids = [image_id for image_id, image_path in indexed if image_path not in wanted]
+    if stale_ids:
+        ProductImage.query.filter(ProductImage.id.in_(stale_ids)).delete(synchronize_session=False)
+        db.session.commit()
+        product_index.remove_images(stale_ids)
+
+    indexed_paths = {image_path for _, image_path in indexed}
+    new_images = [image for image in _resolve_index_images(product.id, good_img) if image[0] not in indexed_paths]
+    images_indexed = 0
+    if new_images:
+        pipeline = IndexBuildPipeline(
+            product_index,
+            BuildCheckpoint(None),
+            max_workers=min(INDEX_BUILD_WORKERS, len(new_images)),
+            batch_size=INDEX_BUILD_BATCH_SIZE,
+            rate_limiter=RateLimiter(EMBEDDING_RATE_LIMIT, burst=INDEX_BUILD_WORKERS),
+        )
+        for event in pipeline.run([(product.id, new_images)], 1):
+            if event['type'] == 'complete':
+                images_indexed = event['images_indexed']
+                for error in event['errors']:
+                    current_app.logger.error(error)
+    if stale_ids or new_images:
+        current_app.logger.info(f"已更新产品 {product.id} 的向量索引：移除 {len(stale_ids)} 张，新增 {images_indexed} 张")
+    return len(stale_ids), images_indexed
+
+# 辅助函数：解析商品图片 URL 对应的本地文件，返回 [(web 路径, 文件系统路径), ...]
+def _resolve_index_images(product_id, good_img_urls):
+    images = []
+    for item in good_img_urls:
+        # item 可能是字符串或包含 url 键的字典
+        web_path = item['url'] if isinstance(item, dict) else item
+        if not isinstance(web_path, str):
+            continue
+        # 从 web_path 重建文件系统路径, 与保存文件时的方式保持一致
+        # web_path 示例: "/uploads/good_images/{product_id}/{unique_filename}"
+        filename = os.path.basename(web_path)
+        filesystem_path = get_storage('local').local_path(f"good_images/{product_id}/{filename}")
+        if not os.path.exists(filesystem_path):
+            current_app.logger.error(f"Image file not found for vector indexing: {filesystem_path} (derived from web_path: {web_path}) for product {product_id}")
+            continue
+        images.append((web_path, filesystem_path))
+    return images
+
+# 构建向量索引时每次从数据库读取的商品数
+INDEX_BUILD_CHUNK_SIZE = 500
+
+def _index_build_candidate_filter(resume_after):
+    """待建立向量索引的商品：id 在断点之后、有商品图片、且不存在任何 product_images 记录（NOT EXISTS 反连接）"""
+    has_images = db.session.query(ProductImage.id).filter(ProductImage.product_id == Product.id).exists()
+    return and_(
+        Product.id > resume_after,
+        Product.good_img.isnot(None),
+        Product.good_img != '',
+        ~has_images
+    )
+
+# 辅助函数：待建立向量索引的商品，按 id 升序
+def _index_build_candidates(resume_after):
+    """
+    返回 (商品总数, 候选商品生成器)
+    按主键 keyset 分块读取，每块只查询 id 和 good_img 两列，内存占用与商品总数无关
+    """
+    total = db.session.query(func.count(Product.id)).filter(_index_build_candidate_filter(resume_after)).scalar()
+
+    def iter_candidates():
+        last_id = resume_after
+        while True:
+            chunk = db.session.query(Product.id, Product.good_img).filter(
+                _index_build_candidate_filter(last_id)
+            ).order_by(Product.id).limit(INDEX_BUILD_CHUNK_SIZE).all()
+            for product_id, good_img in chunk:
+                yield product_id, _resolve_index_images(product_id, parse_list_field(good_img))
+            if len(chunk) < INDEX_BUILD_CHUNK_SIZE:
                 return
+            last_id = chunk[-1][0]
 
-            processed_count = 0
-            error_list = [] # 用于收集处理单个产品时发生的错误信息
-            
-            for product in products_to_process:
-                try:
-                    good_img_urls = parse_list_field(product.good_img)
-                    if not good_img_urls:
-                        # 如果产品没有图片URL，也算作"处理"过，但不进行索引
-                        processed_count += 1
-                        yield f"data: {json.dumps({'type': 'progress', 'processed': processed_count, 'total': total_count, 'current_product_id': product.id, 'status': 'skipped_no_images'})}\n\n"
-                        continue
-                    
-                    # 调用辅助函数进行向量索引
-                    # _add_images_to_vector_index 应该处理自己的内部错误并记录，这里我们只关心它是否成功触发
-                    _add_images_to_vector_index(product.id, good_img_urls)
-                    # 假设 _add_images_to_vector_index 成功执行（或内部处理了错误）
-                    processed_count += 1
-                    yield f"data: {json.dumps({'type': 'progress', 'processed': processed_count, 'total': total_count, 'current_product_id': product.id, 'status': 'processed'})}\n\n"
-                
-                except Exception as e:
-                    # 这个 catch 块捕获在迭代单个产品时发生的、未被 _add_images_to_vector_index 捕获的意外错误
-                    error_msg = f"处理产品 {product.id} (名称: {product.name}) 时发生意外错误: {str(e)}"
-                    current_app.logger.error(error_msg)
-                    error_list.append(error_msg)
-                    # 即使发生错误，也更新进度，表明尝试过处理该产品
-                    processed_count += 1 
-                    yield f"data: {json.dumps({'type': 'progress', 'processed': processed_count, 'total': total_count, 'current_product_id': product.id, 'status': 'error'})}\n\n"
-                    continue # 继续处理下一个产品
-            
-            final_message = f'向量索引构建完成。成功处理（或跳过） {processed_count} 个产品中的 {total_count} 个。'
-            if error_list:
-                final_message += f" 发生 {len(error_list)} 个错误。"
+    return total, iter_candidates()
 
-            yield f"data: {json.dumps({'type': 'complete', 'message': final_message, 'products_processed': processed_count, 'total_products_considered': total_count, 'errors': error_list})}\n\n"
-        
-        except Exception as e:
-            # 捕获生成器初始化或查询时发生的顶层错误
-            current_app.logger.error(f"构建向量索引流时发生严重错误: {str(e)}")
-            yield f"data: {json.dumps({'type': 'error', 'message': f'构建向量索引过程中发生严重错误: {str(e)}'})}\n\n"
+# 向量索引构建的并发与断点配置
+INDEX_BUILD_WORKERS = int(os.getenv('INDEX_BUILD_WORKERS', 4))
+INDEX_BUILD_BATCH_SIZE = int(os.getenv('INDEX_BUILD_BATCH_SIZE', 32))
+# DashScope embedding 调用速率上限（次/秒），0 表示不限速
+EMBEDDING_RATE_LIMIT = float(os.getenv('EMBEDDING_RATE_LIMIT', 5))
+# 同一进程内同时只允许一个构建任务，避免重复写入和断点互相覆盖
+_index_build_lock = threading.Lock()
 
-    return Response(stream_with_context(event_stream_generator()), mimetype='text/event-stream')
+def _index_build_checkpoint():
+    path = current_app.config.get('INDEX_BUILD_CHECKPOINT')
+    if not path and current_app.config.get('INDEX_PATH'):
+        path = os.path.join(os.path.dirname(current_app.config['INDEX_PATH']), 'build_checkpoint.json')
+    return BuildCheckpoint(path)
+
+def _vector_index_build_response():
+    """以 SSE 流式返回构建进度（total / progress / complete / error 事件）"""
+    restart = request.args.get('restart') in ('1', 'true')
 
-# 为前端SSE路径提供兼容路由
-@products_bp.route('/build-vector-index/sse', methods=['GET'])
-@cross_origin()
-def build_vector_index_sse():
     def event_stream_generator():
+        if not _index_build_lock.acquire(blocking=False):
+            yield f"data: {json.dumps({'type': 'error', 'message': '已有向量索引构建任务正在运行'})}\n\n"
+            return
         try:
+            # 初始化向量索引
             if 'PRODUCT_INDEX' not in current_app.config:
                 from product_search import VectorProductIndex
-                product_index = VectorProductIndex()
-                current_app.config['PRODUCT_INDEX'] = product_index
-            existing_product_id_tuples = db.session.query(ProductImage.product_id.distinct()).all()
-            existing_product_ids = {pid[0] for pid in existing_product_id_tuples}
-
-            products_to_process = Product.query.filter(
-                and_(
-                    Product.id.notin_(existing_product_ids),
-                    Product.good_img.isnot(None),
-                    Product.good_img != ''
-                )
-            ).all()
-
-            total_count = len(products_to_process)
-            yield f"data: {json.dumps({'type': 'total', 'value': total_count})}\n\n"
+                current_app.config['PRODUCT_INDEX'] = VectorProductIndex()
+            checkpoint = _index_build_checkpoint()
+            if restart:
+                checkpoint.clear()
+            resume_after = checkpoint.resume_after()
+            if resume_after:
+                current_app.logger.info(f"从断点继续构建向量索引: 商品 id > {resume_after}")
 
+            total_count, candidates = _index_build_candidates(resume_after)
             if total_count == 0:
+                checkpoint.clear()
+                yield f"data: {json.dumps({'type': 'total', 'value': 0})}\n\n"
                 yield f"data: {json.dumps({'type': 'complete', 'message': '所有产品的图片都已建立向量索引', 'products_processed': 0, 'errors': []})}\n\n"
                 return
 
-            processed_count = 0
-            error_list = []
-
-            for product in products_to_process:
-                try:
-                    good_img_urls = parse_list_field(product.good_img)
-                    if not good_img_urls:
-                        processed_count += 1
-                        yield f"data: {json.dumps({'type': 'progress', 'processed': processed_count, 'total': total_count, 'current_product_id': product.id, 'status': 'skipped_no_images'})}\n\n"
-                        continue
-
-                    _add_images_to_vector_index(product.id, good_img_urls)
-                    processed_count += 1
-                    yield f"data: {json.dumps({'type': 'progress', 'processed': processed_count, 'total': total_count, 'current_product_id': product.id, 'status': 'processed'})}\n\n"
-
-                except Exception as e:
-                    error_msg = f"处理产品 {product.id} (名称: {product.name}) 时发生意外错误: {str(e)}"
-                    current_app.logger.error(error_msg)
-                    error_list.append(error_msg)
-                    processed_count += 1
-                    yield f"data: {json.dumps({'type': 'progress', 'processed': processed_count, 'total': total_count, 'current_product_id': product.id, 'status': 'error'})}\n\n"
-                    continue
-
-            final_message = f'向量索引构建完成。成功处理（或跳过） {processed_count} 个产品中的 {total_count} 个。'
-            if error_list:
-                final_message += f" 发生 {len(error_list)} 个错误。"
-
-            yield f"data: {json.dumps({'type': 'complete', 'message': final_message, 'products_processed': processed_count, 'total_products_considered': total_count, 'errors': error_list})}\n\n"
+            pipeline = IndexBuildPipeline(
+                current_app.config['PRODUCT_INDEX'],
+                checkpoint,
+                max_workers=INDEX_BUILD_WORKERS,
+                max_pending_images=INDEX_BUILD_WORKERS * 8,
+                batch_size=INDEX_BUILD_BATCH_SIZE,
+                rate_limiter=RateLimiter(EMBEDDING_RATE_LIMIT, burst=INDEX_BUILD_WORKERS),
+            )
+            for event in pipeline.run(candidates, total_count):
+                yield f"data: {json.dumps(event)}\n\n"
 
         except Exception as e:
+            # 捕获查询或写入时发生的错误；已写入的批次和断点保留，下次构建从断点继续
+            db.session.rollback()
             current_app.logger.error(f"构建向量索引流时发生严重错误: {str(e)}")
             yield f"data: {json.dumps({'type': 'error', 'message': f'构建向量索引过程中发生严重错误: {str(e)}'})}\n\n"
+        finally:
+            _index_build_lock.release()
+
+    return Response(stream_with_context(_timed_stream(event_stream_generator(), 'index_rebuild_seconds')), mimetype='text/event-stream')
 
-    return Response(stream_with_context(event_stream_generator()), mimetype='text/event-stream')
+# 辅助函数：统计流式响应从开始到结束的总耗时
+def _timed_stream(generator, metric_name):
+    start = time.perf_counter()
+    try:
+        yield from generator
+    finally:
+        metrics.observe(metric_name, time.perf_counter() - start)
+
+# 构建向量索引（用于图片相似度检索）
+# 商品按 id 顺序流式读取，图片特征由线程池并发提取，批量写入数据库并同步到内存索引；
+# 中断后再次请求会从断点继续，?restart=1 忽略断点
+@products_bp.route('/build-vector-index', methods=['GET'])
+@cross_origin() # 确保跨域支持
+def build_vector_index():
+    return _vector_index_build_response()
+
+# 为前端SSE路径提供兼容路由
+@products_bp.route('/build-vector-index/sse', methods=['GET'])
+@cross_origin()
+def build_vector_index_sse():
+    return _vector_index_build_response()
 
 # 生成唯一的产品ID
 def generate_product_id(name, factory_name):
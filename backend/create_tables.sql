@@ -10,13 +10,21 @@ DROP TABLE IF EXISTS customers;
 CREATE TABLE IF NOT EXISTS customers (
     id INT AUTO_INCREMENT PRIMARY KEY,
     name VARCHAR(100) NOT NULL,
+    name_pinyin VARCHAR(255) COMMENT '姓名全拼，用于拼音前缀检索',
+    name_initials VARCHAR(100) COMMENT '姓名拼音首字母',
     wechat VARCHAR(100),
     phone VARCHAR(20) NOT NULL,
     default_address TEXT,
     address_history JSON,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    balance DECIMAL(10,2) NOT NULL DEFAULT 0 COMMENT '客户余额'
+    balance DECIMAL(10,2) NOT NULL DEFAULT 0 COMMENT '客户余额',
+
+    -- 姓名 / 拼音 / 电话前缀检索；已有数据库运行 scripts/backfill_customer_pinyin.py 添加并回填
+    INDEX idx_name (name),
+    INDEX idx_phone (phone),
+    INDEX ix_customers_name_pinyin (name_pinyin),
+    INDEX ix_customers_name_initials (name_initials)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 创建产品表
@@ -55,7 +63,11 @@ CREATE TABLE IF NOT EXISTS products (
     
     -- 时间戳
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+    -- 商品列表游标分页；已有数据库执行：
+    -- ALTER TABLE products ADD INDEX idx_products_created_at_id (created_at, id);
+    INDEX idx_products_created_at_id (created_at, id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 创建订单表
@@ -0,0 +1,19 @@
+"""
+gunicorn 配置：维护 METRICS_MULTIPROC_DIR 中各 worker 的指标快照。
+
+启动时清空上一次运行留下的快照；worker 退出前写出最后的数据，
+master 收到 worker 退出后把它的快照并入归档文件，PID 复用时计数不会重复或倒退。
+"""
+from services.metrics import metrics
+
+
+def on_starting(server):
+    metrics.reset_multiproc_dir()
+
+
+def worker_exit(server, worker):
+    metrics.flush()
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid)
@@ -1,11 +1,41 @@
+import re
 from datetime import datetime
+
+from pypinyin import Style, lazy_pinyin
+from sqlalchemy.orm import validates
+
 from . import db
 
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_pinyin(text):
+    """拼音检索键的规范化：转小写并去掉空格、撇号等非字母数字字符"""
+    return _NON_ALNUM.sub('', (text or '').lower())
+
+
+def pinyin_keys(name):
+    """返回姓名的 (全拼, 首字母)，如 张三 -> ('zhangsan', 'zs')；非汉字部分原样保留"""
+    if not name:
+        return '', ''
+    full = normalize_pinyin(''.join(lazy_pinyin(name)))
+    initials = normalize_pinyin(''.join(lazy_pinyin(name, style=Style.FIRST_LETTER)))
+    return full, initials
+
+
 class Customer(db.Model):
     __tablename__ = 'customers'
+    __table_args__ = (
+        # 姓名 / 电话前缀检索
+        db.Index('idx_name', 'name'),
+        db.Index('idx_phone', 'phone'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
+    # 姓名的全拼和首字母，写入 name 时自动生成，用于拼音前缀检索
+    name_pinyin = db.Column(db.String(255), index=True)
+    name_initials = db.Column(db.String(100), index=True)
     wechat = db.Column(db.String(100))  # 改为微信号
     phone = db.Column(db.String(20), nullable=False)
     default_address = db.Column(db.Text)  # 默认收货地址
@@ -22,6 +52,11 @@ class Customer(db.Model):
     def __repr__(self):
         return f'<Customer {self.name}>'
 
+    @validates('name')
+    def _update_pinyin_keys(self, key, name):
+        self.name_pinyin, self.name_initials = pinyin_keys(name)
+        return name
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -4,6 +4,10 @@ import json
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        # 商品列表按 (created_at, id) 倒序做游标分页
+        db.Index('idx_products_created_at_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=True)
@@ -135,7 +139,7 @@ class ProductImage(db.Model):
     __tablename__ = 'product_images'
     
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False, index=True)
     image_path = db.Column(db.String(255), nullable=False, unique=True)
     vector = db.Column(db.LargeBinary, nullable=False)  # BLOB类型用于存储向量
     original_path = db.Column(db.Text, nullable=True)  # 图片的原始文件路径
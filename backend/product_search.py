@@ -13,10 +13,22 @@ from PIL import Image
 import io
 import time
 import random
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from models import ProductImage,Product,db
+from services.single_flight import SingleFlight
+from services.image_metadata_store import ImageMetadataStore
+from services.search_cache import (
+    create_search_result_cache, create_text_embedding_cache, normalize_text_query, search_cache_key
+)
+from services.metrics import metrics, stage_timer
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # 设置DashScope API密钥
 dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
 if not dashscope.api_key:
@@ -32,6 +44,55 @@ DB_CONFIG = {
     'charset': 'utf8mb4'
 }
 
+# 多裁剪搜索时并发调用 embedding 接口的线程数
+MULTI_CROP_MAX_WORKERS = int(os.getenv('MULTI_CROP_MAX_WORKERS', 4))
+_crop_executor = ThreadPoolExecutor(max_workers=MULTI_CROP_MAX_WORKERS, thread_name_prefix='crop-embed')
+
+def encode_image_data_uri(image: Image.Image, max_size_mb: float = 2.5) -> str:
+    """
+    将 PIL 图片编码为 JPEG data URI，超过 max_size_mb 时缩小并降低质量。
+    建库（串行 / 并行导入、构建索引）与查询时提取特征都使用这一预处理，同一张图片得到相同的向量。
+    """
+    # 转换为RGB（如果需要）
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    # 先尝试以原始质量保存
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='JPEG', quality=95)
+    img_bytes = img_byte_arr.getvalue()
+
+    # 如果图片太大，进行压缩
+    max_size_bytes = int(max_size_mb * 1024 * 1024)
+    if len(img_bytes) > max_size_bytes:
+        logger.debug(f"图片大小 {len(img_bytes)/1024/1024:.2f}MB，需要压缩...")
+        # 计算需要缩小的比例
+        width, height = image.size
+        scale_factor = (max_size_bytes / len(img_bytes)) ** 0.5 * 0.9  # 0.9 作为安全系数
+        new_width = int(width * scale_factor)
+        new_height = int(height * scale_factor)
+
+        # 调整图片大小
+        image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+        # 重新保存
+        img_byte_arr = io.BytesIO()
+        quality = 85
+        while quality > 50:
+            img_byte_arr.seek(0)
+            img_byte_arr.truncate()
+            image.save(img_byte_arr, format='JPEG', quality=quality)
+            img_bytes = img_byte_arr.getvalue()
+            if len(img_bytes) <= max_size_bytes:
+                break
+            quality -= 5
+
+        logger.debug(f"压缩后大小: {len(img_bytes)/1024/1024:.2f}MB，质量: {quality}")
+
+    base64_image = base64.b64encode(img_bytes).decode('utf-8')
+    return f"data:image/jpeg;base64,{base64_image}"
+
+
 @dataclass
 class ProductInfo:
     """商品信息数据类"""
@@ -42,21 +103,69 @@ class ProductInfo:
     description: str
 
 class VectorProductIndex:
-    def __init__(self, dimension: int = 1024):  # DashScope embedding维度为1024
+    def __init__(self, dimension: int = 1024, autoload: bool = True):  # DashScope embedding维度为1024
         """
         初始化向量索引系统
         Args:
             dimension: 特征向量维度
+            autoload: 是否在初始化时从数据库加载向量；为 False 时可通过 load_rows 自行加载
         """
         self.dimension = dimension
         
         # 初始化FAISS索引
         self.index = faiss.IndexFlatL2(dimension)  # L2距离的平面索引
-        self.faiss_id_to_db_id_map = [] # 用于存储product_images.id
-        # 创建数据库表
-        self.conn = pymysql.connect(**DB_CONFIG)
+        # 与 FAISS 位置对齐的图片元数据（product_images.id、product_id 及各类路径）
+        self.metadata = ImageMetadataStore()
+        # 保护索引与元数据的一致性：增删与搜索不能交错执行
+        self._lock = threading.RLock()
+        # 当前索引内容的指纹（product_images.id 集合的无序哈希），用于生成索引版本号
+        self._fingerprint = np.uint64(0)
+        # 索引 / 元数据的变更代数：每次 load_rows 及增删都会递增，
+        # 重新加载后 id 集合不变但 oss_path、product_id 等元数据变化时版本号同样会变
+        self._generation = 0
+        # 相同内容的图片并发提取特征时只调用一次 DashScope
+        self._feature_flight = SingleFlight()
+        # 搜索结果缓存，key 中包含索引版本，索引变化后自动失效
+        self.result_cache = create_search_result_cache()
+        # 文本查询的 embedding 缓存，热门搜索词不再重复调用 DashScope
+        self.text_embedding_cache = create_text_embedding_cache()
+        # 数据库连接在首次使用时创建
+        self._conn = None
         # self._create_tables()
-        self._load_vectors()
+        if autoload:
+            self._load_vectors()
+
+    @property
+    def conn(self):
+        """延迟创建的 MySQL 连接"""
+        if self._conn is None:
+            self._conn = self._get_db_connection()
+        return self._conn
+
+    @property
+    def faiss_id_to_db_id_map(self) -> np.ndarray:
+        """FAISS 位置 -> product_images.id 的映射"""
+        return self.metadata.image_ids
+
+    @staticmethod
+    def _ids_fingerprint(image_ids) -> np.uint64:
+        """对 id 做 splitmix64 混淆后求和（按 2^64 取模），与顺序无关且可增量更新"""
+        x = np.asarray(image_ids, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            x = x + np.uint64(0x9E3779B97F4A7C15)
+            x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            x = x ^ (x >> np.uint64(31))
+            return np.uint64(x.sum(dtype=np.uint64))
+
+    @property
+    def index_version(self) -> str:
+        """
+        当前索引的版本号，由向量数量、id 集合指纹与变更代数组成
+        各 worker 启动时都只加载一次，内容相同且没有增删时版本号一致，因此可以共享跨 worker 缓存
+        """
+        with self._lock:
+            return f"{len(self.metadata)}-{int(self._fingerprint):016x}-{self._generation}"
         
     def _create_tables(self):
         with self.conn.cursor() as cursor:
@@ -83,33 +192,79 @@ class VectorProductIndex:
             self.conn.commit()
 
     def _load_vectors(self):
-        retrieved_db_ids = []
-        retrieved_vectors_list = []
+        start = time.perf_counter()
         with self.conn.cursor() as cursor:
-            # 同时选择 product_images.id 和 vector
-            cursor.execute("SELECT id, vector FROM product_images ORDER BY id")
+            # 一次性取回向量及搜索结果所需的全部元数据
+            cursor.execute(
+                "SELECT id, product_id, image_path, original_path, oss_path, vector "
+                "FROM product_images ORDER BY id"
+            )
             rows = cursor.fetchall()
+        self.load_rows(rows)
+        metrics.observe('index_load_seconds', time.perf_counter() - start)
+        print(f"成功加载 {len(self.metadata)} 个向量到索引。")
+
+    @staticmethod
+    def _vector_from_value(value) -> np.ndarray:
+        if isinstance(value, np.ndarray):
+            return value.astype(np.float32, copy=False).reshape(-1)
+        return np.frombuffer(value, dtype=np.float32)
+
+    def load_rows(self, rows):
+        """
+        用给定的行替换索引中的全部内容
+        Args:
+            rows: (id, product_id, image_path, original_path, oss_path, vector) 的序列，
+                  vector 可以是 float32 的 bytes 或 ndarray
+        """
+        rows = list(rows)
+        with self._lock:
+            # 如果 _load_vectors 可能被多次调用（例如手动刷新索引），先 reset 保证索引干净
+            if self.index.ntotal > 0:
+                self.index.reset()
             if rows:
-                for db_id, vector_blob in rows:
-                    retrieved_db_ids.append(db_id)
-                    retrieved_vectors_list.append(np.frombuffer(vector_blob, dtype=np.float32))
-                
-                vectors_array = np.vstack(retrieved_vectors_list)
-                
-                # 如果 _load_vectors 可能被多次调用（例如手动刷新索引），
-                # 或者为了确保索引是干净的，最好先 reset
-                if self.index.ntotal > 0:
-                    self.index.reset() 
-                
-                self.index.add(vectors_array)
-                self.faiss_id_to_db_id_map = retrieved_db_ids # 存储映射关系
-            else:
-                # 如果数据库中没有向量
-                if self.index.ntotal > 0:
-                    self.index.reset()
-                self.faiss_id_to_db_id_map = []
-        
-        print(f"成功加载 {len(self.faiss_id_to_db_id_map)} 个向量到索引。")
+                self.index.add(np.vstack([self._vector_from_value(row[5]) for row in rows]))
+            self.metadata.load(row[:5] for row in rows)
+            self._fingerprint = self._ids_fingerprint(self.metadata.image_ids)
+            self._generation += 1
+
+    def add_images(self, rows):
+        """
+        增量添加已写入数据库的图片到内存索引
+        Args:
+            rows: 与 load_rows 相同格式的序列
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        vectors = np.vstack([self._vector_from_value(row[5]) for row in rows])
+        with self._lock:
+            self.index.add(vectors)
+            self.metadata.append(row[:5] for row in rows)
+            with np.errstate(over='ignore'):
+                self._fingerprint += self._ids_fingerprint([row[0] for row in rows])
+            self._generation += 1
+
+    def _remove_positions(self, positions: np.ndarray) -> int:
+        if len(positions) == 0:
+            return 0
+        with self._lock:
+            with np.errstate(over='ignore'):
+                self._fingerprint -= self._ids_fingerprint(self.metadata.image_ids[positions])
+            self.index.remove_ids(faiss.IDSelectorBatch(positions.astype(np.int64)))
+            self.metadata.remove_positions(positions)
+            self._generation += 1
+        return len(positions)
+
+    def remove_images(self, image_ids) -> int:
+        """从内存索引中移除指定的 product_images.id，返回移除的数量"""
+        with self._lock:
+            return self._remove_positions(self.metadata.positions_for_image_ids(image_ids))
+
+    def remove_products(self, product_ids) -> int:
+        """从内存索引中移除指定商品的全部图片，返回移除的数量"""
+        with self._lock:
+            return self._remove_positions(self.metadata.positions_for_product_ids(product_ids))
 
     def _get_db_connection(self):
         """获取MySQL数据库连接"""
@@ -123,101 +278,118 @@ class VectorProductIndex:
             max_size_mb: 最大文件大小（MB），超过此大小会压缩
         """
         # 读取图片
-        image = Image.open(image_path)
+        return self._encode_image(Image.open(image_path), max_size_mb)
 
-        # 转换为RGB（如果需要）
-        if image.mode not in ('RGB', 'L'):
-            image = image.convert('RGB')
+    def _encode_image(self, image: Image.Image, max_size_mb: float = 2.5) -> str:
+        """将 PIL 图片编码为 JPEG data URI，超过 max_size_mb 时缩小并降低质量"""
+        return encode_image_data_uri(image, max_size_mb)
+
+    @staticmethod
+    def _file_content_hash(image_path: str) -> str:
+        """计算图片文件内容的 SHA-256，用作请求合并的 key。"""
+        digest = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
 
-        # 先尝试以原始质量保存
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='JPEG', quality=95)
-        img_bytes = img_byte_arr.getvalue()
-
-        # 如果图片太大，进行压缩
-        max_size_bytes = int(max_size_mb * 1024 * 1024)
-        if len(img_bytes) > max_size_bytes:
-            print(f"  图片大小 {len(img_bytes)/1024/1024:.2f}MB，需要压缩...")
-            # 计算需要缩小的比例
-            width, height = image.size
-            scale_factor = (max_size_bytes / len(img_bytes)) ** 0.5 * 0.9  # 0.9 作为安全系数
-            new_width = int(width * scale_factor)
-            new_height = int(height * scale_factor)
-
-            # 调整图片大小
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-            # 重新保存
-            img_byte_arr = io.BytesIO()
-            quality = 85
-            while quality > 50:
-                img_byte_arr.seek(0)
-                img_byte_arr.truncate()
-                image.save(img_byte_arr, format='JPEG', quality=quality)
-                img_bytes = img_byte_arr.getvalue()
-                if len(img_bytes) <= max_size_bytes:
-                    break
-                quality -= 5
-
-            print(f"  压缩后大小: {len(img_bytes)/1024/1024:.2f}MB，质量: {quality}")
-
-        base64_image = base64.b64encode(img_bytes).decode('utf-8')
-        return f"data:image/jpeg;base64,{base64_image}"
-    
     def extract_feature(self, image_path: str) -> np.ndarray:
-        """使用DashScope API提取图片特征向量"""
+        """
+        使用DashScope API提取图片特征向量
+        内容相同的图片若同时在多个线程中提取，只会发起一次 API 调用，其余调用方等待同一结果。
+        """
+        content_hash = self._file_content_hash(image_path)
+        return self._feature_flight.do(
+            ('image', content_hash),
+            lambda: self._extract_feature_uncached(image_path)
+        )
+
+    def _extract_feature_uncached(self, image_path: str) -> np.ndarray:
+        """实际调用DashScope API提取图片特征向量"""
         # 添加延迟以避免触发API速率限制
         # 使用随机延迟，在1-3秒之间，避免固定间隔可能导致的问题
         delay = 0.1 + random.random() * 0.5
-        print(f"API调用前等待 {delay:.2f} 秒以避免速率限制...")
+        logger.debug(f"API调用前等待 {delay:.2f} 秒以避免速率限制...")
         time.sleep(delay)
         
         # 将图片转换为base64格式
-        print(f"正在处理图片: {image_path}")
-        image_data = self._image_to_base64(image_path)
+        logger.debug(f"正在处理图片: {image_path}")
+        with stage_timer('preprocess'):
+            image_data = self._image_to_base64(image_path)
         
         # 调用DashScope API
-        inputs = [{'image': image_data}]
-        print("正在调用DashScope API...")
-        
+        with stage_timer('embed'):
+            return self._embed_inputs([{'image': image_data}], kind='image')
+
+    def extract_text_feature(self, text: str) -> np.ndarray:
+        """
+        使用与图片相同的多模态 embedding 模型提取文本特征向量，使文本可以直接在图片索引中检索
+        结果按规范化后的文本缓存；并发的相同查询只调用一次 API。
+        """
+        normalized = normalize_text_query(text)
+        if not normalized:
+            raise ValueError('搜索文本不能为空')
+        feature = self.text_embedding_cache.get(normalized)
+        if feature is not None:
+            metrics.inc('text_embedding_cache_total', result='hit')
+            return feature
+        metrics.inc('text_embedding_cache_total', result='miss')
+
+        def embed():
+            with stage_timer('embed'):
+                result = self._embed_inputs([{'text': normalized}], kind='text')
+            result.setflags(write=False)
+            self.text_embedding_cache.set(normalized, result)
+            return result
+
+        return self._feature_flight.do(('text', normalized), embed)
+
+    def _embed_inputs(self, inputs: List[Dict[str, str]], kind: str) -> np.ndarray:
+        """调用 DashScope 多模态 embedding 接口并返回归一化后的特征向量（带速率限制重试）"""
         # 添加重试机制
         max_retries = 3
         retry_delay = 5  # 初始重试延迟（秒）
         
-        for retry in range(max_retries):
-            try:
-                resp = dashscope.MultiModalEmbedding.call(
-                    model="multimodal-embedding-v1",
-                    input=inputs
-                )
-                
-                if resp.status_code != HTTPStatus.OK:
-                    if "rate limit exceeded" in resp.message.lower():
-                        if retry < max_retries - 1:  # 如果不是最后一次重试
-                            print(f"API速率限制错误，等待 {retry_delay} 秒后重试 ({retry+1}/{max_retries})...")
-                            time.sleep(retry_delay)
-                            retry_delay *= 2  # 指数退避策略
-                            continue
-                    raise Exception(f"API调用失败: {resp.message}")
-                
-                # 获取特征向量
-                print("API调用成功，正在处理返回结果...")
-                feature = np.array(resp.output['embeddings'][0]['embedding'], dtype=np.float32)
-                
-                # 归一化特征向量
-                norm = np.linalg.norm(feature)
-                print(f"原始向量范数: {norm}")
-                feature = feature / norm
-                print(f"归一化后范数: {np.linalg.norm(feature)}")
-                return feature
-                
-            except Exception as e:
-                if retry < max_retries - 1 and "rate limit exceeded" in str(e).lower():
-                    print(f"API速率限制错误，等待 {retry_delay} 秒后重试 ({retry+1}/{max_retries})...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # 指数退避策略
-                else:
-                    raise  # 如果是其他错误或已达到最大重试次数，则抛出异常
+        metrics.inc('embedding_calls_total', kind=kind)
+        metrics.inc('embedding_bytes_sent_total', sum(len(v) for item in inputs for v in item.values()), kind=kind)
+        start = time.perf_counter()
+        try:
+            for retry in range(max_retries):
+                try:
+                    resp = dashscope.MultiModalEmbedding.call(
+                        model="multimodal-embedding-v1",
+                        input=inputs
+                    )
+                    
+                    if resp.status_code != HTTPStatus.OK:
+                        if "rate limit exceeded" in resp.message.lower():
+                            if retry < max_retries - 1:  # 如果不是最后一次重试
+                                logger.warning(f"API速率限制错误，等待 {retry_delay} 秒后重试 ({retry+1}/{max_retries})...")
+                                metrics.inc('embedding_retries_total', kind=kind)
+                                time.sleep(retry_delay)
+                                retry_delay *= 2  # 指数退避策略
+                                continue
+                        raise Exception(f"API调用失败: {resp.message}")
+                    
+                    # 获取特征向量并归一化
+                    feature = np.array(resp.output['embeddings'][0]['embedding'], dtype=np.float32)
+                    norm = np.linalg.norm(feature)
+                    logger.debug(f"原始向量范数: {norm}")
+                    return feature / norm
+                    
+                except Exception as e:
+                    if retry < max_retries - 1 and "rate limit exceeded" in str(e).lower():
+                        logger.warning(f"API速率限制错误，等待 {retry_delay} 秒后重试 ({retry+1}/{max_retries})...")
+                        metrics.inc('embedding_retries_total', kind=kind)
+                        time.sleep(retry_delay)
+                        retry_delay *= 2  # 指数退避策略
+                    else:
+                        raise  # 如果是其他错误或已达到最大重试次数，则抛出异常
+        except Exception:
+            metrics.inc('embedding_errors_total', kind=kind)
+            raise
+        finally:
+            metrics.observe('embedding_call_seconds', time.perf_counter() - start, kind=kind)
     
     def add_product(self, product: ProductInfo, image_path: str):
         """
@@ -246,9 +418,6 @@ class VectorProductIndex:
                 # 提取并存储图片特征
                 feature = self.extract_feature(image_path)
                 
-                # 批量添加到FAISS索引
-                self.index.add(feature.reshape(1, -1))
-                
                 # 存储图片信息和向量ID的映射
                 original_path_value = image_path
                 cursor.execute(
@@ -261,12 +430,48 @@ class VectorProductIndex:
                     """,
                     (product.id, image_path, feature.tobytes(), original_path_value)
                 )
+                image_id = cursor.lastrowid
                 
                 self.conn.commit()
+            
+            # 写库成功后再同步到内存索引，保证 FAISS 位置与元数据一致
+            self.add_images([(image_id, product.id, image_path, original_path_value, None, feature)])
         except pymysql.Error as e:
             print(f"添加商品时发生错误: {e}")
             raise
     
+    @staticmethod
+    def _cache_fetch_k(top_k: int) -> int:
+        """将 top_k 向上取整到 2 的幂，使分页请求（top_k=10/20/30...）共用同一份缓存"""
+        fetch_k = 16
+        while fetch_k < top_k:
+            fetch_k *= 2
+        return fetch_k
+
+    def _search_hits(self, query_feature: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        """
+        在索引中检索最相似的图片，按距离升序返回命中记录
+        结果按 (查询向量, 参数, 索引版本) 缓存；返回的每条记录都是新的 dict，调用方可自由修改
+        """
+        query_feature = query_feature.reshape(1, -1).astype('float32')
+        fetch_k = self._cache_fetch_k(top_k)
+        hits = self.result_cache.get(search_cache_key(query_feature, self.index_version, fetch_k=fetch_k))
+        if hits is None:
+            hits = []
+            with self._lock:
+                # 在锁内重新读取版本号，确保写入缓存的结果与版本号对应
+                cache_key = search_cache_key(query_feature, self.index_version, fetch_k=fetch_k)
+                with stage_timer('faiss'):
+                    distances, indices = self.index.search(query_feature, fetch_k)
+                for distance, faiss_idx in zip(distances[0], indices[0]):
+                    if not 0 <= faiss_idx < len(self.metadata):
+                        continue
+                    record = self.metadata.get(int(faiss_idx))
+                    record['distance'] = float(distance)
+                    hits.append(record)
+            self.result_cache.set(cache_key, hits)
+        return [dict(hit) for hit in hits[:top_k]]
+
     def search(self, query_image_path: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """
         搜索相似商品
@@ -276,51 +481,22 @@ class VectorProductIndex:
         Returns:
             List[Dict[str, Any]]: 商品信息字典列表
         """
-        results = []
-        
         # 提取查询图片特征
-        print(f"正在提取查询图片特征: {query_image_path}")
+        logger.debug(f"正在提取查询图片特征: {query_image_path}")
         query_feature = self.extract_feature(query_image_path)
-        query_feature = query_feature.reshape(1, -1).astype('float32')
-        print(f"查询向量范数: {np.linalg.norm(query_feature)}")
-        
-        # FAISS搜索
-        print(f"开始FAISS搜索，索引中共有{self.index.ntotal}个向量")
-        distances, indices = self.index.search(query_feature, top_k)
-        print(f"搜索结果 - distances: {distances}, indices: {indices}")
         
-        # 使用ORM查询匹配的产品
-        try:
-            for i, (distance, vector_id) in enumerate(zip(distances[0], indices[0])):
-                if vector_id == -1:  # 没有找到匹配的向量
-                    continue
-                    
-                faiss_idx = int(vector_id)
-                if faiss_idx < 0 or faiss_idx >= len(self.faiss_id_to_db_id_map):
-                    continue
-
-                product_image_id = self.faiss_id_to_db_id_map[faiss_idx]
-                product_image = ProductImage.query.get(product_image_id)
-                
-                if product_image:
-                    # 获取关联的产品
-                    product = product_image.product
-                    
-                    if product:
-                        similarity_score = float(1 / (1 + distance)) # 确保转换为原生 float
-                        results.append({
-                            'product_id': product.id,
-                            'similarity': similarity_score,
-                            'image_path': product_image.image_path,
-                            'original_path': product_image.original_path,
-                            'oss_path': product_image.oss_path
-                        })
-            
-        except Exception as e:
-            print(f"搜索商品时发生错误: {e}")
-            raise
-            
-        return results
+        # FAISS搜索，直接从内存元数据组装结果，保持 FAISS 返回的顺序
+        logger.debug(f"开始FAISS搜索，索引中共有{self.index.ntotal}个向量")
+        return [
+            {
+                'product_id': hit['product_id'],
+                'similarity': float(1 / (1 + hit['distance'])),
+                'image_path': hit['image_path'],
+                'original_path': hit['original_path'],
+                'oss_path': hit['oss_path']
+            }
+            for hit in self._search_hits(query_feature, top_k)
+        ]
 
     def _distance_to_similarity(self, distance: float) -> float:
         """将距离转换为相似度得分 (0-1范围，越高越好)。"""
@@ -329,65 +505,175 @@ class VectorProductIndex:
             return 0.0
         return 1 / (1 + distance)
 
+    def _format_hit(self, hit: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'product_id': hit['product_id'],       # products.id
+            'image_path': hit['image_path'], # product_images.image_path
+            'original_path': hit['original_path'] or hit['image_path'],
+            'oss_path': hit['oss_path'],
+            'similarity': self._distance_to_similarity(hit['distance'])
+        }
+
+    def search_by_feature(self, query_feature: np.ndarray, top_k: int = 10) -> list:
+        """用已提取的特征向量检索，按相似度降序返回命中图片"""
+        if self.index.ntotal == 0:
+            return []
+        final_results = [self._format_hit(hit) for hit in self._search_hits(query_feature, top_k)]
+        # 按相似度降序排序结果
+        final_results.sort(key=lambda x: x['similarity'], reverse=True)
+        return final_results
+
     def search_similar_images(self, image_path: str, top_k: int = 10) -> list:
         if self.index.ntotal == 0:
             return []
-        query_feature = self.extract_feature(image_path)
-        query_feature = query_feature.reshape(1, -1).astype('float32')
-        distances, faiss_indices = self.index.search(query_feature, top_k)
-        
-        product_images_ids_to_fetch = []
-        # 使用字典临时存储每个 product_images.id 对应的原始距离
-        temp_distance_map = {}
-
-        for i in range(len(faiss_indices[0])):
-            faiss_idx = faiss_indices[0][i]
-            dist = float(distances[0][i])
-            if 0 <= faiss_idx < len(self.faiss_id_to_db_id_map):
-                product_image_db_id = self.faiss_id_to_db_id_map[faiss_idx] # 这是 product_images.id
-                product_images_ids_to_fetch.append(product_image_db_id)
-                temp_distance_map[product_image_db_id] = dist
-            else:
-                print(f"警告: 在 search_similar_images 中发现无效的 Faiss 索引 {faiss_idx}。")
-
-        if not product_images_ids_to_fetch:
+        return self.search_by_feature(self.extract_feature(image_path), top_k)
+
+    def search_by_text(self, query: str, top_k: int = 10) -> list:
+        """
+        以文本搜索商品图片，返回格式与 search_similar_images 相同
+        Args:
+            query: 搜索文本，如 "白色连衣裙"
+            top_k: 返回结果数量
+        """
+        if self.index.ntotal == 0:
             return []
+        return self.search_by_feature(self.extract_text_feature(query), top_k)
 
-        final_results = []
-        # 假设 self.conn 是一个活跃的 pymysql 连接
-        # 最好在 VectorProductIndex 初始化时设置好 DictCursor，或者在此处指定
-        try:
-            with self.conn.cursor(pymysql.cursors.DictCursor) as cursor:
-                # 为 IN 子句构建占位符
-                placeholders = ','.join(['%s'] * len(product_images_ids_to_fetch))
-                sql = f"SELECT id, product_id, image_path, original_path,oss_path FROM product_images WHERE id IN ({placeholders})"
-                
-                cursor.execute(sql, tuple(product_images_ids_to_fetch))
-                db_rows = cursor.fetchall()
+    @staticmethod
+    def crop_boxes(width: int, height: int, rows: int = 3, cols: int = 1,
+                   overlap: float = 0.15) -> List[Tuple[str, Tuple[int, int, int, int]]]:
+        """
+        生成整图加 rows x cols 网格的裁剪框，每个格子向四周扩展 overlap 个格子宽/高，
+        避免衣物正好落在格线上被切开。返回 [(标签, (left, top, right, bottom)), ...]
+        """
+        boxes = [('full', (0, 0, width, height))]
+        if rows * cols <= 1:
+            return boxes
+        cell_w, cell_h = width / cols, height / rows
+        for r in range(rows):
+            for c in range(cols):
+                box = (
+                    max(0, int(round((c - overlap) * cell_w))),
+                    max(0, int(round((r - overlap) * cell_h))),
+                    min(width, int(round((c + 1 + overlap) * cell_w))),
+                    min(height, int(round((r + 1 + overlap) * cell_h))),
+                )
+                boxes.append((f'r{r}c{c}', box))
+        return boxes
 
-                for row in db_rows:
-                    product_image_id = row['id'] # product_images.id
-                    distance = temp_distance_map.get(product_image_id)
-                    
-                    if distance is not None:
-                        similarity = self._distance_to_similarity(distance)
-                        final_results.append({
-                            'product_id': row['product_id'],       # products.id
-                            'image_path': row['image_path'], # product_images.image_path
-                            'original_path': row.get('original_path') or row['image_path'],
-                            'oss_path': row.get('oss_path'),
-                            'similarity': similarity
-                        })
-        except pymysql.Error as e:
-            print(f"数据库查询错误 (search_similar_images): {e}")
-            # 根据错误处理策略，可能返回空列表或重新抛出异常
+    def extract_crop_features(self, image_path: str, rows: int = 3, cols: int = 1,
+                              overlap: float = 0.15) -> Tuple[List[Tuple[str, Tuple[int, int, int, int]]], np.ndarray]:
+        """
+        对整图及各网格裁剪并发提取特征，返回 (裁剪框列表, 特征矩阵[n_crops, dimension])
+        """
+        image = Image.open(image_path)
+        image.load()
+        boxes = self.crop_boxes(image.width, image.height, rows, cols, overlap)
+        with stage_timer('preprocess'):
+            encoded = [self._encode_image(image.crop(box)) for _, box in boxes]
+
+        def embed(data: str) -> np.ndarray:
+            key = hashlib.sha256(data.encode('utf-8')).hexdigest()
+            return self._feature_flight.do(
+                ('image-data', key), lambda: self._embed_inputs([{'image': data}], kind='image')
+            )
+
+        with stage_timer('embed'):
+            features = list(_crop_executor.map(embed, encoded))
+        return boxes, np.vstack(features).astype('float32')
+
+    def search_multi_crop(self, image_path: str, top_k: int = 10, rows: int = 3, cols: int = 1,
+                          overlap: float = 0.15) -> List[Dict[str, Any]]:
+        """
+        多裁剪搜索：整图与各裁剪区域的特征在一次批量 FAISS 检索中完成
+        Returns:
+            [{'crop': 标签, 'box': [left, top, right, bottom], 'hits': [命中图片...]}, ...]，
+            hits 的格式与 search_similar_images 相同
+        """
+        if self.index.ntotal == 0:
             return []
-        
-        # 按相似度降序排序结果
-        final_results.sort(key=lambda x: x['similarity'], reverse=True)
-        
-        return final_results
-    
+        boxes, features = self.extract_crop_features(image_path, rows, cols, overlap)
+        groups = []
+        with self._lock:
+            with stage_timer('faiss'):
+                distances, indices = self.index.search(features, min(top_k, self.index.ntotal))
+            for (label, box), row_distances, row_indices in zip(boxes, distances, indices):
+                hits = []
+                for distance, faiss_idx in zip(row_distances, row_indices):
+                    if not 0 <= faiss_idx < len(self.metadata):
+                        continue
+                    record = self.metadata.get(int(faiss_idx))
+                    record['distance'] = float(distance)
+                    hits.append(self._format_hit(record))
+                groups.append({'crop': label, 'box': list(box), 'hits': hits})
+        return groups
+
+    @staticmethod
+    def fuse_crop_results(groups: List[Dict[str, Any]], top_k: int = 10) -> List[Dict[str, Any]]:
+        """合并各裁剪的结果：每个商品取各裁剪中相似度最高的命中，并记录来源裁剪"""
+        best = {}
+        for group in groups:
+            for hit in group['hits']:
+                current = best.get(hit['product_id'])
+                if current is None or hit['similarity'] > current['similarity']:
+                    best[hit['product_id']] = dict(hit, crop=group['crop'])
+        fused = sorted(best.values(), key=lambda x: x['similarity'], reverse=True)
+        return fused[:top_k]
+
+    def best_hits_for_products(self, query_feature: np.ndarray, product_ids) -> Dict[int, Dict[str, Any]]:
+        """
+        精确计算查询向量与指定商品全部图片的距离（从索引中取回向量，不做全量检索），
+        返回 {product_id: 距离最近的图片命中}，用于给只由关键词召回的商品补充向量得分
+        """
+        query_feature = np.asarray(query_feature, dtype=np.float32).reshape(-1)
+        with self._lock:
+            positions = self.metadata.positions_for_product_ids(product_ids)
+            if not len(positions):
+                return {}
+            vectors = self.index.reconstruct_batch(positions)
+            distances = ((vectors - query_feature) ** 2).sum(axis=1)
+            best = {}
+            for position, distance in zip(positions, distances):
+                product_id = int(self.metadata.product_ids[position])
+                if product_id not in best or distance < best[product_id][1]:
+                    best[product_id] = (int(position), float(distance))
+            records = {}
+            for product_id, (position, distance) in best.items():
+                record = self.metadata.get(position)
+                record['distance'] = distance
+                records[product_id] = self._format_hit(record)
+        return records
+
+    def hybrid_search(self, query_feature: np.ndarray, keyword_scores: Dict[int, float], top_k: int = 10,
+                      vector_weight: float = 0.7, keyword_weight: float = 0.3) -> list:
+        """
+        向量相似度与关键词得分加权融合
+        只执行一次 FAISS 检索召回向量候选；关键词召回但不在向量候选中的商品，
+        通过 best_hits_for_products 精确补算向量得分。返回按 score 降序、每个商品一条的命中
+        Args:
+            query_feature: 查询图片（或文本）的特征向量
+            keyword_scores: {product_id: 关键词得分(0~1)}
+        """
+        candidates = {}
+        for hit in self.search_by_feature(query_feature, max(top_k * 4, 50)):
+            candidates.setdefault(hit['product_id'], hit)
+        missing = [pid for pid in keyword_scores if pid not in candidates]
+        if missing and self.index.ntotal:
+            candidates.update(self.best_hits_for_products(query_feature, missing))
+
+        results = []
+        for product_id in set(candidates) | set(keyword_scores):
+            hit = dict(candidates.get(product_id) or {
+                'product_id': product_id, 'image_path': None, 'original_path': None,
+                'oss_path': None, 'similarity': 0.0
+            })
+            hit['vector_score'] = hit['similarity']
+            hit['keyword_score'] = keyword_scores.get(product_id, 0.0)
+            hit['score'] = vector_weight * hit['vector_score'] + keyword_weight * hit['keyword_score']
+            results.append(hit)
+        results.sort(key=lambda x: (-x['score'], x['product_id']))
+        return results[:top_k]
+
     def save_index(self, index_path: str):
         """保存FAISS索引到文件"""
         faiss.write_index(self.index, index_path)
@@ -401,5 +687,5 @@ class VectorProductIndex:
         self._load_vectors()
 
     def __del__(self):
-        if hasattr(self, 'conn'):
-            self.conn.close()
+        if getattr(self, '_conn', None) is not None:
+            self._conn.close()
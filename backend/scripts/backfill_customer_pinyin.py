@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+迁移脚本：为 customers 表添加 name_pinyin / name_initials 列及索引，并回填已有客户的拼音检索键。
+
+- 列或索引不存在时自动创建（已存在则跳过，可重复运行）；
+- 按 id keyset 分块读取 (id, name, updated_at)，每块一次 executemany UPDATE 并单独提交；
+- 回填时保留原 updated_at；
+- 默认只处理拼音键为空的客户，--force 时全部重新计算。
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+from typing import Dict
+
+# 添加父目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import inspect, text, update
+
+from app import create_app
+from models import db, Customer
+from models.customer import pinyin_keys
+
+PINYIN_COLUMNS = {
+    'name_pinyin': 'VARCHAR(255)',
+    'name_initials': 'VARCHAR(100)',
+}
+
+
+def ensure_schema() -> Dict[str, int]:
+    """补齐拼音列和 customers 表上模型声明的索引，返回新建的列数和索引数"""
+    inspector = inspect(db.engine)
+    columns = {column['name'] for column in inspector.get_columns(Customer.__tablename__)}
+    indexes = {index['name'] for index in inspector.get_indexes(Customer.__tablename__)}
+    created = {'columns': 0, 'indexes': 0}
+    with db.engine.begin() as conn:
+        for name, ddl_type in PINYIN_COLUMNS.items():
+            if name not in columns:
+                conn.execute(text(f'ALTER TABLE {Customer.__tablename__} ADD COLUMN {name} {ddl_type}'))
+                created['columns'] += 1
+        for index in Customer.__table__.indexes:
+            if index.name not in indexes:
+                index.create(conn)
+                created['indexes'] += 1
+    return created
+
+
+def backfill(chunk_size: int = 1000, force: bool = False) -> Dict[str, int]:
+    """按 id 升序分块回填拼音键，返回统计信息"""
+    stats = {'scanned': 0, 'updated': 0}
+    last_id = 0
+    while True:
+        query = db.session.query(Customer.id, Customer.name, Customer.name_pinyin, Customer.name_initials,
+                                 Customer.updated_at).filter(Customer.id > last_id)
+        if not force:
+            query = query.filter(db.or_(Customer.name_pinyin.is_(None), Customer.name_initials.is_(None)))
+        rows = query.order_by(Customer.id).limit(chunk_size).all()
+        if not rows:
+            break
+        changes = []
+        for customer_id, name, current_pinyin, current_initials, updated_at in rows:
+            full, initials = pinyin_keys(name)
+            if (full, initials) != (current_pinyin, current_initials):
+                changes.append({'id': customer_id, 'name_pinyin': full, 'name_initials': initials,
+                                'updated_at': updated_at})
+        if changes:
+            db.session.execute(update(Customer), changes)
+        db.session.commit()
+        stats['scanned'] += len(rows)
+        stats['updated'] += len(changes)
+        last_id = rows[-1][0]
+        logging.info(f"已处理至 id={last_id}: 扫描 {stats['scanned']}, 更新 {stats['updated']}")
+    return stats
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="添加并回填 customers 表的拼音检索列")
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=1000,
+        help='每块（每个事务）处理的客户数，默认 1000'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='重新计算所有客户的拼音键，包括已有值的客户'
+    )
+    return parser
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] [%(levelname)s] %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    args = create_parser().parse_args()
+
+    app = create_app(load_index=False)
+    with app.app_context():
+        created = ensure_schema()
+        logging.info(f"新建列 {created['columns']} 个, 索引 {created['indexes']} 个")
+        stats = backfill(args.chunk_size, args.force)
+        logging.info(f"回填完成: 扫描 {stats['scanned']}, 更新 {stats['updated']}")
+
+
+if __name__ == '__main__':
+    main()
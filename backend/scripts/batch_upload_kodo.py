@@ -2,22 +2,40 @@
 """
 遍历指定目录下的子文件夹，批量将文件上传到七牛云 Kodo，并打印每个成功上传对象的访问路径。
 默认读取 `backend/.env` 中的 AccessKey、SecretKey、BUCKET_NAME 配置。
+
+上传使用线程池并发执行（--workers），并在本地清单（SQLite）中记录每个对象的 (key, 大小, mtime, 哈希, 状态)：
+- 清单中已上传（或远端已存在相同对象）且大小、mtime 未变的文件直接跳过，不读取文件也不访问网络；
+- 其余文件计算七牛 etag 后批量 stat 远端对象，哈希一致的跳过上传；
+- 上传失败按指数退避重试，仍失败的记录在清单中，重新运行时只处理未完成的文件；
+- 上传与 stat 都经过存储层的 KodoStorage（连接池复用，大文件按 STORAGE_PART_SIZE_MB 分片并发上传）。
 """
 from __future__ import annotations
 
 import argparse
 import json
 import os
+import random
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
+import requests
 from dotenv import load_dotenv
 
 try:
-    from qiniu import Auth, put_file
+    from qiniu import Auth, Region, etag
 except ImportError as exc:  # pragma: no cover
     raise SystemExit("未找到 qiniu SDK，请先运行 'pip install qiniu'。") from exc
 
+# 添加 backend 目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.storage import KodoStorage
+
 # 常见图片/视频扩展名，可通过命令行覆盖
 DEFAULT_EXTENSIONS = {
     ".jpg",
@@ -75,6 +93,211 @@ def format_remote_url(key: str, domain: Optional[str]) -> str:
     return key
 
 
+@dataclass
+class UploadTask:
+    path: Path
+    key: str
+    size: int
+    mtime_ns: int
+    hash: Optional[str] = None
+
+
+class UploadManifest:
+    """本地上传清单，记录每个对象最近一次处理的结果，用于断点续传和跳过未变化的文件。path 为空时只保存在内存中。"""
+
+    def __init__(self, path: Optional[Path] = None):
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path) if path is not None else ":memory:")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS uploads (
+                bucket TEXT NOT NULL,
+                key TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hash TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (bucket, key)
+            )
+            """
+        )
+
+    def is_uploaded(self, bucket: str, task: UploadTask) -> bool:
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, status FROM uploads WHERE bucket = ? AND key = ?", (bucket, task.key)
+        ).fetchone()
+        # 之前上传成功或远端已有相同对象，且本地文件未变化时，无需再次计算哈希和查询远端
+        return row is not None and row[:2] == (task.size, task.mtime_ns) and row[2] in ("uploaded", "exists")
+
+    def record(self, bucket: str, task: UploadTask, status: str, attempts: int = 0, error: Optional[str] = None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO uploads (bucket, key, path, size, mtime_ns, hash, status, attempts, error, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (bucket, task.key, str(task.path), task.size, task.mtime_ns, task.hash, status, attempts, error, time.time()),
+        )
+
+    def status_counts(self, bucket: str) -> Dict[str, int]:
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM uploads WHERE bucket = ? GROUP BY status", (bucket,))
+        return dict(rows.fetchall())
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class KodoUploader:
+    """
+    并发上传器。run() 按输入顺序分块处理任务，逐个产出 (任务, 状态)，状态为：
+        cached    清单中已上传或远端已存在，且文件未变化
+        exists    远端已存在哈希一致的对象
+        uploaded  本次上传成功
+        failed    重试后仍失败
+    清单只在调用线程中读写。
+    """
+
+    # 七牛 batch 接口单次最多 1000 个操作
+    STAT_BATCH_SIZE = 1000
+    # 网络错误、5xx 以及 573（请求频率过高）退避后重试
+    RETRYABLE_STATUS = {573}
+
+    def __init__(
+        self,
+        auth: Auth,
+        bucket: str,
+        manifest: UploadManifest,
+        workers: int = 8,
+        retries: int = 3,
+        backoff: float = 1.0,
+        expires: int = 3600,
+        regions: Optional[List[Region]] = None,
+    ):
+        self.auth = auth
+        self.bucket = bucket
+        self.manifest = manifest
+        self.workers = max(1, workers)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.regions = regions
+        # 上传和批量 stat 都经过存储层，上传连接池与并发线程数一致
+        self.storage = KodoStorage(auth, bucket, regions=regions, pool_size=self.workers)
+        self.storage.uploader.expires = expires
+
+    @staticmethod
+    def _hash(task: UploadTask) -> UploadTask:
+        task.hash = etag(str(task.path))
+        return task
+
+    def remote_hashes(self, keys: List[str]) -> Dict[str, str]:
+        """批量查询远端对象的哈希，不存在的对象不出现在结果中"""
+        hashes: Dict[str, str] = {}
+        for start in range(0, len(keys), self.STAT_BATCH_SIZE):
+            chunk = keys[start:start + self.STAT_BATCH_SIZE]
+            try:
+                stats = self.storage.stat_many(chunk)
+            except IOError as exc:
+                # 查询失败时按远端不存在处理，由上传覆盖
+                print(exc)
+                continue
+            hashes.update((key, stat["hash"]) for key, stat in stats.items() if stat.get("hash"))
+        return hashes
+
+    def _upload(self, task: UploadTask) -> Tuple[bool, int, Optional[str]]:
+        """上传单个文件，可重试的错误按指数退避（含随机抖动）重试，返回 (是否成功, 尝试次数, 错误信息)"""
+        error = None
+        for attempt in range(1, self.retries + 2):
+            try:
+                result = self.storage.put_file(task.key, str(task.path))
+            except requests.HTTPError as exc:
+                status = exc.response.status_code
+                error = f"状态码 {status}: {exc.response.text[:200]}"
+                retryable = status >= 500 or status in self.RETRYABLE_STATUS
+            except (requests.RequestException, OSError) as exc:  # 网络异常等
+                error, retryable = str(exc), True
+            else:
+                if result.etag in (None, task.hash):
+                    return True, attempt, None
+                error = f"上传后哈希不一致: 本地 {task.hash}, 远端 {result.etag}"
+                retryable = True
+            if not retryable or attempt > self.retries:
+                break
+            time.sleep(self.backoff * (2 ** (attempt - 1)) * (1 + random.random() * 0.5))
+        return False, attempt, error
+
+    def run(self, tasks: Iterable[UploadTask], chunk_size: int = STAT_BATCH_SIZE) -> Iterator[Tuple[UploadTask, str]]:
+        pending: List[UploadTask] = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="kodo-upload") as pool:
+            for task in tasks:
+                if self.manifest.is_uploaded(self.bucket, task):
+                    yield task, "cached"
+                    continue
+                pending.append(task)
+                if len(pending) >= chunk_size:
+                    yield from self._run_chunk(pool, pending)
+                    pending = []
+            if pending:
+                yield from self._run_chunk(pool, pending)
+
+    def _run_chunk(self, pool: ThreadPoolExecutor, tasks: List[UploadTask]) -> Iterator[Tuple[UploadTask, str]]:
+        tasks = list(pool.map(self._hash, tasks))
+        remote = self.remote_hashes([task.key for task in tasks])
+        to_upload = []
+        for task in tasks:
+            if remote.get(task.key) == task.hash:
+                self.manifest.record(self.bucket, task, "exists")
+                yield task, "exists"
+            else:
+                to_upload.append(task)
+        self.manifest.commit()
+
+        futures = {pool.submit(self._upload, task): task for task in to_upload}
+        for future, task in futures.items():
+            ok, attempts, error = future.result()
+            status = "uploaded" if ok else "failed"
+            self.manifest.record(self.bucket, task, status, attempts, error)
+            self.manifest.commit()
+            if not ok:
+                print(f"上传失败: {task.path} ({error})")
+            yield task, status
+
+
+class ProgressReporter:
+    """定期打印处理进度和上传吞吐量"""
+
+    def __init__(self, total: int, interval: float = 5.0):
+        self.total = total
+        self.interval = interval
+        self.counts: Dict[str, int] = {}
+        self.bytes_uploaded = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def update(self, task: UploadTask, status: str):
+        self.counts[status] = self.counts.get(status, 0) + 1
+        if status == "uploaded":
+            self.bytes_uploaded += task.size
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        done = sum(self.counts.values())
+        print(
+            f"[{done}/{self.total}] 已上传 {self.counts.get('uploaded', 0)}, "
+            f"跳过 {self.counts.get('cached', 0) + self.counts.get('exists', 0)}, "
+            f"失败 {self.counts.get('failed', 0)}, "
+            f"{self.bytes_uploaded / elapsed / 1024 / 1024:.2f} MB/s"
+        )
+
+
 def upload_files(
     root: Path,
     auth: Auth,
@@ -84,34 +307,48 @@ def upload_files(
     expires: int,
     extensions: Optional[Iterable[str]],
     dry_run: bool,
+    manifest: Optional[UploadManifest] = None,
+    workers: int = 8,
+    retries: int = 3,
+    regions: Optional[List[Region]] = None,
+    report_interval: float = 5.0,
 ) -> Dict[str, List[str]]:
-    """上传 root 下的文件，返回 {子目录: [远程路径]}。"""
+    """上传 root 下的文件，返回 {子目录: [远程路径]}（包含本次跳过的已存在对象）。"""
     uploads: Dict[str, List[str]] = {}
-    for file_path in iter_local_files(root, extensions):
-        folder_key = file_path.parent.relative_to(root).as_posix() or "."
-        remote_key = build_remote_key(file_path, root, prefix)
-        remote_url = format_remote_url(remote_key, domain)
+    files = list(iter_local_files(root, extensions))
 
-        if dry_run:
+    if dry_run:
+        for file_path in files:
+            folder_key = file_path.parent.relative_to(root).as_posix() or "."
+            remote_url = format_remote_url(build_remote_key(file_path, root, prefix), domain)
             print(f"[DRY-RUN] {file_path} -> {remote_url}")
             uploads.setdefault(folder_key, []).append(remote_url)
-            continue
-
-        token = auth.upload_token(bucket, remote_key, expires)
-        ret, info = put_file(token, remote_key, str(file_path))
-        if info.status_code != 200:
-            print(f"上传失败: {file_path}")
-            print(f"  状态码: {info.status_code}")
-            if ret:
-                print(f"  响应: {ret}")
-            if getattr(info, "error", None):
-                print(f"  错误: {info.error}")
-            if getattr(info, "exception", None):
-                print(f"  异常: {info.exception}")
-            continue
-
-        print(f"上传成功: {file_path} -> {remote_url}")
-        uploads.setdefault(folder_key, []).append(remote_url)
+        return uploads
+
+    def tasks() -> Iterator[UploadTask]:
+        for file_path in files:
+            stat = file_path.stat()
+            yield UploadTask(file_path, build_remote_key(file_path, root, prefix), stat.st_size, stat.st_mtime_ns)
+
+    owns_manifest = manifest is None
+    if manifest is None:
+        manifest = UploadManifest()
+    uploader = KodoUploader(auth, bucket, manifest, workers=workers, retries=retries, expires=expires,
+                            regions=regions)
+    progress = ProgressReporter(len(files), report_interval)
+    try:
+        for task, status in uploader.run(tasks()):
+            progress.update(task, status)
+            if status == "failed":
+                continue
+            if status == "uploaded":
+                print(f"上传成功: {task.path} -> {format_remote_url(task.key, domain)}")
+            folder_key = task.path.parent.relative_to(root).as_posix() or "."
+            uploads.setdefault(folder_key, []).append(format_remote_url(task.key, domain))
+    finally:
+        progress.report()
+        if owns_manifest:
+            manifest.close()
     return uploads
 
 
@@ -157,6 +394,30 @@ def create_parser() -> argparse.ArgumentParser:
         type=str,
         help="覆盖 .env 中的 KODO_CDN_DOMAIN，显式指定访问域名",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="并发上传线程数，默认 8",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="单个文件上传失败后的重试次数（指数退避），默认 3",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        default=Path(__file__).resolve().parents[1] / "data" / "kodo_upload_manifest.sqlite",
+        help="本地上传清单路径，重新运行时跳过已上传且未变化的文件，默认 backend/data/kodo_upload_manifest.sqlite",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=5,
+        help="打印上传进度的间隔秒数，默认 5",
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -180,26 +441,37 @@ def main() -> None:
 
     load_credentials(args.env.expanduser().resolve())
 
-    access_key = os.getenv("AccessKey")
-    secret_key = os.getenv("SecretKey")
-    bucket_name = os.getenv("BUCKET_NAME")
-    if not access_key or not secret_key or not bucket_name:
-        raise SystemExit("缺少七牛云凭证，请确认 .env 中包含 AccessKey、SecretKey、BUCKET_NAME。")
+    # 凭证、域名以及私有云或测试环境的 KODO_UP_HOST / KODO_RS_HOST 由存储层统一读取
+    try:
+        storage = KodoStorage.from_env(domain=args.domain)
+    except ValueError as exc:
+        raise SystemExit(str(exc)) from exc
+    bucket_name = storage.bucket_name
 
-    domain = args.domain or os.getenv("KODO_CDN_DOMAIN")
     extensions = parse_extensions(args.extensions) or (DEFAULT_EXTENSIONS if args.extensions is None else None)
 
-    auth = Auth(access_key, secret_key)
-    uploads = upload_files(
-        root=root,
-        auth=auth,
-        bucket=bucket_name,
-        domain=domain,
-        prefix=args.prefix,
-        expires=args.expires,
-        extensions=extensions,
-        dry_run=args.dry_run,
-    )
+    manifest = UploadManifest(args.manifest.expanduser().resolve())
+    try:
+        uploads = upload_files(
+            root=root,
+            auth=storage.auth,
+            bucket=bucket_name,
+            domain=storage.domain,
+            prefix=args.prefix,
+            expires=args.expires,
+            extensions=extensions,
+            dry_run=args.dry_run,
+            manifest=manifest,
+            workers=args.workers,
+            retries=args.retries,
+            regions=storage.regions,
+            report_interval=args.report_interval,
+        )
+        counts = manifest.status_counts(bucket_name)
+    finally:
+        manifest.close()
+    if counts.get("failed"):
+        print(f"有 {counts['failed']} 个文件上传失败，重新运行即可只重试未完成的文件。")
 
     print("\n上传结果:")
     print(json.dumps(uploads, ensure_ascii=False, indent=2))
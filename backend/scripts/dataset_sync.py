@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+数据集增量同步：只导入新增/修改的图片并处理删除，代价与变化量成正比而不是与数据集大小成正比。
+
+本地清单（SQLite）记录每个图片文件的 (路径, 大小, mtime, 内容哈希, 商品ID, 图片ID)
+以及每个目录的 mtime 和子目录列表：
+- 轮询模式下，目录 mtime 未变化说明其中的文件条目没有增删，跳过该目录的文件 stat，只继续检查子目录；
+- 安装 inotify_simple 时可使用 --watch 监听文件系统事件，原地修改的文件也能被发现；
+- 删除的文件与新增文件内容哈希相同时视为移动/重命名，只更新路径，不重新提取特征。
+
+首次运行时清单为空，会根据 product_images.original_path 初始化（一次性），避免重复导入已有图片。
+
+同步结果只写入数据库和传入的 product_index（脚本进程内的索引），正在运行的后端进程不会收到通知，
+需要重启后端（或在后端进程内调用 refresh_from_database）后新图片才能被搜索到、删除的图片才会消失。
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from models import db, Product, ProductImage
+from scripts.ingest_dataset import ALLOWED_EXTENSIONS, product_fields
+from services.rate_limiter import RateLimiter
+
+try:
+    import inotify_simple
+except ImportError:  # 可选依赖，未安装时使用轮询
+    inotify_simple = None
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class FileEntry:
+    path: str
+    size: int
+    mtime_ns: int
+    sha256: Optional[str] = None
+    product_id: Optional[int] = None
+    image_id: Optional[int] = None
+
+
+@dataclass
+class ChangeSet:
+    added: List[FileEntry] = field(default_factory=list)
+    modified: List[FileEntry] = field(default_factory=list)
+    deleted: List[FileEntry] = field(default_factory=list)
+    # 目录扫描结果：变更成功写入数据库之后才更新到清单，中断后下次会重新检查这些目录
+    dirs: Dict[str, tuple] = field(default_factory=dict)
+    removed_dirs: List[str] = field(default_factory=list)
+    dirs_listed: int = 0
+    dirs_pruned: int = 0
+
+
+class DatasetManifest:
+    """基于 SQLite 的本地清单。"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT,
+                product_id INTEGER,
+                image_id INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_files_dir ON files (dir);
+            CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files (sha256);
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                subdirs TEXT NOT NULL
+            );
+        ''')
+
+    def is_empty(self) -> bool:
+        return self.conn.execute('SELECT 1 FROM files LIMIT 1').fetchone() is None
+
+    def get_dir(self, path: str) -> Optional[tuple]:
+        row = self.conn.execute('SELECT mtime_ns, subdirs FROM dirs WHERE path = ?', (path,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def all_dirs(self) -> List[str]:
+        return [row[0] for row in self.conn.execute('SELECT path FROM dirs')]
+
+    def files_in_dir(self, directory: str) -> Dict[str, FileEntry]:
+        rows = self.conn.execute(
+            'SELECT path, size, mtime_ns, sha256, product_id, image_id FROM files WHERE dir = ?', (directory,)
+        )
+        return {row[0]: FileEntry(*row) for row in rows}
+
+    def files_under(self, directory: str) -> List[FileEntry]:
+        prefix = directory.rstrip(os.sep) + os.sep
+        rows = self.conn.execute(
+            'SELECT path, size, mtime_ns, sha256, product_id, image_id FROM files WHERE substr(path, 1, ?) = ?',
+            (len(prefix), prefix)
+        )
+        return [FileEntry(*row) for row in rows]
+
+    def upsert_files(self, entries: Iterable[FileEntry]):
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO files (path, dir, size, mtime_ns, sha256, product_id, image_id) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(e.path, os.path.dirname(e.path), e.size, e.mtime_ns, e.sha256, e.product_id, e.image_id)
+             for e in entries]
+        )
+
+    def delete_files(self, paths: Iterable[str]):
+        self.conn.executemany('DELETE FROM files WHERE path = ?', [(p,) for p in paths])
+
+    def save_dirs(self, dirs: Dict[str, tuple], removed: Iterable[str]):
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO dirs (path, mtime_ns, subdirs) VALUES (?, ?, ?)',
+            [(path, mtime_ns, json.dumps(subdirs, ensure_ascii=False)) for path, (mtime_ns, subdirs) in dirs.items()]
+        )
+        for directory in removed:
+            prefix = directory.rstrip(os.sep) + os.sep
+            self.conn.execute('DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?',
+                              (directory, len(prefix), prefix))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def scan_changes(root: str, manifest: DatasetManifest, force_dirs: Set[str] = frozenset(),
+                 full: bool = False) -> ChangeSet:
+    """
+    对比文件系统与清单，返回变更集合。
+    目录 mtime 与清单一致且不在 force_dirs 中时跳过文件列表（full=True 时不剪枝）。
+    """
+    changes = ChangeSet()
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            changes.deleted.extend(manifest.files_under(directory))
+            changes.removed_dirs.append(directory)
+            continue
+        cached = manifest.get_dir(directory)
+        if cached and cached[0] == mtime_ns and directory not in force_dirs and not full:
+            changes.dirs_pruned += 1
+            stack.extend(reversed(cached[1]))
+            continue
+
+        changes.dirs_listed += 1
+        known = manifest.files_in_dir(directory)
+        subdirectories = []
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+                continue
+            if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in ALLOWED_EXTENSIONS:
+                continue
+            stat = entry.stat()
+            previous = known.pop(entry.path, None)
+            if previous is None:
+                changes.added.append(FileEntry(entry.path, stat.st_size, stat.st_mtime_ns))
+            elif (previous.size, previous.mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                changes.modified.append(FileEntry(entry.path, stat.st_size, stat.st_mtime_ns, previous.sha256,
+                                                  previous.product_id, previous.image_id))
+        changes.deleted.extend(known.values())
+        for removed in set(cached[1] if cached else []) - set(subdirectories):
+            changes.deleted.extend(manifest.files_under(removed))
+            changes.removed_dirs.append(removed)
+        changes.dirs[directory] = (mtime_ns, subdirectories)
+        stack.extend(reversed(subdirectories))
+    return changes
+
+
+class DatasetSync:
+    """
+    将变更集合同步到商品库。导入的商品与图片一一对应：
+    新增图片创建商品和图片记录；修改的图片重新提取特征；删除的图片连同商品一起删除。
+    """
+
+    def __init__(self, dataset_root: Path, manifest: DatasetManifest, product_index, workers: int = 4,
+                 rate_limit: float = 5, batch_size: int = 50):
+        self.dataset_root = Path(dataset_root)
+        self.root = str(self.dataset_root)
+        self.manifest = manifest
+        self.product_index = product_index
+        self.workers = max(workers, 1)
+        self.rate_limiter = RateLimiter(rate_limit, burst=self.workers)
+        self.batch_size = batch_size
+
+    def bootstrap(self):
+        """清单为空时，根据数据库中已导入图片的 original_path 初始化清单（不计算哈希）。"""
+        prefix = self.root.rstrip(os.sep) + os.sep
+        rows = db.session.query(ProductImage.id, ProductImage.product_id, ProductImage.original_path).filter(
+            ProductImage.original_path.like(f'{prefix}%')
+        ).yield_per(1000)
+        entries = []
+        for image_id, product_id, original_path in rows:
+            try:
+                stat = os.stat(original_path)
+            except OSError:
+                # 数据库中有记录但文件已不存在：记录为未知大小，下次扫描该目录时作为删除处理
+                entries.append(FileEntry(original_path, -1, -1, None, product_id, image_id))
+                continue
+            entries.append(FileEntry(original_path, stat.st_size, stat.st_mtime_ns, None, product_id, image_id))
+        self.manifest.upsert_files(entries)
+        self.manifest.commit()
+        logging.info('已根据数据库初始化清单: %d 个文件', len(entries))
+
+    def _embed(self, path: str):
+        self.rate_limiter.acquire()
+        return self.product_index.extract_feature(path)
+
+    def _embed_all(self, entries: List[FileEntry]) -> Dict[str, object]:
+        """并发提取特征，返回 {路径: 特征}；失败的图片记录日志后跳过"""
+        features = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {entry.path: pool.submit(self._embed, entry.path) for entry in entries}
+            for path, future in futures.items():
+                try:
+                    features[path] = future.result()
+                except Exception as exc:
+                    logging.error('提取图片 "%s" 特征失败: %s', path, exc)
+        return features
+
+    def _paths(self, path: str):
+        relative_path = Path(path).relative_to(self.dataset_root).as_posix()
+        return relative_path, f"/dataset-images/{relative_path}"
+
+    def apply(self, changes: ChangeSet) -> Dict[str, int]:
+        """写入数据库后再更新清单；提取特征失败的文件不写入清单，所在目录也不更新 mtime，下次同步会重试"""
+        stats = Counter()
+        failed: Set[str] = set()
+
+        # 内容哈希未变的修改（如仅 touch）只更新清单中的 stat
+        touched, modified, new_files = [], [], []
+        for entry in changes.modified + changes.added:
+            previous_hash = entry.sha256
+            try:
+                entry.sha256 = file_sha256(entry.path)
+            except OSError as exc:  # 扫描之后文件被删除或正在写入
+                logging.warning('读取 "%s" 失败，下次同步重试: %s', entry.path, exc)
+                failed.add(entry.path)
+                continue
+            if entry.image_id is None:
+                new_files.append(entry)
+            else:
+                (touched if previous_hash == entry.sha256 else modified).append(entry)
+        stats['unchanged'] = len(touched)
+
+        # 删除的文件与新增文件内容相同时视为移动/重命名，沿用原商品和向量
+        deleted_by_hash = {e.sha256: e for e in changes.deleted if e.sha256 and e.image_id}
+        added, moved = [], []
+        for entry in new_files:
+            source = deleted_by_hash.pop(entry.sha256, None)
+            if source is None:
+                added.append(entry)
+                continue
+            entry.product_id, entry.image_id = source.product_id, source.image_id
+            moved.append((source, entry))
+        moved_sources = {source.path for source, _ in moved}
+        deleted = [e for e in changes.deleted if e.path not in moved_sources]
+
+        for _, entry in moved:
+            relative_path, web_path = self._paths(entry.path)
+            ProductImage.query.filter_by(id=entry.image_id).update(
+                {'image_path': web_path, 'original_path': entry.path}, synchronize_session=False)
+            Product.query.filter_by(id=entry.product_id).update(
+                product_fields(relative_path, web_path, entry.path), synchronize_session=False)
+        stats['moved'] = len(moved)
+
+        product_ids = [e.product_id for e in deleted if e.product_id]
+        for start in range(0, len(product_ids), 500):
+            chunk = product_ids[start:start + 500]
+            ProductImage.query.filter(ProductImage.product_id.in_(chunk)).delete(synchronize_session=False)
+            Product.query.filter(Product.id.in_(chunk)).delete(synchronize_session=False)
+        stats['deleted'] = len(product_ids)
+
+        features = self._embed_all(modified + added)
+        failed.update(e.path for e in modified + added if e.path not in features)
+        stats['failed'] = len(failed)
+
+        for entry in modified:
+            if entry.path in features:
+                ProductImage.query.filter_by(id=entry.image_id).update(
+                    {'vector': features[entry.path].tobytes()}, synchronize_session=False)
+                stats['modified'] += 1
+
+        created = [e for e in added if e.path in features]
+        for start in range(0, len(created), self.batch_size):
+            batch = []
+            for entry in created[start:start + self.batch_size]:
+                relative_path, web_path = self._paths(entry.path)
+                product = Product(**product_fields(relative_path, web_path, entry.path))
+                product.images.append(ProductImage(image_path=web_path, original_path=entry.path,
+                                                   vector=features[entry.path].tobytes()))
+                db.session.add(product)
+                batch.append((entry, product))
+            db.session.flush()
+            for entry, product in batch:
+                entry.product_id, entry.image_id = product.id, product.images[0].id
+        stats['added'] = len(created)
+        db.session.commit()
+
+        self.manifest.delete_files([e.path for e in changes.deleted])
+        self.manifest.upsert_files([e for e in touched + modified + created if e.path not in failed]
+                                   + [entry for _, entry in moved])
+        failed_dirs = {os.path.dirname(path) for path in failed}
+        self.manifest.save_dirs({d: v for d, v in changes.dirs.items() if d not in failed_dirs},
+                                changes.removed_dirs)
+        self.manifest.commit()
+        return dict(stats)
+
+    def sync_once(self, force_dirs: Set[str] = frozenset(), full: bool = False) -> Dict[str, int]:
+        if self.manifest.is_empty():
+            self.bootstrap()
+        started = time.monotonic()
+        changes = scan_changes(self.root, self.manifest, force_dirs, full)
+        stats = self.apply(changes)
+        logging.info('同步完成 (%.1fs): 列出目录 %d, 跳过目录 %d, 变更 %s',
+                     time.monotonic() - started, changes.dirs_listed, changes.dirs_pruned, stats)
+        if any(stats.get(key) for key in ('added', 'modified', 'moved', 'deleted')):
+            logging.info('数据库已更新；运行中的后端需重启后向量索引才会包含这些变更')
+        return stats
+
+    def watch(self, interval: float = 30, debounce: float = 2.0):
+        """持续同步：有 inotify_simple 时监听事件，否则每 interval 秒轮询一次"""
+        self.sync_once()
+        if inotify_simple is None:
+            logging.info('未安装 inotify_simple，使用轮询模式（间隔 %.0f 秒）', interval)
+            while True:
+                time.sleep(interval)
+                self.sync_once()
+
+        flags = inotify_simple.flags
+        mask = (flags.CREATE | flags.DELETE | flags.CLOSE_WRITE | flags.MOVED_FROM | flags.MOVED_TO
+                | flags.DELETE_SELF | flags.ATTRIB)
+        inotify = inotify_simple.INotify()
+        watches = {}
+
+        def add_watches():
+            for directory in self.manifest.all_dirs():
+                if directory not in watches.values():
+                    try:
+                        watches[inotify.add_watch(directory, mask)] = directory
+                    except OSError:
+                        pass
+
+        add_watches()
+        logging.info('使用 inotify 监听 %d 个目录', len(watches))
+        while True:
+            events = inotify.read(timeout=int(interval * 1000))
+            if not events:
+                continue
+            # 等待一小段时间合并同一批拷贝产生的事件
+            time.sleep(debounce)
+            events += inotify.read(timeout=0)
+            dirty = {watches[e.wd] for e in events if e.wd in watches}
+            self.sync_once(force_dirs=dirty)
+            add_watches()
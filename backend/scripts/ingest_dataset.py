@@ -1,27 +1,121 @@
 #!/usr/bin/env python3
 """
 批量导入本地数据集图片并构建向量索引。
+
+默认逐张串行处理；指定 --workers N（N > 1）时使用并行流水线：
+    目录流式遍历 -> 进程池解码/编码 -> 线程池并发提取特征（限速）-> 预分配 id 批量写入
+并定期输出各阶段吞吐量（张/秒）。
+
+指定 --incremental 或 --watch 时改用本地清单做增量同步（见 scripts/dataset_sync.py），
+只处理新增/修改/删除的文件，不再加载全部已导入路径或全量重扫。
+增量同步只写数据库，不会通知正在运行的后端：各 worker 内存中的向量索引要等重启
+（或调用 VectorProductIndex.refresh_from_database）后才包含新增/删除的图片。
 """
 import argparse
 import json
 import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Iterable, Set
+from typing import Dict, Iterator, List, Set, Tuple
 
-from sqlalchemy import func
+from PIL import Image
+from sqlalchemy import func, insert
 
 from app import create_app
 from models import db, Product, ProductImage
-from product_search import VectorProductIndex
+from product_search import VectorProductIndex, encode_image_data_uri
+from services.rate_limiter import RateLimiter
 
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
 
 
-def iter_image_files(root: Path) -> Iterable[Path]:
-    """递归遍历目录，返回所有符合扩展名的图片文件。"""
-    for path in sorted(root.rglob('*')):
-        if path.is_file() and path.suffix.lower() in ALLOWED_EXTENSIONS:
-            yield path
+def iter_image_files(root: Path) -> Iterator[Path]:
+    """
+    使用 os.scandir 流式遍历目录，返回所有符合扩展名的图片文件。
+    每个目录内按名称排序，遍历过程中不需要先列出整个目录树。
+    """
+    stack = [str(root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as exc:
+            logging.warning('无法读取目录 %s: %s', directory, exc)
+            continue
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in ALLOWED_EXTENSIONS:
+                yield Path(entry.path)
+        stack.extend(reversed(subdirectories))
+
+
+def product_fields(relative_path: str, web_path: str, original_path: str) -> Dict:
+    """由数据集中的图片生成对应商品的字段。"""
+    return {
+        'name': relative_path[-200:],
+        'description': f'自动导入: {relative_path}',
+        'price': 0.0,
+        'sale_price': None,
+        'product_code': None,
+        'image_url': web_path,
+        'image_path': web_path,
+        'good_img': json.dumps(
+            [{'url': web_path, 'tag': None, 'original_path': original_path}],
+            ensure_ascii=False
+        ),
+    }
+
+
+def prepare_image(path: str, max_side: int = 0) -> str:
+    """
+    在子进程中解码图片并编码为 JPEG data URI。
+    默认与 VectorProductIndex.extract_feature（串行导入、查询时）使用同一预处理，同一张图片得到相同的向量；
+    max_side > 0 时先把长边缩放到 max_side（JPEG 通过 draft 在解码阶段降采样），
+    解码更快、请求更小，但向量与按原图提取的查询向量存在差异，会降低召回。
+    """
+    with Image.open(path) as image:
+        if max_side:
+            image.draft('RGB', (max_side, max_side))
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        return encode_image_data_uri(image)
+
+
+class StageMeter:
+    """统计各阶段完成数量与吞吐量（张/秒，按流水线启动以来的时间计算）。"""
+
+    STAGES = ('walk', 'decode', 'embed', 'write')
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.counts = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, count: int = 1, error: bool = False):
+        with self._lock:
+            (self.errors if error else self.counts)[stage] += count
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        with self._lock:
+            parts = []
+            for stage in self.STAGES:
+                part = f"{stage} {self.counts[stage]} 张 ({self.counts[stage] / elapsed:.1f} 张/秒)"
+                if self.errors[stage]:
+                    part += f" 失败 {self.errors[stage]}"
+                parts.append(part)
+        return f"[{elapsed:.0f}s] " + ' | '.join(parts)
 
 
 def load_existing_paths() -> Set[str]:
@@ -55,7 +149,61 @@ def create_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         '--start-id',
         type=int,
-        help='自定义起始产品ID，默认基于当前最大ID顺延。'
+        help='并行模式下自定义起始产品ID（必须大于当前最大ID），默认基于当前最大ID顺延。'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='并发提取特征的线程数；大于 1 时启用并行流水线，默认 1（串行）。'
+    )
+    parser.add_argument(
+        '--decode-workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='并行模式下解码/编码图片的进程数，默认 CPU 核数。'
+    )
+    parser.add_argument(
+        '--max-side',
+        type=int,
+        default=0,
+        help='并行模式下发送给向量服务前将图片长边缩放到的像素数。默认 0 不缩放，与串行导入和查询时的预处理一致；'
+             '设置后解码更快，但入库向量与查询向量不一致，会降低召回。'
+    )
+    parser.add_argument(
+        '--rate-limit',
+        type=float,
+        default=float(os.getenv('EMBEDDING_RATE_LIMIT', 5)),
+        help='并行模式下向量服务调用速率上限（次/秒），0 表示不限速，默认读取 EMBEDDING_RATE_LIMIT 或 5。'
+    )
+    parser.add_argument(
+        '--report-interval',
+        type=float,
+        default=10,
+        help='并行模式下输出各阶段吞吐量的间隔秒数，默认 10。'
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='基于本地清单增量同步：导入新增/修改的图片并删除已移除图片对应的商品。'
+             '只写数据库，运行中的后端需重启后才能搜索到变更。'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='持续增量同步：安装 inotify_simple 时监听文件事件，否则按 --interval 轮询。'
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=30,
+        help='--watch 轮询间隔秒数，默认 30。'
+    )
+    parser.add_argument(
+        '--manifest',
+        type=Path,
+        default=Path(__file__).resolve().parent.parent / 'data' / 'dataset_manifest.sqlite',
+        help='增量同步使用的本地清单文件，默认 backend/data/dataset_manifest.sqlite。'
     )
     parser.add_argument(
         '--dry-run',
@@ -75,13 +223,30 @@ def main():
     parser = create_parser()
     args = parser.parse_args()
 
-    app = create_app()
+    incremental = args.incremental or args.watch
+    # 增量同步只需要提取特征，不在启动时从数据库全量加载向量
+    app = create_app(os.getenv('FLASK_CONFIG', 'development'), load_index=not incremental)
     with app.app_context():
         dataset_root = Path(args.root or app.config.get('DATASET_ROOT', '')).expanduser().resolve()
         if not dataset_root.exists():
             raise SystemExit(f'数据集目录不存在: {dataset_root}')
         logging.info('使用数据集目录: %s', dataset_root)
 
+        if incremental:
+            from scripts.dataset_sync import DatasetManifest, DatasetSync
+
+            manifest = DatasetManifest(str(args.manifest))
+            sync = DatasetSync(dataset_root, manifest, VectorProductIndex(autoload=False),
+                               workers=args.workers, rate_limit=args.rate_limit, batch_size=args.batch_size)
+            try:
+                if args.watch:
+                    sync.watch(interval=args.interval)
+                else:
+                    sync.sync_once()
+            finally:
+                manifest.close()
+            return
+
         product_index = app.config.get('PRODUCT_INDEX')
         if product_index is None:
             product_index = VectorProductIndex()
@@ -92,6 +257,12 @@ def main():
             existing_paths = load_existing_paths()
             logging.info('已加载 %d 条已处理图片路径，将跳过重复项。', len(existing_paths))
 
+        if args.workers > 1 and not args.dry_run:
+            ParallelIngestor(args, dataset_root, product_index, existing_paths).run()
+            index_path = app.config['INDEX_PATH']
+            product_index.save_index(index_path)
+            logging.info('向量索引已保存到 %s', index_path)
+            return
 
         processed = 0
         created = 0
@@ -112,28 +283,13 @@ def main():
             web_path = f"/dataset-images/{relative_path}"
 
             if args.dry_run:
-                logging.info('[DRY-RUN] 将导入图片: %s -> 产品ID %d', original_path)
+                logging.info('[DRY-RUN] 将导入图片: %s', original_path)
                 existing_paths.add(original_path)
                 created += 1
                 continue
 
             try:
-                product_name = relative_path[-200:]
-                product_description = f'自动导入: {relative_path}'
-
-                product = Product(
-                    name=product_name,
-                    description=product_description,
-                    price=0.0,
-                    sale_price=None,
-                    product_code=None,
-                    image_url=web_path,
-                    image_path=web_path,
-                    good_img=json.dumps(
-                        [{'url': web_path, 'tag': None, 'original_path': original_path}],
-                        ensure_ascii=False
-                    )
-                )
+                product = Product(**product_fields(relative_path, web_path, original_path))
                 db.session.add(product)
                 db.session.flush()  # 生成 product.id
 
@@ -168,5 +324,152 @@ def main():
         logging.info('处理完成: 新增 %d, 跳过 %d, 错误 %d, 总计遍历 %d', created, skipped, errors, processed)
 
 
+class ParallelIngestor:
+    """
+    并行导入流水线：
+        生产线程流式遍历目录并跳过已导入的图片
+        -> 进程池解码 / 编码（prepare_image，默认与 extract_feature 预处理一致）
+        -> 线程池在限速器控制下调用向量服务
+        -> 主线程按批次以预分配的 id 批量插入商品与图片记录（executemany），并追加到内存索引
+    已提交但未写入的图片数受 max_inflight 限制，内存占用与数据集大小无关。
+    写入使用预分配 id，导入期间不要有其他进程同时创建商品。
+    """
+
+    def __init__(self, args, dataset_root: Path, product_index: VectorProductIndex, existing_paths: Set[str]):
+        self.args = args
+        self.dataset_root = dataset_root
+        self.product_index = product_index
+        self.existing_paths = existing_paths
+        self.batch_size = max(args.batch_size, 1)
+        self.max_inflight = max(args.workers * 4, self.batch_size * 2)
+        self.meter = StageMeter()
+        self.results: 'queue.Queue' = queue.Queue()
+        self.slots = threading.BoundedSemaphore(self.max_inflight)
+        self.rate_limiter = RateLimiter(args.rate_limit, burst=args.workers)
+        self.submitted = 0
+        self.skipped = 0
+        self.producer_done = False
+
+        max_product_id = db.session.query(func.max(Product.id)).scalar() or 0
+        if args.start_id is not None and args.start_id <= max_product_id:
+            raise SystemExit(f'--start-id 必须大于当前最大产品ID {max_product_id}')
+        self.next_product_id = args.start_id or max_product_id + 1
+        self.next_image_id = (db.session.query(func.max(ProductImage.id)).scalar() or 0) + 1
+
+    # ---- 解码 / 特征提取阶段（在线程池回调中执行） ----
+
+    def _embed(self, data: str):
+        self.rate_limiter.acquire()
+        return self.product_index._embed_inputs([{'image': data}], kind='image')
+
+    def _on_decoded(self, file_path: Path, future):
+        try:
+            data = future.result()
+        except Exception as exc:
+            self.meter.add('decode', error=True)
+            self.results.put((file_path, exc))
+            return
+        self.meter.add('decode')
+        self.embed_pool.submit(self._embed, data).add_done_callback(partial(self._on_embedded, file_path))
+
+    def _on_embedded(self, file_path: Path, future):
+        exc = future.exception()
+        self.meter.add('embed', error=exc is not None)
+        self.results.put((file_path, exc if exc is not None else future.result()))
+
+    def _produce(self):
+        walked = 0
+        try:
+            for file_path in iter_image_files(self.dataset_root):
+                if self.args.limit and walked >= self.args.limit:
+                    break
+                walked += 1
+                self.meter.add('walk')
+                if not self.args.reprocess and str(file_path.resolve()) in self.existing_paths:
+                    self.skipped += 1
+                    continue
+                self.slots.acquire()
+                future = self.decode_pool.submit(prepare_image, str(file_path), self.args.max_side)
+                future.add_done_callback(partial(self._on_decoded, file_path))
+                self.submitted += 1
+        except Exception as exc:
+            logging.exception('遍历数据集目录时出错: %s', exc)
+        finally:
+            self.producer_done = True
+            self.results.put(None)
+
+    # ---- 写入阶段（主线程，持有应用上下文） ----
+
+    def _write_batch(self, batch: List[Tuple[Path, object]]) -> int:
+        product_rows, image_rows, index_rows = [], [], []
+        for file_path, feature in batch:
+            original_path = str(file_path.resolve())
+            relative_path = file_path.relative_to(self.dataset_root).as_posix()
+            web_path = f"/dataset-images/{relative_path}"
+            product_id, image_id = self.next_product_id, self.next_image_id
+            self.next_product_id += 1
+            self.next_image_id += 1
+            product_rows.append({'id': product_id, **product_fields(relative_path, web_path, original_path)})
+            image_rows.append({'id': image_id, 'product_id': product_id, 'image_path': web_path,
+                               'original_path': original_path, 'vector': feature.tobytes()})
+            index_rows.append((image_id, product_id, web_path, original_path, None, feature))
+        try:
+            db.session.execute(insert(Product), product_rows)
+            db.session.execute(insert(ProductImage), image_rows)
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+            self.meter.add('write', len(batch), error=True)
+            logging.exception('批量写入 %d 张图片失败: %s', len(batch), exc)
+            return 0
+        self.product_index.add_images(index_rows)
+        self.existing_paths.update(row['original_path'] for row in image_rows)
+        self.meter.add('write', len(batch))
+        return len(batch)
+
+    def run(self):
+        logging.info('并行导入: 解码进程 %d, 特征线程 %d, 批大小 %d, 限速 %.1f 次/秒, 起始产品ID %d',
+                     self.args.decode_workers, self.args.workers, self.batch_size,
+                     self.args.rate_limit, self.next_product_id)
+        self.decode_pool = ProcessPoolExecutor(max_workers=max(self.args.decode_workers, 1))
+        self.embed_pool = ThreadPoolExecutor(max_workers=self.args.workers, thread_name_prefix='embed')
+        producer = threading.Thread(target=self._produce, name='dataset-walker', daemon=True)
+        producer.start()
+
+        consumed = 0
+        created = 0
+        errors = 0
+        batch: List[Tuple[Path, object]] = []
+        last_report = time.monotonic()
+        try:
+            while not (self.producer_done and consumed == self.submitted):
+                item = self.results.get()
+                if item is not None:
+                    self.slots.release()
+                    consumed += 1
+                    file_path, value = item
+                    if isinstance(value, Exception):
+                        errors += 1
+                        logging.error('处理图片 "%s" 时出错: %s', file_path, value)
+                    else:
+                        batch.append((file_path, value))
+                    if len(batch) >= self.batch_size:
+                        created += self._write_batch(batch)
+                        batch = []
+                if time.monotonic() - last_report >= self.args.report_interval:
+                    logging.info(self.meter.summary())
+                    last_report = time.monotonic()
+            if batch:
+                created += self._write_batch(batch)
+        finally:
+            self.embed_pool.shutdown(wait=True, cancel_futures=True)
+            self.decode_pool.shutdown(wait=True, cancel_futures=True)
+
+        errors += self.meter.errors['write']
+        logging.info(self.meter.summary())
+        logging.info('处理完成: 新增 %d, 跳过 %d, 错误 %d', created, self.skipped, errors)
+        return created
+
+
 if __name__ == '__main__':
     main()
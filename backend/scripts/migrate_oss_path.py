@@ -1,18 +1,27 @@
 #!/usr/bin/env python3
 """
 迁移脚本：将 product_images 表中的 original_path 转换为 OSS 路径并更新到 oss_path 字段
+
+默认逐条通过 ORM 更新；指定 --bulk 时使用批量模式：
+    按 id keyset 分块读取 (id, original_path, oss_path) -> 预编译正则计算新路径
+    -> 每块一次 executemany UPDATE 并单独提交，同时记录断点（--checkpoint），中断后可从断点继续。
+--dry-run 时输出新旧路径的 diff，不修改数据库。
 """
 import argparse
 import logging
 import re
 import sys
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
 
 # 添加父目录到 Python 路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from sqlalchemy import update
+
 from app import create_app
 from models import db, ProductImage
+from services.index_build import BuildCheckpoint
 
 # OSS 基础 URL
 OSS_BASE_URL = "http://t4u5e1e4j.hd-bkt.clouddn.com"
@@ -22,6 +31,9 @@ OSS_BASE_URL = "http://t4u5e1e4j.hd-bkt.clouddn.com"
 # 提取: 2025.4.18海报照片/加拍照片/DSC01390.jpg
 DATASET_BASE_PATH = "/Users/richardzhang/github/xiangyipackage/image-search-engine/backend/data/摄像师拍摄素材"
 
+# 批量模式：贪婪匹配到最后一个 "摄像师拍摄素材/" 之后的部分，与 extract_relative_path 的前两种情况一致
+RELATIVE_PATH_PATTERN = re.compile(r'^.*摄像师拍摄素材/(.+)$', re.DOTALL)
+
 
 def extract_relative_path(original_path: str) -> str:
     """
@@ -85,6 +97,87 @@ def generate_oss_path(original_path: str) -> str:
     return oss_url
 
 
+def compute_oss_paths(rows: List[Tuple[int, str, Optional[str]]]) -> List[Tuple[int, Optional[str], str]]:
+    """
+    批量计算新路径，返回需要更新的 (id, 旧 oss_path, 新 oss_path)；新旧相同或无法生成的记录不返回。
+    路径不含 "摄像师拍摄素材/" 的少数记录回退到 extract_relative_path，保证结果与逐条模式一致。
+    """
+    match = RELATIVE_PATH_PATTERN.match
+    prefix = OSS_BASE_URL + '/'
+    changes = []
+    for image_id, original_path, current in rows:
+        matched = match(original_path)
+        relative_path = matched.group(1) if matched else extract_relative_path(original_path)
+        if not relative_path:
+            continue
+        oss_path = prefix + relative_path
+        if oss_path != current:
+            changes.append((image_id, current, oss_path))
+    return changes
+
+
+def iter_image_chunks(resume_after: int, chunk_size: int, force: bool) -> Iterator[List[Tuple[int, str, Optional[str]]]]:
+    """按 id 升序 keyset 分块读取待处理记录，只查询需要的列"""
+    last_id = resume_after
+    while True:
+        query = db.session.query(ProductImage.id, ProductImage.original_path, ProductImage.oss_path).filter(
+            ProductImage.id > last_id,
+            ProductImage.original_path.isnot(None),
+            ProductImage.original_path != ''
+        )
+        if not force:
+            query = query.filter(db.or_(ProductImage.oss_path.is_(None), ProductImage.oss_path == ''))
+        rows = query.order_by(ProductImage.id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield [tuple(row) for row in rows]
+        last_id = rows[-1][0]
+
+
+def write_diff(out: TextIO, changes: List[Tuple[int, Optional[str], str]]):
+    for image_id, old, new in changes:
+        out.write(f"@@ id={image_id}\n- {old or ''}\n+ {new}\n")
+
+
+def bulk_migrate(chunk_size: int = 1000, force: bool = False, dry_run: bool = False, limit: Optional[int] = None,
+                 checkpoint: Optional[BuildCheckpoint] = None, diff_out: Optional[TextIO] = None) -> Dict[str, int]:
+    """
+    批量模式。每块在一个事务中用 executemany 更新并提交，随后把断点推进到该块最后一个 id。
+    dry-run 时不写数据库、不更新断点，只把变更写入 diff_out。
+    """
+    checkpoint = checkpoint or BuildCheckpoint(None)
+    resume_after = checkpoint.resume_after()
+    if resume_after:
+        logging.info(f"从断点继续: id > {resume_after}")
+    stats = {'scanned': 0, 'updated': 0, 'unchanged': 0}
+
+    for rows in iter_image_chunks(resume_after, chunk_size, force):
+        if limit is not None:
+            rows = rows[:max(limit - stats['scanned'], 0)]
+            if not rows:
+                break
+        changes = compute_oss_paths(rows)
+        stats['scanned'] += len(rows)
+        stats['unchanged'] += len(rows) - len(changes)
+        if dry_run:
+            if diff_out is not None:
+                write_diff(diff_out, changes)
+            stats['updated'] += len(changes)
+            continue
+        if changes:
+            db.session.execute(update(ProductImage), [
+                {'id': image_id, 'oss_path': oss_path} for image_id, _, oss_path in changes
+            ])
+        db.session.commit()
+        stats['updated'] += len(changes)
+        checkpoint.save(rows[-1][0], **stats)
+        logging.info(f"已处理至 id={rows[-1][0]}: 扫描 {stats['scanned']}, 更新 {stats['updated']}")
+
+    if not dry_run:
+        checkpoint.save(0, status='complete', **stats)
+    return stats
+
+
 def create_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="迁移 product_images 的 oss_path 字段")
     parser.add_argument(
@@ -103,6 +196,33 @@ def create_parser() -> argparse.ArgumentParser:
         action='store_true',
         help='强制更新所有记录，包括已有 oss_path 的记录'
     )
+    parser.add_argument(
+        '--bulk',
+        action='store_true',
+        help='批量模式：keyset 分块读取、executemany 批量更新、按块提交并记录断点'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=1000,
+        help='批量模式每块（每个事务）处理的记录数，默认 1000'
+    )
+    parser.add_argument(
+        '--checkpoint',
+        type=Path,
+        default=Path(__file__).resolve().parent.parent / 'data' / 'migrate_oss_path_checkpoint.json',
+        help='批量模式的断点文件，中断后再次运行从断点继续'
+    )
+    parser.add_argument(
+        '--restart',
+        action='store_true',
+        help='批量模式忽略已有断点，从头开始'
+    )
+    parser.add_argument(
+        '--diff-output',
+        type=Path,
+        help='批量模式 dry-run 时将 diff 写入该文件，默认输出到标准输出'
+    )
     parser.add_argument(
         '--limit',
         type=int,
@@ -121,8 +241,23 @@ def main():
     parser = create_parser()
     args = parser.parse_args()
 
-    app = create_app()
+    app = create_app(load_index=False)
     with app.app_context():
+        if args.bulk:
+            checkpoint = BuildCheckpoint(str(args.checkpoint))
+            if args.restart:
+                checkpoint.clear()
+            diff_out = open(args.diff_output, 'w', encoding='utf-8') if args.diff_output else sys.stdout
+            try:
+                stats = bulk_migrate(args.chunk_size, args.force, args.dry_run, args.limit,
+                                     None if args.dry_run else checkpoint, diff_out)
+            finally:
+                if args.diff_output:
+                    diff_out.close()
+            logging.info(f"处理完成: 扫描 {stats['scanned']}, "
+                         f"{'将更新' if args.dry_run else '更新'} {stats['updated']}, 无变化 {stats['unchanged']}")
+            return
+
         # 构建查询条件
         query = db.session.query(ProductImage).filter(
             ProductImage.original_path.isnot(None),
@@ -0,0 +1 @@
+# 服务层：外部服务封装与共享的基础工具
@@ -0,0 +1,115 @@
+"""
+与 FAISS 索引位置对齐的列式图片元数据存储，使搜索结果无需访问数据库即可组装。
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (product_images.id, product_id, image_path, original_path, oss_path)
+MetadataRow = Tuple[int, int, Optional[str], Optional[str], Optional[str]]
+
+
+class StringTable:
+    """字符串驻留表：相同字符串只存一份，列中只保存 int32 下标，None 用 -1 表示。"""
+
+    def __init__(self):
+        self._strings: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        idx = self._index.get(value)
+        if idx is None:
+            idx = len(self._strings)
+            self._strings.append(value)
+            self._index[value] = idx
+        return idx
+
+    def get(self, idx: int) -> Optional[str]:
+        return self._strings[idx] if idx >= 0 else None
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def nbytes(self) -> int:
+        return sum(len(s.encode('utf-8')) for s in self._strings)
+
+
+class ImageMetadataStore:
+    """
+    按 FAISS 位置存储 product_images 元数据的列式数组。
+
+    第 i 行对应 FAISS 索引中的第 i 个向量：id 与 product_id 使用 int64 数组，
+    三个路径列使用指向 StringTable 的 int32 下标。增删操作需与 FAISS 索引保持相同顺序。
+    """
+
+    PATH_COLUMNS = ('image_path', 'original_path', 'oss_path')
+
+    def __init__(self):
+        self.strings = StringTable()
+        self.image_ids = np.empty(0, dtype=np.int64)
+        self.product_ids = np.empty(0, dtype=np.int64)
+        self._paths = {name: np.empty(0, dtype=np.int32) for name in self.PATH_COLUMNS}
+
+    def __len__(self) -> int:
+        return len(self.image_ids)
+
+    def _columns_from_rows(self, rows: Iterable[MetadataRow]):
+        image_ids, product_ids = [], []
+        paths = {name: [] for name in self.PATH_COLUMNS}
+        for image_id, product_id, image_path, original_path, oss_path in rows:
+            image_ids.append(image_id)
+            product_ids.append(product_id)
+            paths['image_path'].append(self.strings.intern(image_path))
+            paths['original_path'].append(self.strings.intern(original_path))
+            paths['oss_path'].append(self.strings.intern(oss_path))
+        return (
+            np.asarray(image_ids, dtype=np.int64),
+            np.asarray(product_ids, dtype=np.int64),
+            {name: np.asarray(values, dtype=np.int32) for name, values in paths.items()},
+        )
+
+    def load(self, rows: Iterable[MetadataRow]):
+        """用完整数据替换当前内容（同时重建字符串表，回收已删除行占用的字符串）。"""
+        self.strings = StringTable()
+        self.image_ids, self.product_ids, self._paths = self._columns_from_rows(rows)
+
+    def append(self, rows: Iterable[MetadataRow]):
+        """在末尾追加行，对应 FAISS 的 index.add。"""
+        image_ids, product_ids, paths = self._columns_from_rows(rows)
+        self.image_ids = np.concatenate([self.image_ids, image_ids])
+        self.product_ids = np.concatenate([self.product_ids, product_ids])
+        for name in self.PATH_COLUMNS:
+            self._paths[name] = np.concatenate([self._paths[name], paths[name]])
+
+    def remove_positions(self, positions: Sequence[int]):
+        """删除指定位置的行，其余行保持原有相对顺序（与 IndexFlat.remove_ids 一致）。"""
+        if len(positions) == 0:
+            return
+        positions = np.asarray(positions, dtype=np.int64)
+        self.image_ids = np.delete(self.image_ids, positions)
+        self.product_ids = np.delete(self.product_ids, positions)
+        for name in self.PATH_COLUMNS:
+            self._paths[name] = np.delete(self._paths[name], positions)
+
+    def positions_for_image_ids(self, image_ids: Iterable[int]) -> np.ndarray:
+        return np.flatnonzero(np.isin(self.image_ids, np.fromiter(image_ids, dtype=np.int64)))
+
+    def positions_for_product_ids(self, product_ids: Iterable[int]) -> np.ndarray:
+        return np.flatnonzero(np.isin(self.product_ids, np.fromiter(product_ids, dtype=np.int64)))
+
+    def get(self, position: int) -> Dict[str, Any]:
+        """返回指定位置的元数据字典。"""
+        record = {
+            'id': int(self.image_ids[position]),
+            'product_id': int(self.product_ids[position]),
+        }
+        for name in self.PATH_COLUMNS:
+            record[name] = self.strings.get(int(self._paths[name][position]))
+        return record
+
+    def nbytes(self) -> int:
+        """估算占用的内存字节数。"""
+        arrays = [self.image_ids, self.product_ids, *self._paths.values()]
+        return sum(a.nbytes for a in arrays) + self.strings.nbytes()
@@ -0,0 +1,289 @@
+"""
+图片缩略图（按宽度缩放的变体）磁盘缓存与静态图片响应。
+
+/uploads 与 /dataset-images 支持 ?w=<宽度> 参数：首次请求时生成缩略图并写入分片目录
+（<缓存目录>/<key[:2]>/<key[2:4]>/<key>.<ext>），之后直接读取缓存文件。
+缓存 key 由源文件路径、mtime、大小和目标宽度计算，源文件变化后自动生成新的变体，旧变体由 LRU 淘汰。
+
+响应使用强 ETag 并支持条件请求（If-None-Match -> 304）与 Range 请求；uuid 命名的上传文件内容不会变化，
+返回 Cache-Control: immutable。
+
+IMAGE_OFFLOAD=x-accel / x-sendfile 时，经前端代理转发的请求（代理把 X-Image-Offload 请求头设置为
+IMAGE_OFFLOAD_SECRET）由代理通过 X-Accel-Redirect / X-Sendfile 发送文件内容，不占用 gunicorn worker 线程
+（nginx 配置见 frontend/nginx.conf）；直接访问后端端口、请求头不匹配或未配置密钥的请求仍由 Flask 发送。
+"""
+import hashlib
+import hmac
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+from flask import Response, abort, request, send_file
+from PIL import Image, ImageOps
+
+from services.metrics import metrics
+from services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# 变体编码参数变化时修改版本号，使旧缓存和 ETag 失效
+VARIANT_VERSION = 1
+JPEG_QUALITY = 82
+
+# uuid4() 或 uuid4().hex 作为前缀的上传文件名，如 "3f2b..._photo.jpg"
+IMMUTABLE_NAME_PATTERN = re.compile(
+    r'^(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{32})_', re.IGNORECASE
+)
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+
+
+def parse_widths(value: str) -> Tuple[int, ...]:
+    return tuple(sorted({int(part) for part in value.split(',') if part.strip()}))
+
+
+def is_immutable_name(filename: str) -> bool:
+    return bool(IMMUTABLE_NAME_PATTERN.match(os.path.basename(filename)))
+
+
+def render_variant(source_path: str, width: int, target_path: str) -> str:
+    """生成宽度不超过 width 的缩略图（不放大），返回输出格式对应的 mimetype"""
+    with Image.open(source_path) as image:
+        if image.format == 'JPEG':
+            image.draft('RGB', (width, width * 4))
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image.convert('RGBA').save(target_path, format='PNG', optimize=True)
+            return 'image/png'
+        image.convert('RGB').save(target_path, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        return 'image/jpeg'
+
+
+class ImageVariantCache:
+    """
+    分片目录中的缩略图缓存。每个文件的 mtime 作为最近访问时间（命中时按 touch_interval 节流更新），
+    缓存总大小超过 max_bytes 时删除最久未访问的文件，直到降到 max_bytes 的 90%。
+    总大小在每个进程内单独统计（多 worker 时为近似值），首次使用时扫描一次缓存目录。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, touch_interval: float = 300):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        self._single_flight = SingleFlight()
+
+    @staticmethod
+    def cache_key(source_path: str, stat: os.stat_result, width: int) -> str:
+        raw = f'{VARIANT_VERSION}:{source_path}:{stat.st_mtime_ns}:{stat.st_size}:{width}'
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _variant_path(self, key: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key[2:4], f'{key}.{ext}')
+
+    def _iter_files(self):
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                if not name.endswith('.tmp'):
+                    yield os.path.join(dirpath, name)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(os.path.getsize(path) for path in self._iter_files())
+            return self._total_bytes
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, str]]:
+        for ext, mimetype in (('jpg', 'image/jpeg'), ('png', 'image/png')):
+            path = self._variant_path(key, ext)
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            if time.time() - mtime > self.touch_interval:
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+            return path, mimetype
+        return None
+
+    def _create(self, source_path: str, width: int, key: str) -> Tuple[str, str]:
+        cached = self._lookup(key)
+        if cached:
+            return cached
+        os.makedirs(os.path.join(self.cache_dir, key[:2], key[2:4]), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.cache_dir, key[:2], key[2:4]), suffix='.tmp')
+        os.close(fd)
+        try:
+            mimetype = render_variant(source_path, width, tmp_path)
+            path = self._variant_path(key, 'png' if mimetype == 'image/png' else 'jpg')
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._account(size, keep=path)
+        return path, mimetype
+
+    def _account(self, size: int, keep: str):
+        total = self.total_bytes()
+        with self._lock:
+            self._total_bytes = total + size
+            if self._total_bytes <= self.max_bytes:
+                return
+            self.evict(int(self.max_bytes * 0.9), keep=keep)
+
+    def evict(self, target_bytes: int, keep: Optional[str] = None):
+        """按最近访问时间从旧到新删除缓存文件（keep 除外），直到总大小不超过 target_bytes（调用方持有锁）"""
+        entries = []
+        for path in self._iter_files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= target_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._total_bytes = total
+        logger.info(f"缩略图缓存淘汰 {removed} 个文件，当前占用 {total} 字节")
+
+    def get(self, source_path: str, stat: os.stat_result, width: int) -> Tuple[str, str, str]:
+        """返回 (变体文件路径, mimetype, 缓存 key)，不存在时生成（同一变体的并发请求只生成一次）"""
+        key = self.cache_key(source_path, stat, width)
+        cached = self._lookup(key)
+        metrics.inc('image_variant_cache_total', result='hit' if cached else 'miss')
+        if cached is None:
+            cached = self._single_flight.do(key, lambda: self._create(source_path, width, key))
+        return cached[0], cached[1], key
+
+
+_default_cache: Optional[ImageVariantCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_variant_cache(app) -> ImageVariantCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache.cache_dir != app.config['IMAGE_VARIANT_CACHE_DIR']:
+            _default_cache = ImageVariantCache(
+                app.config['IMAGE_VARIANT_CACHE_DIR'],
+                int(app.config['IMAGE_VARIANT_CACHE_MAX_MB']) * 1024 * 1024,
+            )
+        return _default_cache
+
+
+# 前端代理转发图片请求时设置的请求头，值为 IMAGE_OFFLOAD_SECRET；代理会覆盖客户端发送的同名请求头，
+# 值不匹配说明请求未经过代理（客户端直接访问后端端口），不能交给代理发送
+OFFLOAD_REQUEST_HEADER = 'X-Image-Offload'
+
+
+def is_proxied_request(app) -> bool:
+    secret = app.config.get('IMAGE_OFFLOAD_SECRET') or ''
+    value = request.headers.get(OFFLOAD_REQUEST_HEADER, '')
+    return bool(secret) and hmac.compare_digest(value.encode('utf-8'), secret.encode('utf-8'))
+
+
+def offload_locations(app) -> List[Tuple[str, str]]:
+    """X-Accel-Redirect 模式下文件系统目录到前端代理 internal location 的映射，按目录长度降序"""
+    locations = [
+        (app.config.get('UPLOAD_FOLDER'), '/_protected/uploads/'),
+        (app.config.get('DATASET_ROOT'), '/_protected/dataset-images/'),
+        (app.config.get('IMAGE_VARIANT_CACHE_DIR'), '/_protected/image-variants/'),
+    ]
+    resolved = [(os.path.realpath(root), prefix) for root, prefix in locations if root]
+    return sorted(resolved, key=lambda item: len(item[0]), reverse=True)
+
+
+def offload_response(app, path: str, mimetype: Optional[str], etag: str):
+    """
+    只返回响应头，由前端代理发送文件内容：
+        x-accel     nginx，X-Accel-Redirect 指向 internal location
+        x-sendfile  Apache mod_xsendfile / lighttpd，X-Sendfile 为文件绝对路径
+    条件请求（If-None-Match / If-Modified-Since）在这里直接返回 304；
+    Range 请求交给代理处理（代理发送静态文件时原生支持 Range / If-Range），这里只声明 Accept-Ranges。
+    请求未经过代理（X-Image-Offload 与 IMAGE_OFFLOAD_SECRET 不一致）或无法映射到 internal location 的路径
+    返回 None，由调用方回退为直接发送。
+    """
+    mode = app.config.get('IMAGE_OFFLOAD')
+    if not mode or not is_proxied_request(app):
+        return None
+    path = os.path.realpath(path)
+    if mode == 'x-accel':
+        for root, prefix in offload_locations(app):
+            if path.startswith(root + os.sep):
+                relative = os.path.relpath(path, root).replace(os.sep, '/')
+                header = ('X-Accel-Redirect', quote(prefix.rstrip('/') + '/' + relative))
+                break
+        else:
+            return None
+    elif mode == 'x-sendfile':
+        header = ('X-Sendfile', path)
+    else:
+        return None
+
+    stat = os.stat(path)
+    response = Response(mimetype=mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream')
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    response.accept_ranges = 'bytes'
+    response = response.make_conditional(request)
+    if response.status_code != 304:
+        # 响应本身没有内容，Content-Length 由代理按实际发送的文件设置
+        response.headers[header[0]] = header[1]
+    return response
+
+
+def send_image(app, path: str, immutable: bool = False):
+    """
+    发送图片文件：?w= 为允许的宽度时发送缩略图，否则发送原图。
+    使用强 ETag 与条件请求，并支持 Range 请求；配置 IMAGE_OFFLOAD 时文件内容交给前端代理发送，
+    worker 线程只负责路径检查和缓存头。
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        abort(404)
+
+    width = request.args.get('w', type=int)
+    if 'w' in request.args:
+        if width not in app.config['IMAGE_VARIANT_WIDTHS']:
+            abort(400, description=f"w 必须是以下宽度之一: {', '.join(map(str, app.config['IMAGE_VARIANT_WIDTHS']))}")
+        try:
+            path, mimetype, key = get_variant_cache(app).get(path, stat, width)
+        except (OSError, Image.DecompressionBombError) as e:
+            logger.error(f"生成缩略图失败 {path}: {e}")
+            abort(415)
+        etag = f'w{width}-{key[:32]}'
+    else:
+        mimetype = None
+        # 与 nginx 静态文件的 ETag 格式（mtime 秒-大小，十六进制）一致，代理发送时 ETag 保持不变
+        etag = f'{int(stat.st_mtime):x}-{stat.st_size:x}'
+
+    response = offload_response(app, path, mimetype, etag)
+    if response is None:
+        response = send_file(path, mimetype=mimetype, etag=etag, conditional=True, max_age=None)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else DEFAULT_CACHE_CONTROL
+    return response
@@ -0,0 +1,257 @@
+"""
+向量索引构建流水线：
+
+    生产者（按商品 id 顺序读取待处理商品）
+      -> 有界线程池并发提取图片特征（共享限速器）
+      -> 批量写入 product_images 并同步追加到内存中的 FAISS 索引
+
+每次批量写入后更新断点文件，构建中断（客户端断开、进程重启）后再次启动会从断点继续。
+流水线以生成器形式逐条产出进度事件，由调用方转换为 SSE。
+"""
+import json
+import logging
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, ProductImage
+from services.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# (web 路径, 文件系统路径)
+ImageRef = Tuple[str, str]
+# (product_id, 图片列表)
+BuildCandidate = Tuple[int, List[ImageRef]]
+
+
+class BuildCheckpoint:
+    """
+    构建断点：记录已完整处理的最大商品 id（watermark）。
+    商品按 id 升序提交、乱序完成，watermark 只推进到仍在处理中的最小 id 之前，保证断点之前的商品都已落库。
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+
+    def load(self) -> dict:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取构建断点失败，将从头开始: {e}")
+            return {}
+
+    def resume_after(self) -> int:
+        """返回应从哪个商品 id 之后继续；上次构建已完成时从头开始"""
+        state = self.load()
+        if state.get('status') != 'running':
+            return 0
+        return int(state.get('watermark', 0))
+
+    def save(self, watermark: int, status: str = 'running', **stats):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'watermark': watermark, 'status': status, **stats}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _PendingProduct:
+    __slots__ = ('product_id', 'images', 'futures', 'remaining')
+
+    def __init__(self, product_id: int, images: List[ImageRef]):
+        self.product_id = product_id
+        self.images = images
+        self.futures = []
+        self.remaining = len(images)
+
+
+class IndexBuildPipeline:
+    """
+    Args:
+        product_index: VectorProductIndex，写入数据库后同步调用 add_images
+        checkpoint: 构建断点
+        max_workers: 并发提取特征的线程数
+        max_pending_images: 已提交但尚未写入的图片数上限（控制内存与背压）
+        batch_size: 每批写入数据库的图片数
+        rate_limiter: embedding 调用限速器
+    """
+
+    def __init__(self, product_index, checkpoint: BuildCheckpoint, max_workers: int = 4,
+                 max_pending_images: int = 64, batch_size: int = 32,
+                 rate_limiter: Optional[RateLimiter] = None):
+        self.product_index = product_index
+        self.checkpoint = checkpoint
+        self.max_workers = max_workers
+        self.max_pending_images = max(max_pending_images, 1)
+        self.batch_size = batch_size
+        self.rate_limiter = rate_limiter or RateLimiter(0)
+
+    def _embed(self, fs_path: str):
+        self.rate_limiter.acquire()
+        return self.product_index.extract_feature(fs_path)
+
+    def _insert_images(self, records) -> int:
+        """插入一组图片记录并提交，按插入得到的 id 追加到内存索引；冲突时抛出 IntegrityError（已回滚）"""
+        images = [ProductImage(product_id=pid, image_path=web_path, original_path=fs_path, vector=feature.tobytes())
+                  for pid, web_path, fs_path, feature in records]
+        try:
+            db.session.add_all(images)
+            db.session.flush()
+            rows = [(image.id, image.product_id, image.image_path, image.original_path, image.oss_path, feature)
+                    for image, (_, _, _, feature) in zip(images, records)]
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            raise
+        self.product_index.add_images(rows)
+        return len(rows)
+
+    def _write_batch(self, products: List[_PendingProduct]) -> Tuple[int, List[str]]:
+        """
+        批量插入图片记录并追加到内存索引，返回 (写入的图片数, 错误信息列表)。
+        image_path 唯一：同一批内重复的路径和数据库中已存在的路径在插入前跳过；
+        仍然发生唯一约束冲突（例如并发写入）时逐个商品重试，只把冲突的商品记为错误，不中断整个构建。
+        """
+        records_by_product: Dict[int, list] = {}
+        seen = set()
+        for product in products:
+            records = records_by_product.setdefault(product.product_id, [])
+            for (web_path, fs_path), future in zip(product.images, product.futures):
+                if future.exception() is None and web_path not in seen:
+                    seen.add(web_path)
+                    records.append((product.product_id, web_path, fs_path, future.result()))
+        if not seen:
+            return 0, []
+
+        existing = {path for (path,) in db.session.query(ProductImage.image_path)
+                    .filter(ProductImage.image_path.in_(list(seen)))}
+        if existing:
+            logger.warning(f"跳过 {len(existing)} 张已建立索引的图片: {sorted(existing)[:5]}")
+            for product_id, records in records_by_product.items():
+                records_by_product[product_id] = [r for r in records if r[1] not in existing]
+
+        try:
+            return self._insert_images([r for records in records_by_product.values() for r in records]), []
+        except IntegrityError as e:
+            logger.warning(f"批量写入图片记录冲突，改为逐个商品写入: {e}")
+
+        written, errors = 0, []
+        for product_id, records in records_by_product.items():
+            try:
+                written += self._insert_images(records)
+            except IntegrityError as e:
+                message = f"商品 {product_id} 的图片记录写入失败（图片路径冲突）: {e.orig}"
+                logger.error(message)
+                errors.append(message)
+        return written, errors
+
+    def run(self, candidates: Iterable[BuildCandidate], total: int) -> Iterator[Dict]:
+        """
+        执行构建，依次产出事件：
+            {'type': 'total', 'value': n}
+            {'type': 'progress', 'processed', 'total', 'current_product_id', 'status'}  status: processed/skipped_no_images/error
+            {'type': 'complete', 'message', 'products_processed', 'total_products_considered', 'images_indexed', 'errors'}
+        """
+        yield {'type': 'total', 'value': total}
+
+        source = iter(candidates)
+        done_queue: 'queue.Queue[int]' = queue.Queue()
+        pending: Dict[int, _PendingProduct] = {}
+        finished: List[_PendingProduct] = []
+        finished_images = 0
+        pending_images = 0
+        last_submitted = self.checkpoint.resume_after()
+        processed = 0
+        images_indexed = 0
+        errors: List[str] = []
+        exhausted = False
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='index-build')
+
+        def flush():
+            nonlocal finished, finished_images, images_indexed
+            if finished:
+                written, write_errors = self._write_batch(finished)
+                images_indexed += written
+                errors.extend(write_errors)
+                finished, finished_images = [], 0
+            watermark = min(pending) - 1 if pending else last_submitted
+            self.checkpoint.save(watermark, processed=processed, images_indexed=images_indexed)
+
+        try:
+            while True:
+                # 生产：在背压上限内持续提交新商品的图片
+                while not exhausted and pending_images < self.max_pending_images:
+                    candidate = next(source, None)
+                    if candidate is None:
+                        exhausted = True
+                        break
+                    product_id, images = candidate
+                    last_submitted = product_id
+                    if not images:
+                        processed += 1
+                        yield {'type': 'progress', 'processed': processed, 'total': total,
+                               'current_product_id': product_id, 'status': 'skipped_no_images'}
+                        continue
+                    product = pending[product_id] = _PendingProduct(product_id, images)
+                    pending_images += len(images)
+                    for _, fs_path in images:
+                        future = executor.submit(self._embed, fs_path)
+                        future.add_done_callback(lambda _f, pid=product_id: done_queue.put(pid))
+                        product.futures.append(future)
+
+                if not pending:
+                    break
+
+                # 消费：某个商品的全部图片完成后进入写入缓冲
+                product = pending[done_queue.get()]
+                product.remaining -= 1
+                if product.remaining:
+                    continue
+                del pending[product.product_id]
+                pending_images -= len(product.images)
+                failures = [f.exception() for f in product.futures if f.exception() is not None]
+                for (_, fs_path), future in zip(product.images, product.futures):
+                    if future.exception() is not None:
+                        logger.error(f"提取商品 {product.product_id} 图片 {fs_path} 特征失败: {future.exception()}")
+                finished.append(product)
+                finished_images += len(product.images) - len(failures)
+                processed += 1
+                status = 'processed'
+                if len(failures) == len(product.images):
+                    status = 'error'
+                    errors.append(f"商品 {product.product_id} 的图片特征提取全部失败: {failures[0]}")
+                if finished_images >= self.batch_size or not pending:
+                    flush()
+                yield {'type': 'progress', 'processed': processed, 'total': total,
+                       'current_product_id': product.product_id, 'status': status}
+
+            flush()
+            self.checkpoint.save(last_submitted, status='complete', processed=processed,
+                                 images_indexed=images_indexed)
+            message = f'向量索引构建完成。成功处理（或跳过） {processed} 个产品中的 {total} 个，新增 {images_indexed} 张图片。'
+            if errors:
+                message += f" 发生 {len(errors)} 个错误。"
+            yield {'type': 'complete', 'message': message, 'products_processed': processed,
+                   'total_products_considered': total, 'images_indexed': images_indexed, 'errors': errors}
+        finally:
+            # 客户端断开或出错时：丢弃未开始的任务，已完成的商品仍然落库并更新断点
+            executor.shutdown(wait=True, cancel_futures=True)
+            if finished:
+                try:
+                    flush()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"保存已完成的向量索引数据失败: {e}")
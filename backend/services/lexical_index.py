@@ -0,0 +1,133 @@
+"""
+商品关键词检索：基于字符 n-gram 的内存倒排索引，替代对商品表的 LIKE 全表扫描。
+
+货号、名称等字段按字符 1-gram 和 2-gram 建立倒排表，查询时统计各字段命中的查询 gram 比例，
+中文名称、货号片段（如 "A23"）都能匹配，无需分词。
+"""
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func
+
+from models import Product
+from services.search_cache import normalize_text_query
+
+# 参与关键词匹配的字段及权重：货号最精确，描述最宽泛
+FIELD_WEIGHTS = {
+    'product_code': 1.0,
+    'name': 0.8,
+    'factory_name': 0.6,
+    'description': 0.3,
+}
+
+
+def char_ngrams(text: Optional[str], sizes: Sequence[int] = (1, 2)) -> set:
+    """返回规范化文本（去空白）的字符 n-gram 集合"""
+    if not text:
+        return set()
+    compact = normalize_text_query(text).replace(' ', '')
+    grams = set()
+    for n in sizes:
+        grams.update(compact[i:i + n] for i in range(len(compact) - n + 1))
+    return grams
+
+
+def query_ngrams(text: str) -> set:
+    """查询文本长度为 1 时使用单字，否则使用 2-gram，避免常见单字带来大量噪声"""
+    compact = normalize_text_query(text).replace(' ', '')
+    return char_ngrams(compact, (1,) if len(compact) == 1 else (2,))
+
+
+class LexicalIndex:
+    """
+    不可变的倒排索引快照。
+    rows 为 (product_id, {字段名: 文本}) 序列；postings[字段][gram] 为包含该 gram 的文档位置数组。
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, Dict[str, Optional[str]]]],
+                 field_weights: Dict[str, float] = FIELD_WEIGHTS):
+        self.field_weights = dict(field_weights)
+        product_ids = []
+        postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in self.field_weights}
+        for position, (product_id, values) in enumerate(rows):
+            product_ids.append(product_id)
+            for field in self.field_weights:
+                for gram in char_ngrams(values.get(field)):
+                    postings[field].setdefault(gram, []).append(position)
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.postings = {
+            field: {gram: np.asarray(positions, dtype=np.int32) for gram, positions in grams.items()}
+            for field, grams in postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    def search(self, query: str, limit: int = 100) -> Dict[int, float]:
+        """
+        返回 {product_id: 关键词得分}，按得分降序最多 limit 个。
+        得分为各字段 (命中的查询 gram 比例 × 字段权重) 的最大值，范围 0~1。
+        """
+        grams = query_ngrams(query)
+        if not grams or not len(self.product_ids):
+            return {}
+        scores = np.zeros(len(self.product_ids), dtype=np.float32)
+        for field, weight in self.field_weights.items():
+            field_postings = self.postings.get(field, {})
+            counts = np.zeros(len(self.product_ids), dtype=np.float32)
+            for gram in grams:
+                positions = field_postings.get(gram)
+                if positions is not None:
+                    counts[positions] += 1
+            np.maximum(scores, counts * (weight / len(grams)), out=scores)
+
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        matched = matched[np.argsort(-scores[matched], kind='stable')]
+        return {int(self.product_ids[i]): float(scores[i]) for i in matched}
+
+
+class ProductLexicalIndex:
+    """
+    商品表的关键词索引，商品数量或最大 updated_at 变化时自动重建。
+    数据变化的检查最多每 refresh_interval 秒执行一次（一条聚合查询），重建期间继续使用旧快照。
+    需要在 Flask 应用上下文中调用。
+    """
+
+    def __init__(self, refresh_interval: float = 5.0, field_weights: Dict[str, float] = FIELD_WEIGHTS):
+        self.refresh_interval = refresh_interval
+        self.field_weights = field_weights
+        self._index: Optional[LexicalIndex] = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current_signature(self):
+        return Product.query.with_entities(func.count(Product.id), func.max(Product.updated_at)).one()
+
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and self._index is not None and now - self._checked_at < self.refresh_interval:
+            return
+        if not self._lock.acquire(blocking=self._index is None):
+            return  # 其他线程正在检查/重建，先使用旧快照
+        try:
+            self._checked_at = now
+            signature = tuple(self._current_signature())
+            if signature == self._signature and self._index is not None:
+                return
+            fields = list(self.field_weights)
+            rows = Product.query.with_entities(Product.id, *[getattr(Product, f) for f in fields]).all()
+            self._index = LexicalIndex(
+                ((row[0], dict(zip(fields, row[1:]))) for row in rows), self.field_weights
+            )
+            self._signature = signature
+        finally:
+            self._lock.release()
+
+    def search(self, query: str, limit: int = 100) -> Dict[int, float]:
+        self.refresh()
+        return self._index.search(query, limit)
@@ -0,0 +1,305 @@
+"""
+轻量级的延迟/计数指标采集，输出 Prometheus 文本格式。
+
+多进程部署（gunicorn 多 worker）时设置 METRICS_MULTIPROC_DIR，每个 worker 会定期把
+自己的累计数据写入该目录下的 metrics_<pid>_<随机串>.json，/api/metrics 读取全部文件求和后输出，
+因此无论请求落到哪个 worker，看到的都是整个服务的聚合值。
+文件名带随机串，PID 被新 worker 复用时不会覆盖旧 worker 的数据；worker 退出时由 gunicorn 的
+child_exit 钩子（见 gunicorn.conf.py）把它的数据并入 metrics_archived.json 并删除原文件。
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+# 默认的延迟分桶（秒），覆盖从内存检索到外部 API 调用的范围
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# 已退出 worker 的累计数据
+ARCHIVE_FILENAME = 'metrics_archived.json'
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(label_key: Iterable[Tuple[str, str]]) -> str:
+    pairs = [f'{k}="{v}"' for k, v in label_key]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class MetricsRegistry:
+    """线程安全的直方图与计数器注册表。"""
+
+    def __init__(self, multiproc_dir: Optional[str] = None, flush_interval: float = 1.0,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        # name -> label_key -> [各分桶计数..., sum, count]
+        self._histograms: Dict[str, Dict[LabelKey, list]] = {}
+        # name -> label_key -> value
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._last_flush = 0.0
+        self._flush_timer = None
+        self._flush_timer_pid = None
+        self._process_id = None
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._help[name] = (kind, help_text)
+
+    def observe(self, name: str, value: float, **labels):
+        """记录一次直方图观测值（单位：秒）"""
+        key = _label_key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            data = series.get(key)
+            if data is None:
+                data = series[key] = [0] * (len(self.buckets) + 2)
+            if idx < len(self.buckets):
+                data[idx] += 1
+            data[-2] += value
+            data[-1] += 1
+        self._maybe_flush()
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """计数器累加"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+        self._maybe_flush()
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """统计代码块耗时：with metrics.timer('search_stage_seconds', stage='faiss'): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        """返回本进程的累计数据（可 JSON 序列化）"""
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                'histograms': {
+                    name: [[list(map(list, key)), list(data)] for key, data in series.items()]
+                    for name, series in self._histograms.items()
+                },
+                'counters': {
+                    name: [[list(map(list, key)), value] for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+            }
+
+    def _snapshot_path(self) -> str:
+        pid = os.getpid()
+        # fork 出的 worker 需要生成自己的随机串
+        if self._process_id is None or self._process_id[0] != pid:
+            self._process_id = (pid, uuid.uuid4().hex[:8])
+        return os.path.join(self.multiproc_dir, f'metrics_{pid}_{self._process_id[1]}.json')
+
+    @staticmethod
+    def _write_json(path: str, data: dict):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _maybe_flush(self, force: bool = False):
+        """
+        将本进程数据写入多进程目录。观测路径上最多每 flush_interval 秒写一次，
+        被节流跳过的更新由后台线程稍后补写，避免空闲 worker 的数据一直停留在旧值
+        """
+        if not self.multiproc_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            self._schedule_flush()
+            return
+        self._last_flush = now
+        try:
+            os.makedirs(self.multiproc_dir, exist_ok=True)
+            self._write_json(self._snapshot_path(), self.snapshot())
+        except OSError:
+            pass
+
+    def _schedule_flush(self):
+        with self._lock:
+            if self._flush_timer is not None and self._flush_timer_pid == os.getpid():
+                return
+            # fork 之后子进程中不存在父进程的定时器线程，需要重新创建
+            self._flush_timer_pid = os.getpid()
+            self._flush_timer = threading.Timer(self.flush_interval, self._deferred_flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _deferred_flush(self):
+        with self._lock:
+            self._flush_timer = None
+        self._maybe_flush(force=True)
+
+    def flush(self):
+        """立即写出本进程数据（worker 退出前调用，避免丢失最后一个 flush_interval 内的更新）"""
+        self._maybe_flush(force=True)
+
+    def mark_process_dead(self, pid: int):
+        """
+        把已退出 worker 的数据并入归档文件并删除它的快照（在 gunicorn master 中调用）。
+        归档中记录已并入的文件名，删除前被读到的旧快照会被跳过，不会重复计数
+        """
+        if not self.multiproc_dir or not os.path.isdir(self.multiproc_dir):
+            return
+        prefix = f'metrics_{pid}_'
+        filenames = [f for f in os.listdir(self.multiproc_dir) if f.startswith(prefix) and f.endswith('.json')]
+        if not filenames:
+            return
+        archive_path = os.path.join(self.multiproc_dir, ARCHIVE_FILENAME)
+        archived = self._read_snapshot(archive_path) or {'merged': []}
+        merged = set(archived.get('merged', ()))
+        snaps = [archived] + [self._read_snapshot(os.path.join(self.multiproc_dir, f))
+                              for f in filenames if f not in merged]
+        archive = self._merge(s for s in snaps if s is not None)
+        archive['merged'] = sorted(merged | set(filenames))
+        try:
+            self._write_json(archive_path, archive)
+            for filename in filenames:
+                os.remove(os.path.join(self.multiproc_dir, filename))
+        except OSError:
+            pass
+
+    def reset_multiproc_dir(self):
+        """删除上一次运行留下的快照（在 gunicorn master 启动时调用，计数从 0 开始）"""
+        if not self.multiproc_dir or not os.path.isdir(self.multiproc_dir):
+            return
+        for filename in os.listdir(self.multiproc_dir):
+            if filename.startswith('metrics_'):
+                try:
+                    os.remove(os.path.join(self.multiproc_dir, filename))
+                except OSError:
+                    pass
+
+    def _read_snapshot(self, path: str) -> Optional[dict]:
+        try:
+            with open(path) as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return snap if tuple(snap.get('buckets', ())) == self.buckets else None
+
+    def collect(self) -> dict:
+        """汇总所有 worker 的数据；未配置多进程目录时只返回本进程数据"""
+        if not self.multiproc_dir:
+            return self.snapshot()
+        self._maybe_flush(force=True)
+        archived = self._read_snapshot(os.path.join(self.multiproc_dir, ARCHIVE_FILENAME))
+        snaps = [archived] if archived else []
+        merged = set(archived.get('merged', ())) if archived else set()
+        for filename in os.listdir(self.multiproc_dir):
+            if (filename.startswith('metrics_') and filename.endswith('.json')
+                    and filename != ARCHIVE_FILENAME and filename not in merged):
+                snap = self._read_snapshot(os.path.join(self.multiproc_dir, filename))
+                if snap is not None:
+                    snaps.append(snap)
+        return self._merge(snaps)
+
+    def _merge(self, snaps: Iterable[dict]) -> dict:
+        """把多个快照按指标和标签求和"""
+        merged_hist: Dict[str, Dict[LabelKey, list]] = {}
+        merged_counters: Dict[str, Dict[LabelKey, float]] = {}
+        for snap in snaps:
+            for name, series in snap.get('histograms', {}).items():
+                target = merged_hist.setdefault(name, {})
+                for key, data in series:
+                    key = tuple(map(tuple, key))
+                    current = target.setdefault(key, [0] * len(data))
+                    target[key] = [a + b for a, b in zip(current, data)]
+            for name, series in snap.get('counters', {}).items():
+                target = merged_counters.setdefault(name, {})
+                for key, value in series:
+                    key = tuple(map(tuple, key))
+                    target[key] = target.get(key, 0) + value
+        return {
+            'buckets': list(self.buckets),
+            'histograms': {n: [[k, d] for k, d in s.items()] for n, s in merged_hist.items()},
+            'counters': {n: [[k, v] for k, v in s.items()] for n, s in merged_counters.items()},
+        }
+
+    def render(self, snapshot: Optional[dict] = None) -> str:
+        """以 Prometheus text exposition 格式输出"""
+        snapshot = snapshot if snapshot is not None else self.collect()
+        buckets = snapshot['buckets']
+        lines = []
+        for name in sorted(snapshot['counters']):
+            _, help_text = self._help.get(name, ("counter", name))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for key, value in sorted(snapshot['counters'][name], key=lambda item: item[0]):
+                lines.append(f'{name}{_format_labels(key)} {value}')
+        for name in sorted(snapshot['histograms']):
+            _, help_text = self._help.get(name, ("histogram", name))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, data in sorted(snapshot['histograms'][name], key=lambda item: item[0]):
+                key = [tuple(pair) for pair in key]
+                cumulative = 0
+                for bound, count in zip(buckets, data[:len(buckets)]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(key + [("le", repr(float(bound)))])} {cumulative}')
+                lines.append(f'{name}_bucket{_format_labels(key + [("le", "+Inf")])} {data[-1]}')
+                lines.append(f'{name}_sum{_format_labels(key)} {data[-2]}')
+                lines.append(f'{name}_count{_format_labels(key)} {data[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry(multiproc_dir=os.getenv('METRICS_MULTIPROC_DIR'))
+
+metrics.describe('search_stage_seconds', 'histogram', '以图搜图各阶段耗时（秒）')
+metrics.describe('search_request_seconds', 'histogram', '搜索请求总耗时（秒）')
+metrics.describe('embedding_call_seconds', 'histogram', 'DashScope embedding 调用耗时（秒，含重试）')
+metrics.describe('embedding_calls_total', 'counter', 'DashScope embedding 调用次数')
+metrics.describe('embedding_retries_total', 'counter', 'DashScope embedding 重试次数')
+metrics.describe('embedding_errors_total', 'counter', 'DashScope embedding 失败次数')
+metrics.describe('embedding_bytes_sent_total', 'counter', '发送给 DashScope 的请求数据字节数')
+metrics.describe('text_embedding_cache_total', 'counter', '文本 embedding 缓存查询次数（按 result=hit/miss 区分）')
+metrics.describe('image_variant_cache_total', 'counter', '图片缩略图缓存查询次数（按 result=hit/miss 区分）')
+metrics.describe('row_serialization_cache_total', 'counter', '列表接口行序列化缓存查询次数（按 table、result=hit/miss 区分）')
+metrics.describe('order_count_cache_total', 'counter', '订单列表总数缓存查询次数（按 result=hit/miss 区分）')
+metrics.describe('index_load_seconds', 'histogram', '从数据库加载向量索引的耗时（秒）')
+metrics.describe('index_rebuild_seconds', 'histogram', '构建向量索引任务的耗时（秒）')
+
+# 当前线程正在统计的分阶段直方图名称（由 track_stages 设置）
+_stage_context = threading.local()
+
+
+@contextmanager
+def track_stages(metric_name: str = 'search_stage_seconds'):
+    """在当前线程内开启分阶段统计，期间 stage_timer 的耗时记录到 metric_name{stage=...}"""
+    previous = getattr(_stage_context, 'metric_name', None)
+    _stage_context.metric_name = metric_name
+    try:
+        yield
+    finally:
+        _stage_context.metric_name = previous
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """记录一个阶段的耗时；当前线程未开启 track_stages 时不做任何记录"""
+    metric_name = getattr(_stage_context, 'metric_name', None)
+    if metric_name is None:
+        yield
+        return
+    with metrics.timer(metric_name, stage=stage):
+        yield
@@ -0,0 +1,34 @@
+"""
+令牌桶限速器：多个线程共享一个调用速率上限（如 DashScope embedding 的 QPS 限制）。
+"""
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    线程安全的令牌桶。rate 为每秒允许的调用次数，burst 为允许的突发次数；
+    rate <= 0 表示不限速。
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞直到获得一个令牌"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,180 @@
+"""
+搜索结果缓存：进程内 LRU + TTL，可选 Redis 作为跨 worker 的二级缓存。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    线程安全的 LRU 缓存，条目在 ttl 秒后过期。
+
+    配置 redis_url 时，本地未命中会再查询 Redis，写入时同时写 Redis，
+    使同一台机器上的多个 gunicorn worker 共享结果。Redis 不可用时自动退化为纯本地缓存。
+    key 必须是字符串；值通过 dumps/loads 序列化后存入 Redis。
+
+    数据写入后需要让所有 worker 失效的缓存（如订单总数）可以把 generation() 拼进 key，
+    写入提交后调用 invalidate()：代数保存在 Redis 中，递增后所有 worker 的旧条目都不再命中。
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 300,
+        redis_url: Optional[str] = None,
+        namespace: str = 'cache',
+        dumps: Callable[[Any], bytes] = lambda v: json.dumps(v, ensure_ascii=False).encode('utf-8'),
+        loads: Callable[[bytes], Any] = lambda b: json.loads(b.decode('utf-8')),
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.namespace = namespace
+        self._dumps = dumps
+        self._loads = loads
+        self._data: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        if redis_url:
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.05)
+            except Exception as e:
+                logger.warning(f"无法连接 Redis 缓存 {redis_url}，仅使用本地缓存: {e}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """返回缓存值，未命中或已过期时返回 None。"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+
+        value = self._redis_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._store_local(key, value)
+        return value
+
+    def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        self._store_local(key, value)
+        if self._redis is not None:
+            try:
+                self._redis.set(f'{self.namespace}:{key}', self._dumps(value), ex=max(1, int(self.ttl)))
+            except Exception as e:
+                logger.debug(f"写入 Redis 缓存失败: {e}")
+
+    def _store_local(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _redis_get(self, key: str) -> Optional[Any]:
+        if self._redis is None:
+            return None
+        try:
+            raw = self._redis.get(f'{self.namespace}:{key}')
+        except Exception as e:
+            logger.debug(f"读取 Redis 缓存失败: {e}")
+            return None
+        return self._loads(raw) if raw is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def generation(self) -> Optional[str]:
+        """当前的缓存代数；配置了 Redis 但读取失败时返回 None，此时调用方不应使用缓存"""
+        if self._redis is None:
+            return str(self._generation)
+        try:
+            raw = self._redis.get(f'{self.namespace}:generation')
+        except Exception as e:
+            logger.debug(f"读取 Redis 缓存代数失败: {e}")
+            return None
+        return raw.decode('utf-8') if raw is not None else '0'
+
+    def invalidate(self):
+        """递增缓存代数并清空本地条目，使所有 worker 中带旧代数的 key 失效"""
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+        if self._redis is not None:
+            try:
+                self._redis.incr(f'{self.namespace}:generation')
+            except Exception as e:
+                logger.warning(f"递增 Redis 缓存代数失败，其他 worker 的缓存将在 TTL 后过期: {e}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+def search_cache_key(feature: np.ndarray, index_version: str, **params) -> str:
+    """由查询向量、搜索参数和索引版本生成缓存 key；索引版本变化后旧条目自然失效。"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(feature, dtype=np.float32).tobytes())
+    digest.update(index_version.encode('utf-8'))
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def create_search_result_cache() -> TTLCache:
+    """按环境变量创建搜索结果缓存（SEARCH_CACHE_SIZE=0 时禁用）。"""
+    return TTLCache(
+        maxsize=int(os.getenv('SEARCH_CACHE_SIZE', 1024)),
+        ttl=float(os.getenv('SEARCH_CACHE_TTL', 300)),
+        redis_url=os.getenv('SEARCH_CACHE_REDIS_URL'),
+        namespace='search',
+    )
+
+
+def normalize_text_query(query: str) -> str:
+    """统一文本查询的写法（全半角、大小写、多余空白），使同义写法共用同一个 embedding 缓存条目。"""
+    return ' '.join(unicodedata.normalize('NFKC', query).lower().split())
+
+
+def create_text_embedding_cache() -> TTLCache:
+    """
+    按环境变量创建文本 embedding 缓存（TEXT_EMBEDDING_CACHE_SIZE=0 时禁用）。
+    同一文本的 embedding 不会变化，默认保留一天；Redis 中以 float32 原始字节存储。
+    """
+    return TTLCache(
+        maxsize=int(os.getenv('TEXT_EMBEDDING_CACHE_SIZE', 4096)),
+        ttl=float(os.getenv('TEXT_EMBEDDING_CACHE_TTL', 86400)),
+        redis_url=os.getenv('SEARCH_CACHE_REDIS_URL'),
+        namespace='text-embedding',
+        dumps=lambda v: np.ascontiguousarray(v, dtype=np.float32).tobytes(),
+        loads=lambda b: np.frombuffer(b, dtype=np.float32),
+    )
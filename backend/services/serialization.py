@@ -0,0 +1,199 @@
+"""
+API 响应的 JSON 序列化层。
+
+- OrjsonProvider：Flask JSON provider，安装 orjson 时用它编码 / 解码（输出与默认 provider 等价：
+  键排序、datetime 按 HTTP 日期格式、Decimal 转字符串），未安装时退化为标准库；
+- RowSerializationCache：按 (表名, 主键) 缓存 to_dict() 的结果和编码后的 JSON bytes，
+  版本为 updated_at，行被更新后自动失效；本进程内通过 ORM 的写入 / 删除会立即清除对应条目。
+  MySQL 的 DATETIME 只精确到秒，其他进程在同一秒内的第二次修改不会改变版本，
+  因此条目另有 ROW_CACHE_TTL 秒的过期时间兜底；
+  good_img、Order.products 等 JSON 文本列因此每个版本只解析一次；
+- rows_response：把多行缓存好的 JSON 片段直接拼接为数组响应，不再重新编码整个列表。
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from services.metrics import metrics
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时使用标准库 json
+    orjson = None
+
+ROW_CACHE_SIZE = int(os.getenv('ROW_CACHE_SIZE', 20000))
+ROW_CACHE_TTL = float(os.getenv('ROW_CACHE_TTL', 60))
+
+
+def _orjson_option(sort_keys: bool, indent: bool) -> int:
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return option
+
+
+def dumps_bytes(obj: Any, default: Callable[[Any], Any] = DefaultJSONProvider.default,
+                sort_keys: bool = True, indent: bool = False) -> bytes:
+    """编码为 UTF-8 JSON bytes；orjson 不支持的值（如超过 64 位的整数）退回标准库编码"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default, option=_orjson_option(sort_keys, indent))
+        except (orjson.JSONEncodeError, TypeError):
+            pass
+    return json.dumps(obj, default=default, sort_keys=sort_keys, ensure_ascii=False,
+                      indent=2 if indent else None, separators=None if indent else (',', ':')).encode('utf-8')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """使用 orjson 的 Flask JSON provider，jsonify / request.get_json 均经过它"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj, self.default, self.sort_keys).decode('utf-8')
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = dumps_bytes(obj, self.default, self.sort_keys, indent)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+class RowSerializationCache:
+    """线程安全的 LRU：key 为 (表名, 主键)，值为 (版本, 过期时间, to_dict 结果, JSON bytes)"""
+
+    def __init__(self, maxsize: int = ROW_CACHE_SIZE, ttl: float = ROW_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Tuple[str, Any], Tuple[Any, float, Dict[str, Any], Optional[bytes]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(row) -> Tuple[str, Any]:
+        return row.__tablename__, row.id
+
+    @staticmethod
+    def _version(row):
+        # 没有 updated_at 的行以 created_at 作为版本
+        return getattr(row, 'updated_at', None) or getattr(row, 'created_at', None)
+
+    def _lookup(self, row):
+        key, version = self._key(row), self._version(row)
+        if key[1] is None or version is None:
+            return key, version, None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                return key, version, entry
+        return key, version, None
+
+    def _store(self, key, version, data, body, expires_at=None):
+        if key[1] is None or version is None or self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            # 补写 JSON bytes 时沿用原条目的过期时间，避免常被访问的条目一直不过期
+            self._entries[key] = (version, expires_at or time.monotonic() + self.ttl, data, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def as_dict(self, row) -> Dict[str, Any]:
+        """返回 row.to_dict() 的浅拷贝（调用方可以安全地追加字段）"""
+        key, version, entry = self._lookup(row)
+        self._count(key[0], entry is not None)
+        if entry is None:
+            data = row.to_dict()
+            self._store(key, version, data, None)
+            return dict(data)
+        return dict(entry[2])
+
+    def as_json(self, row) -> bytes:
+        """返回 row.to_dict() 编码后的 JSON bytes"""
+        key, version, entry = self._lookup(row)
+        self._count(key[0], entry is not None and entry[3] is not None)
+        if entry is not None and entry[3] is not None:
+            return entry[3]
+        if entry is not None:
+            data, expires_at = entry[2], entry[1]
+        else:
+            data, expires_at = row.to_dict(), None
+        body = dumps_bytes(data)
+        self._store(key, version, data, body, expires_at)
+        return body
+
+    @staticmethod
+    def _count(table: str, hit: bool):
+        # 按请求汇总后写入 metrics，避免列表接口每行都争用 metrics 的锁
+        counts = _request_counts()
+        if counts is None:
+            metrics.inc('row_serialization_cache_total', table=table, result='hit' if hit else 'miss')
+        else:
+            counts[(table, hit)] = counts.get((table, hit), 0) + 1
+
+    def invalidate(self, table: str, row_id):
+        with self._lock:
+            self._entries.pop((table, row_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+row_cache = RowSerializationCache()
+_local = threading.local()
+
+
+def _request_counts() -> Optional[Dict[Tuple[str, bool], int]]:
+    return getattr(_local, 'counts', None)
+
+
+class _batch_counts:
+    """在 with 块内累计缓存命中次数，结束时一次性写入 metrics"""
+
+    def __enter__(self):
+        _local.counts = {}
+
+    def __exit__(self, *exc):
+        counts, _local.counts = _local.counts, None
+        for (table, hit), amount in counts.items():
+            metrics.inc('row_serialization_cache_total', amount, table=table, result='hit' if hit else 'miss')
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_flushed_rows(session, flush_context):
+    """ORM 写入 / 删除后立即清除缓存条目，不依赖 updated_at 的时间精度"""
+    for row in list(session.dirty) + list(session.deleted):
+        if getattr(row, 'to_dict', None) is not None and getattr(row, '__tablename__', None):
+            row_cache.invalidate(row.__tablename__, getattr(row, 'id', None))
+
+
+def rows_response(rows: Iterable, status: int = 200):
+    """把多行的缓存 JSON 片段拼接为 JSON 数组响应"""
+    with _batch_counts():
+        body = b'[' + b','.join(row_cache.as_json(row) for row in rows) + b']\n'
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+def dicts_for(rows: Iterable) -> List[Dict[str, Any]]:
+    """多行的 to_dict() 结果（浅拷贝），用于需要追加字段的列表接口"""
+    with _batch_counts():
+        return [row_cache.as_dict(row) for row in rows]
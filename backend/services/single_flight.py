@@ -0,0 +1,45 @@
+"""
+请求合并（single-flight）工具：相同 key 的并发调用只执行一次，其余调用方等待同一个结果。
+"""
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """按 key 合并进行中的调用，适用于同一 worker 内的多线程场景。
+
+    第一个到达的调用方负责执行 fn，并将结果（或异常）写入共享的 Future；
+    在其完成之前到达的相同 key 的调用方直接等待该 Future，不会重复执行。
+    调用完成后 key 即被移除，后续调用会重新执行（本类不做结果缓存）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """执行 fn 或等待进行中的同 key 调用，返回其结果。"""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn())
+        except BaseException as exc:
+            future.set_exception(exc)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return future.result()
+
+    def inflight_count(self) -> int:
+        """返回当前进行中的调用数量。"""
+        with self._lock:
+            return len(self._inflight)
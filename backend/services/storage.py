@@ -0,0 +1,582 @@
+"""
+统一的图片存储层与对象存储流式上传。
+
+get_storage(name) 返回当前应用的存储后端（local / oss / kodo），接口一致：
+put / put_file / upload_stream / put_many / delete / delete_many / exists / url。
+OSS、Kodo 的客户端与 HTTP 连接池在应用内长期复用，不再每个请求重新创建。
+
+对象存储流式上传：请求体边读边上传到阿里云 OSS / 七牛云 Kodo，不写本地临时文件。
+
+- 文件不超过一个分片（part_size）时单次上传；
+- 更大的文件切换为分片上传，最多 max_workers 个分片并发上传，内存占用约为 part_size × (max_workers + 1)；
+- 读取过程中同时计算 sha256 和大小，超过 max_size 时中止并返回 413。
+
+multipart/form-data 请求通过 werkzeug 的增量解析器读取，文件字段之前的普通字段（如 folder）可用，
+文件之后的字段会被忽略；也可以直接把文件作为请求体上传（Content-Type 为图片类型，?filename= 指定文件名）。
+"""
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.security import safe_join
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PART_SIZE = int(os.getenv('STORAGE_PART_SIZE_MB', 8)) * 1024 * 1024
+DEFAULT_UPLOAD_WORKERS = int(os.getenv('STORAGE_UPLOAD_WORKERS', 4))
+# 流式上传接口允许的最大文件大小（不受全局 MAX_CONTENT_LENGTH 限制）
+MAX_UPLOAD_SIZE = int(os.getenv('STORAGE_MAX_UPLOAD_MB', 512)) * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+# OSS / Kodo 客户端 HTTP 连接池大小
+STORAGE_POOL_SIZE = int(os.getenv('STORAGE_POOL_SIZE', 16))
+# OSS DeleteMultipleObjects 与七牛 batch 接口单次最多 1000 个对象
+BATCH_DELETE_SIZE = 1000
+
+
+class HashingReader:
+    """包装输入流，读取时累计大小并计算 sha256；超过 max_size 时抛出 RequestEntityTooLarge"""
+
+    def __init__(self, raw, max_size: Optional[int] = None):
+        self.raw = raw
+        self.max_size = max_size
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        if data:
+            self.size += len(data)
+            if self.max_size is not None and self.size > self.max_size:
+                raise RequestEntityTooLarge()
+            self._sha256.update(data)
+        return data
+
+    def read_exact(self, size: int) -> bytes:
+        """读取 size 字节，只有到达末尾时才返回更短的数据"""
+        chunks, remaining = [], size
+        while remaining > 0:
+            data = self.read(min(remaining, READ_CHUNK_SIZE * 16))
+            if not data:
+                break
+            chunks.append(data)
+            remaining -= len(data)
+        return b''.join(chunks)
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+
+class FormFileStream:
+    """从 multipart/form-data 请求体中流式读取指定文件字段的内容"""
+
+    def __init__(self, stream, boundary: bytes, field_name: str = 'file', max_form_memory_size: int = 500 * 1024):
+        self.stream = stream
+        self.decoder = MultipartDecoder(boundary, max_form_memory_size)
+        self.form = MultiDict()
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self._buffer = bytearray()
+        self._finished = False
+        self._seek_file(field_name)
+
+    def _feed(self):
+        data = self.stream.read(READ_CHUNK_SIZE)
+        self.decoder.receive_data(data or None)
+
+    def _seek_file(self, field_name: str):
+        current_field, field_data = None, bytearray()
+        while True:
+            event = self.decoder.next_event()
+            if isinstance(event, NeedData):
+                self._feed()
+            elif isinstance(event, File) and event.name == field_name:
+                self.filename = event.filename
+                self.content_type = event.headers.get('Content-Type')
+                return
+            elif isinstance(event, (Field, File)):
+                current_field, field_data = event, bytearray()
+            elif isinstance(event, Data):
+                if isinstance(current_field, Field):
+                    field_data += event.data
+                    if not event.more_data:
+                        self.form.add(current_field.name, field_data.decode('utf-8', 'replace'))
+            elif isinstance(event, Epilogue):
+                raise BadRequest(f'缺少文件字段: {field_name}')
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._finished and (size < 0 or len(self._buffer) < size):
+            event = self.decoder.next_event()
+            if isinstance(event, NeedData):
+                self._feed()
+            elif isinstance(event, Data):
+                self._buffer += event.data
+                if not event.more_data:
+                    self._finished = True
+            elif isinstance(event, Epilogue):
+                self._finished = True
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def open_upload_stream(request, field_name: str = 'file', max_size: Optional[int] = None
+                       ) -> Tuple[Optional[str], Optional[str], MultiDict, HashingReader]:
+    """
+    返回 (文件名, 文件 Content-Type, 文件字段之前的表单字段, 文件内容读取器)。
+    调用前不要访问 request.form / request.files，否则请求体会被完整解析到临时文件。
+    """
+    mimetype, options = parse_options_header(request.headers.get('Content-Type', ''))
+    if mimetype == 'multipart/form-data':
+        boundary = options.get('boundary')
+        if not boundary:
+            raise BadRequest('缺少 multipart boundary')
+        form_file = FormFileStream(request.stream, boundary.encode('latin-1'), field_name)
+        return form_file.filename, form_file.content_type, form_file.form, HashingReader(form_file, max_size)
+    filename = request.args.get('filename') or request.headers.get('X-Filename')
+    return filename, mimetype or None, MultiDict(request.args), HashingReader(request.stream, max_size)
+
+
+@dataclass
+class UploadResult:
+    key: str
+    size: int
+    sha256: str
+    etag: Optional[str]
+    parts: int
+
+
+class StreamUploader(ABC):
+    """流式上传的公共流程，子类实现单次上传和分片上传的具体接口"""
+
+    def __init__(self, part_size: Optional[int] = None, max_workers: Optional[int] = None):
+        self.part_size = part_size or DEFAULT_PART_SIZE
+        self.max_workers = max(1, max_workers or DEFAULT_UPLOAD_WORKERS)
+
+    def upload_stream(self, key: str, reader: HashingReader, content_type: Optional[str] = None) -> UploadResult:
+        first = reader.read_exact(self.part_size)
+        if len(first) < self.part_size:
+            etag = self._put_single(key, first, content_type)
+            return UploadResult(key, reader.size, reader.sha256, etag, 1)
+
+        upload_id = self._init_multipart(key, content_type)
+        parts: List[Tuple[int, str]] = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='storage-part') as pool:
+                inflight = deque()
+                part_number, data = 1, first
+                while data:
+                    # 达到并发上限时等待最早的分片完成，限制缓冲的分片数
+                    if len(inflight) >= self.max_workers:
+                        number, future = inflight.popleft()
+                        parts.append((number, future.result()))
+                    inflight.append((part_number, pool.submit(self._upload_part, key, upload_id, part_number, data)))
+                    part_number += 1
+                    data = reader.read_exact(self.part_size)
+                for number, future in inflight:
+                    parts.append((number, future.result()))
+            etag = self._complete_multipart(key, upload_id, parts, content_type)
+        except BaseException:
+            try:
+                self._abort_multipart(key, upload_id)
+            except Exception as e:
+                logger.warning(f"取消分片上传失败 {key}: {e}")
+            raise
+        return UploadResult(key, reader.size, reader.sha256, etag, len(parts))
+
+    @abstractmethod
+    def _put_single(self, key: str, data: bytes, content_type: Optional[str]) -> Optional[str]:
+        """单次上传整个文件，返回 etag"""
+
+    @abstractmethod
+    def _init_multipart(self, key: str, content_type: Optional[str]) -> str:
+        """创建分片上传，返回 upload_id"""
+
+    @abstractmethod
+    def _upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """上传一个分片，返回该分片的 etag"""
+
+    @abstractmethod
+    def _complete_multipart(self, key: str, upload_id: str, parts: List[Tuple[int, str]],
+                            content_type: Optional[str]) -> Optional[str]:
+        """合并全部分片，返回对象 etag"""
+
+    @abstractmethod
+    def _abort_multipart(self, key: str, upload_id: str):
+        """取消分片上传并清理已上传的分片"""
+
+
+class OSSStreamUploader(StreamUploader):
+    """阿里云 OSS：put_object / init_multipart_upload + upload_part + complete_multipart_upload"""
+
+    def __init__(self, bucket, part_size: Optional[int] = None, max_workers: Optional[int] = None):
+        super().__init__(part_size, max_workers)
+        self.bucket = bucket
+
+    @staticmethod
+    def _headers(content_type: Optional[str]) -> Optional[Dict[str, str]]:
+        return {'Content-Type': content_type} if content_type else None
+
+    def _put_single(self, key, data, content_type):
+        return self.bucket.put_object(key, data, headers=self._headers(content_type)).etag
+
+    def _init_multipart(self, key, content_type):
+        return self.bucket.init_multipart_upload(key, headers=self._headers(content_type)).upload_id
+
+    def _upload_part(self, key, upload_id, part_number, data):
+        return self.bucket.upload_part(key, upload_id, part_number, data).etag
+
+    def _complete_multipart(self, key, upload_id, parts, content_type):
+        from oss2.models import PartInfo
+
+        part_infos = [PartInfo(number, etag) for number, etag in sorted(parts)]
+        return self.bucket.complete_multipart_upload(key, upload_id, part_infos).etag
+
+    def _abort_multipart(self, key, upload_id):
+        self.bucket.abort_multipart_upload(key, upload_id)
+
+
+class KodoStreamUploader(StreamUploader):
+    """
+    七牛云 Kodo：小文件使用表单上传，大文件使用分片上传 v2 接口
+    （/buckets/<bucket>/objects/<EncodedKey>/uploads）。
+    """
+
+    def __init__(self, auth, bucket_name: str, up_host: str, session=None, part_size: Optional[int] = None,
+                 max_workers: Optional[int] = None, expires: int = 3600):
+        super().__init__(part_size, max_workers)
+        import requests
+
+        self.auth = auth
+        self.bucket_name = bucket_name
+        self.up_host = up_host.rstrip('/')
+        self.session = session or requests.Session()
+        self.expires = expires
+
+    def _token(self, key: str) -> str:
+        return self.auth.upload_token(self.bucket_name, key, self.expires)
+
+    def _uploads_url(self, key: str, *segments) -> str:
+        encoded_key = base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+        return '/'.join([f'{self.up_host}/buckets/{self.bucket_name}/objects/{encoded_key}/uploads', *map(str, segments)])
+
+    def _request(self, method: str, url: str, key: str, **kwargs) -> dict:
+        headers = kwargs.pop('headers', {})
+        headers['Authorization'] = f'UpToken {self._token(key)}'
+        response = self.session.request(method, url, headers=headers, timeout=300, **kwargs)
+        response.raise_for_status()
+        return response.json() if response.content else {}
+
+    def _put_single(self, key, data, content_type):
+        response = self.session.post(self.up_host, data={'token': self._token(key), 'key': key},
+                                     files={'file': (key.rsplit('/', 1)[-1], data,
+                                                     content_type or 'application/octet-stream')}, timeout=300)
+        response.raise_for_status()
+        return response.json().get('hash')
+
+    def _init_multipart(self, key, content_type):
+        return self._request('POST', self._uploads_url(key), key)['uploadId']
+
+    def _upload_part(self, key, upload_id, part_number, data):
+        return self._request('PUT', self._uploads_url(key, upload_id, part_number), key, data=data,
+                             headers={'Content-Type': 'application/octet-stream'})['etag']
+
+    def _complete_multipart(self, key, upload_id, parts, content_type):
+        body = {'parts': [{'partNumber': number, 'etag': etag} for number, etag in sorted(parts)]}
+        if content_type:
+            body['mimeType'] = content_type
+        return self._request('POST', self._uploads_url(key, upload_id), key, json=body).get('hash')
+
+    def _abort_multipart(self, key, upload_id):
+        self._request('DELETE', self._uploads_url(key, upload_id), key)
+
+
+class Storage(ABC):
+    """存储后端基类：子类必须实现 upload_stream / delete / exists / url（缺少时实例化即报错），批量操作有默认实现"""
+
+    name = ''
+
+    @abstractmethod
+    def upload_stream(self, key: str, reader: HashingReader, content_type: Optional[str] = None) -> UploadResult:
+        """从 reader 流式写入对象"""
+
+    def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> UploadResult:
+        return self.upload_stream(key, HashingReader(io.BytesIO(data)), content_type)
+
+    def put_file(self, key: str, path: str, content_type: Optional[str] = None) -> UploadResult:
+        with open(path, 'rb') as f:
+            return self.upload_stream(key, HashingReader(f), content_type)
+
+    def _put_source(self, key: str, source, content_type: Optional[str] = None) -> UploadResult:
+        """source 可以是 bytes、本地文件路径或可读的文件对象（如 werkzeug FileStorage）"""
+        if isinstance(source, (bytes, bytearray)):
+            return self.put(key, bytes(source), content_type)
+        if isinstance(source, (str, os.PathLike)):
+            return self.put_file(key, os.fspath(source), content_type)
+        content_type = content_type or getattr(source, 'mimetype', None)
+        return self.upload_stream(key, HashingReader(getattr(source, 'stream', source)), content_type)
+
+    def put_many(self, items: Iterable[Tuple[str, object]], max_workers: Optional[int] = None) -> List[UploadResult]:
+        """并发上传多个 (key, source)，按输入顺序返回结果；任一失败时抛出第一个异常"""
+        items = list(items)
+        if len(items) <= 1:
+            return [self._put_source(key, source) for key, source in items]
+        workers = min(len(items), max_workers or DEFAULT_UPLOAD_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'storage-{self.name}') as pool:
+            futures = [pool.submit(self._put_source, key, source) for key, source in items]
+            return [future.result() for future in futures]
+
+    @abstractmethod
+    def delete(self, key: str):
+        """删除对象，对象不存在时不报错"""
+
+    def delete_many(self, keys: Iterable[str]) -> List[str]:
+        """删除多个对象，返回已删除的 key"""
+        deleted = []
+        for key in keys:
+            self.delete(key)
+            deleted.append(key)
+        return deleted
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """对象是否存在"""
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        """对象的访问地址"""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """对象对应的本地文件路径，只有本地存储返回非空值"""
+        return None
+
+
+class LocalStorage(Storage):
+    """本地文件系统存储（开发、测试环境和 uploads/ 目录），url 为 url_prefix/key"""
+
+    name = 'local'
+
+    def __init__(self, root: str, url_prefix: str = '/uploads'):
+        self.root = os.path.abspath(root)
+        self.url_prefix = url_prefix.rstrip('/')
+
+    def _path(self, key: str) -> str:
+        path = safe_join(self.root, key)
+        if path is None:
+            raise ValueError(f'非法的存储路径: {key}')
+        return path
+
+    def upload_stream(self, key, reader, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子替换，读取方不会看到写了一半的文件
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    data = reader.read(READ_CHUNK_SIZE)
+                    if not data:
+                        break
+                    f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return UploadResult(key, reader.size, reader.sha256, None, 1)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def url(self, key):
+        return f'{self.url_prefix}/{key}'
+
+    def local_path(self, key):
+        return self._path(key)
+
+
+class OSSStorage(Storage):
+    """阿里云 OSS：Bucket 与 oss2.Session 连接池在实例内复用"""
+
+    name = 'oss'
+
+    def __init__(self, access_key_id: str, access_key_secret: str, endpoint: str, bucket_name: str,
+                 pool_size: Optional[int] = None, part_size: Optional[int] = None, max_workers: Optional[int] = None):
+        import oss2
+
+        self.endpoint = endpoint
+        self.bucket_name = bucket_name
+        self.session = oss2.Session(pool_size=pool_size or STORAGE_POOL_SIZE)
+        self.bucket = oss2.Bucket(oss2.Auth(access_key_id, access_key_secret), endpoint, bucket_name,
+                                  session=self.session)
+        self.uploader = OSSStreamUploader(self.bucket, part_size, max_workers)
+
+    @classmethod
+    def from_env(cls) -> 'OSSStorage':
+        access_key_id = os.getenv('OSS_ACCESS_KEY_ID')
+        access_key_secret = os.getenv('OSS_ACCESS_KEY_SECRET')
+        endpoint = os.getenv('OSS_ENDPOINT')
+        bucket_name = os.getenv('OSS_BUCKET_NAME')
+        if not all([access_key_id, access_key_secret, endpoint, bucket_name]):
+            raise ValueError("OSS配置不完整，请检查环境变量")
+        return cls(access_key_id, access_key_secret, endpoint, bucket_name)
+
+    def upload_stream(self, key, reader, content_type=None):
+        return self.uploader.upload_stream(key, reader, content_type)
+
+    def delete(self, key):
+        self.bucket.delete_object(key)
+
+    def delete_many(self, keys):
+        keys, deleted = list(keys), []
+        for start in range(0, len(keys), BATCH_DELETE_SIZE):
+            deleted.extend(self.bucket.batch_delete_objects(keys[start:start + BATCH_DELETE_SIZE]).deleted_keys)
+        return deleted
+
+    def exists(self, key):
+        return self.bucket.object_exists(key)
+
+    def url(self, key):
+        # 移除 endpoint 的 http(s):// 前缀
+        endpoint = self.endpoint.split('://', 1)[-1]
+        return f"https://{self.bucket_name}.{endpoint}/{key}"
+
+
+class KodoStorage(Storage):
+    """
+    七牛云 Kodo：上传使用带连接池的 requests.Session，管理操作（stat、删除）使用同一个 BucketManager。
+    regions 为空时由 SDK 自动查询存储区域；上传地址默认取 up_host、regions 中的上传地址或 DEFAULT_UP_HOST。
+    """
+
+    name = 'kodo'
+    DEFAULT_UP_HOST = 'https://upload.qiniup.com'
+    # 七牛 batch 接口中表示对象不存在的状态码
+    NOT_FOUND = 612
+
+    def __init__(self, auth, bucket_name: str, domain: Optional[str] = None, regions=None,
+                 up_host: Optional[str] = None, pool_size: Optional[int] = None,
+                 part_size: Optional[int] = None, max_workers: Optional[int] = None):
+        import requests
+        from qiniu import BucketManager
+
+        self.auth = auth
+        self.bucket_name = bucket_name
+        self.domain = domain
+        self.regions = regions
+        self.bucket_manager = BucketManager(auth, regions=regions)
+        pool_size = pool_size or STORAGE_POOL_SIZE
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if up_host is None and regions:
+            up_host = regions[0].up_host
+        self.uploader = KodoStreamUploader(auth, bucket_name, up_host or self.DEFAULT_UP_HOST, self.session,
+                                           part_size, max_workers)
+
+    @classmethod
+    def from_env(cls, domain: Optional[str] = None) -> 'KodoStorage':
+        """读取 AccessKey / SecretKey / BUCKET_NAME；私有云或测试环境可通过 KODO_UP_HOST / KODO_RS_HOST 指定接口地址"""
+        from qiniu import Auth, Region
+
+        access_key = os.getenv('AccessKey')
+        secret_key = os.getenv('SecretKey')
+        bucket_name = os.getenv('BUCKET_NAME')
+        if not access_key or not secret_key or not bucket_name:
+            raise ValueError("缺少七牛云凭证，请确认 .env 中包含 AccessKey、SecretKey、BUCKET_NAME。")
+        regions = None
+        if os.getenv('KODO_UP_HOST') or os.getenv('KODO_RS_HOST'):
+            regions = [Region(up_host=os.getenv('KODO_UP_HOST'), rs_host=os.getenv('KODO_RS_HOST'))]
+        return cls(Auth(access_key, secret_key), bucket_name, domain or os.getenv('KODO_CDN_DOMAIN'), regions)
+
+    def upload_stream(self, key, reader, content_type=None):
+        return self.uploader.upload_stream(key, reader, content_type)
+
+    def _batch(self, ops) -> list:
+        ret, info = self.bucket_manager.batch(ops)
+        if not isinstance(ret, list):
+            raise IOError(f"七牛 batch 请求失败: {getattr(info, 'error', None) or info.status_code}")
+        return ret
+
+    def stat_many(self, keys: List[str]) -> Dict[str, dict]:
+        """批量查询对象信息，返回 {key: {fsize, hash, ...}}，不存在的对象不出现在结果中"""
+        from qiniu import build_batch_stat
+
+        stats: Dict[str, dict] = {}
+        for start in range(0, len(keys), BATCH_DELETE_SIZE):
+            chunk = keys[start:start + BATCH_DELETE_SIZE]
+            for key, item in zip(chunk, self._batch(build_batch_stat(self.bucket_name, chunk))):
+                if item.get('code') == 200:
+                    stats[key] = item.get('data', {})
+        return stats
+
+    def delete(self, key):
+        _, info = self.bucket_manager.delete(self.bucket_name, key)
+        if info.status_code not in (200, self.NOT_FOUND):
+            raise IOError(f"删除七牛对象失败 {key}: {getattr(info, 'error', None) or info.status_code}")
+
+    def delete_many(self, keys):
+        from qiniu import build_batch_delete
+
+        keys, deleted = list(keys), []
+        for start in range(0, len(keys), BATCH_DELETE_SIZE):
+            chunk = keys[start:start + BATCH_DELETE_SIZE]
+            for key, item in zip(chunk, self._batch(build_batch_delete(self.bucket_name, chunk))):
+                if item.get('code') == 200:
+                    deleted.append(key)
+        return deleted
+
+    def exists(self, key):
+        return key in self.stat_many([key])
+
+    def url(self, key):
+        # 未设置域名时返回对象 key，便于后续拼接
+        return f"{self.domain.rstrip('/')}/{key}" if self.domain else key
+
+
+STORAGE_FACTORIES: Dict[str, Callable] = {
+    'local': lambda app: LocalStorage(app.config['UPLOAD_FOLDER'], '/uploads'),
+    'oss': lambda app: OSSStorage.from_env(),
+    'kodo': lambda app: KodoStorage.from_env(),
+}
+_storage_lock = threading.Lock()
+
+
+def get_storage(name: str = 'local', app=None) -> Storage:
+    """返回应用内复用的存储后端实例，首次使用时按 STORAGE_FACTORIES 创建"""
+    app = app or current_app._get_current_object()
+    storages = app.extensions.setdefault('storage', {})
+    storage = storages.get(name)
+    if storage is None:
+        with _storage_lock:
+            storage = storages.get(name)
+            if storage is None:
+                storage = storages[name] = STORAGE_FACTORIES[name](app)
+    return storage
+
+
+def set_storage(app, name: str, storage: Storage):
+    """替换应用的存储后端（测试或自定义部署时使用）"""
+    app.extensions.setdefault('storage', {})[name] = storage
@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+合成数据规模的向量检索基准测试（无需 MySQL / DashScope）
+
+生成 10k / 100k / 1M 条归一化的 1024 维向量（高斯混合分布，模拟商品图片 embedding 的聚类结构），
+对每种索引后端和查询批大小测量：构建耗时、内存增量、QPS、p50/p95/p99 延迟和 recall@k，
+并输出 JSON / CSV 结果，可通过 --baseline 与上一次的结果对比以发现性能回退。
+
+示例:
+    python test/benchmark_vector_index.py --sizes 10000,100000 --backends flat_l2,hnsw,ivf_flat
+    python test/benchmark_vector_index.py --sizes 1000000 --baseline bench_results/latest.json
+"""
+import argparse
+import csv
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+DIMENSION = 1024
+CHUNK_SIZE = 50_000
+
+
+# ---------------------------------------------------------------------------
+# 合成数据
+# ---------------------------------------------------------------------------
+
+class SyntheticDataset:
+    """按块生成的可复现数据集：同一 seed 每次生成完全相同的向量，避免常驻整份数据"""
+
+    def __init__(self, size: int, dimension: int = DIMENSION, n_clusters: int = 256,
+                 spread: float = 0.35, seed: int = 42):
+        self.size = size
+        self.dimension = dimension
+        self.seed = seed
+        self.spread = spread
+        rng = np.random.default_rng(seed)
+        centers = rng.standard_normal((n_clusters, dimension)).astype(np.float32)
+        self.centers = centers / np.linalg.norm(centers, axis=1, keepdims=True)
+
+    def _sample(self, rng, count: int) -> np.ndarray:
+        labels = rng.integers(0, len(self.centers), size=count)
+        noise = rng.standard_normal((count, self.dimension)).astype(np.float32)
+        noise *= self.spread / np.sqrt(self.dimension)
+        vectors = self.centers[labels] + noise
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+    def iter_chunks(self, chunk_size: int = CHUNK_SIZE):
+        for start in range(0, self.size, chunk_size):
+            count = min(chunk_size, self.size - start)
+            rng = np.random.default_rng((self.seed, start))
+            yield self._sample(rng, count)
+
+    def training_sample(self, count: int) -> np.ndarray:
+        parts, total = [], 0
+        for chunk in self.iter_chunks():
+            parts.append(chunk[:count - total])
+            total += len(parts[-1])
+            if total >= count:
+                break
+        return np.vstack(parts)
+
+    def queries(self, count: int) -> np.ndarray:
+        # 查询使用独立的随机流，与数据块的 (seed, start) 不会重叠
+        return self._sample(np.random.default_rng((self.seed, self.size, 0xC0FFEE)), count)
+
+
+# ---------------------------------------------------------------------------
+# 索引后端
+# ---------------------------------------------------------------------------
+
+def _ivf_nlist(size: int) -> int:
+    return int(max(16, min(65536, 4 * np.sqrt(size))))
+
+
+BACKENDS = {
+    # 当前线上使用的索引
+    'flat_l2': lambda d, n, args: faiss.IndexFlatL2(d),
+    'flat_ip': lambda d, n, args: faiss.IndexFlatIP(d),
+    'sq8': lambda d, n, args: faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2),
+    'hnsw': lambda d, n, args: faiss.IndexHNSWFlat(d, args.hnsw_m),
+    'ivf_flat': lambda d, n, args: faiss.IndexIVFFlat(faiss.IndexFlatL2(d), d, _ivf_nlist(n)),
+    'ivf_pq': lambda d, n, args: faiss.IndexIVFPQ(faiss.IndexFlatL2(d), d, _ivf_nlist(n), args.pq_m, 8),
+}
+
+
+def configure_search_params(index, args):
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = args.nprobe
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = args.ef_search
+
+
+def rss_mb() -> float:
+    """当前进程常驻内存（MB），Linux 下读取 /proc，其余平台退化为峰值 RSS"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError):
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage / 1024 / 1024 if sys.platform == 'darwin' else usage / 1024
+
+
+def build_index(name: str, dataset: SyntheticDataset, args):
+    gc.collect()
+    rss_before = rss_mb()
+    index = BACKENDS[name](dataset.dimension, dataset.size, args)
+
+    train_seconds = 0.0
+    if not index.is_trained:
+        train_size = min(dataset.size, max(args.train_size, 40 * getattr(index, 'nlist', 1)))
+        sample = dataset.training_sample(train_size)
+        start = time.perf_counter()
+        index.train(sample)
+        train_seconds = time.perf_counter() - start
+        del sample
+
+    start = time.perf_counter()
+    for chunk in dataset.iter_chunks():
+        index.add(chunk)
+    add_seconds = time.perf_counter() - start
+    gc.collect()
+    return index, {
+        'train_seconds': round(train_seconds, 4),
+        'build_seconds': round(train_seconds + add_seconds, 4),
+        'memory_mb': round(rss_mb() - rss_before, 2),
+    }
+
+
+def ground_truth(dataset: SyntheticDataset, queries: np.ndarray, k: int) -> np.ndarray:
+    """分块精确计算 L2 最近邻，作为 recall 的基准"""
+    best_d = np.full((len(queries), k), np.inf, dtype=np.float32)
+    best_i = np.full((len(queries), k), -1, dtype=np.int64)
+    offset = 0
+    for chunk in dataset.iter_chunks():
+        d, i = faiss.knn(queries, chunk, k)
+        d_all = np.hstack([best_d, d])
+        i_all = np.hstack([best_i, i + offset])
+        order = np.argsort(d_all, axis=1)[:, :k]
+        best_d = np.take_along_axis(d_all, order, axis=1)
+        best_i = np.take_along_axis(i_all, order, axis=1)
+        offset += len(chunk)
+    return best_i
+
+
+def measure_search(index, queries: np.ndarray, truth: np.ndarray, k: int, batch_size: int, warmup: int = 3):
+    for start in range(0, min(len(queries), warmup * batch_size), batch_size):
+        index.search(queries[start:start + batch_size], k)
+
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    total_start = time.perf_counter()
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        t0 = time.perf_counter()
+        _, ids = index.search(batch, k)
+        latencies.append(time.perf_counter() - t0)
+        found[start:start + len(batch)] = ids
+    total_seconds = time.perf_counter() - total_start
+
+    latencies_ms = np.array(latencies) * 1000
+    recall = np.mean([
+        len(set(found[row]) & set(truth[row])) / k for row in range(len(queries))
+    ])
+    return {
+        'qps': round(len(queries) / total_seconds, 2),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(latencies_ms, 95)), 4),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 4),
+        f'recall@{k}': round(float(recall), 4),
+    }
+
+
+# ---------------------------------------------------------------------------
+# 结果输出与对比
+# ---------------------------------------------------------------------------
+
+def environment_info(args) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'faiss': getattr(faiss, '__version__', 'unknown'),
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count(),
+        'omp_threads': faiss.omp_get_max_threads(),
+        'dimension': args.dimension,
+        'k': args.k,
+        'queries': args.queries,
+    }
+
+
+def write_results(output_dir: Path, payload: dict):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    json_path = output_dir / f'vector_bench_{stamp}.json'
+    csv_path = output_dir / f'vector_bench_{stamp}.csv'
+    json_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2))
+    (output_dir / 'latest.json').write_text(json.dumps(payload, ensure_ascii=False, indent=2))
+
+    rows = payload['results']
+    if rows:
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+    return json_path, csv_path
+
+
+def compare_with_baseline(results, baseline: dict, k: int, qps_tolerance: float, recall_tolerance: float):
+    """对比上一次结果，返回回退项列表"""
+    key = lambda r: (r['size'], r['backend'], r['batch_size'])
+    previous = {key(r): r for r in baseline.get('results', [])}
+    recall_field = f'recall@{k}'
+    regressions = []
+    for row in results:
+        old = previous.get(key(row))
+        if not old:
+            continue
+        qps_change = (row['qps'] - old['qps']) / old['qps'] if old['qps'] else 0
+        recall_change = row[recall_field] - old.get(recall_field, row[recall_field])
+        print(f"  {row['backend']:>9} n={row['size']:<8} batch={row['batch_size']:<4} "
+              f"QPS {old['qps']:>10.1f} -> {row['qps']:>10.1f} ({qps_change:+.1%})  "
+              f"{recall_field} {old.get(recall_field, 0):.4f} -> {row[recall_field]:.4f}")
+        if qps_change < -qps_tolerance or recall_change < -recall_tolerance:
+            regressions.append(row)
+    return regressions
+
+
+# ---------------------------------------------------------------------------
+# 主流程
+# ---------------------------------------------------------------------------
+
+def parse_int_list(value: str):
+    return [int(float(v)) for v in value.split(',') if v.strip()]
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='合成数据向量检索基准测试')
+    parser.add_argument('--sizes', type=parse_int_list, default=[10_000, 100_000, 1_000_000],
+                        help='数据集规模，逗号分隔，默认 10000,100000,1000000')
+    parser.add_argument('--backends', type=lambda v: [b.strip() for b in v.split(',') if b.strip()],
+                        default=list(BACKENDS), help=f"索引后端，可选: {','.join(BACKENDS)}")
+    parser.add_argument('--batch-sizes', type=parse_int_list, default=[1, 16, 64],
+                        help='查询批大小，默认 1,16,64')
+    parser.add_argument('--dimension', type=int, default=DIMENSION, help='向量维度，默认 1024')
+    parser.add_argument('--queries', type=int, default=1000, help='查询向量数量，默认 1000')
+    parser.add_argument('--k', type=int, default=10, help='recall@k 的 k，默认 10')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--nprobe', type=int, default=16, help='IVF 索引的 nprobe')
+    parser.add_argument('--ef-search', type=int, default=64, help='HNSW 的 efSearch')
+    parser.add_argument('--hnsw-m', type=int, default=32, help='HNSW 的 M')
+    parser.add_argument('--pq-m', type=int, default=64, help='IVFPQ 的子量化器数量（需整除维度）')
+    parser.add_argument('--train-size', type=int, default=100_000, help='IVF 训练样本数上限')
+    parser.add_argument('--threads', type=int, help='FAISS OpenMP 线程数，默认使用全部核心')
+    parser.add_argument('--output-dir', type=Path, default=Path(__file__).parent / 'bench_results',
+                        help='结果输出目录')
+    parser.add_argument('--baseline', type=Path, help='上一次的 JSON 结果，用于回退对比')
+    parser.add_argument('--qps-tolerance', type=float, default=0.15, help='允许的 QPS 下降比例，默认 0.15')
+    parser.add_argument('--recall-tolerance', type=float, default=0.01, help='允许的 recall 下降值，默认 0.01')
+    return parser
+
+
+def main():
+    args = create_parser().parse_args()
+    unknown = [b for b in args.backends if b not in BACKENDS]
+    if unknown:
+        raise SystemExit(f"未知的索引后端: {', '.join(unknown)}")
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+    # 先读入基线，结果输出会覆盖 latest.json
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+
+    results = []
+    print('=' * 80)
+    print(f"向量检索基准测试: 维度 {args.dimension}, 查询 {args.queries}, k={args.k}")
+    print('=' * 80)
+
+    for size in args.sizes:
+        dataset = SyntheticDataset(size, args.dimension, seed=args.seed)
+        queries = dataset.queries(args.queries)
+        print(f"\n数据规模 {size:,}: 计算精确最近邻基准...")
+        truth = ground_truth(dataset, queries, args.k)
+
+        for backend in args.backends:
+            print(f"  [{backend}] 构建索引...", end='', flush=True)
+            index, build_stats = build_index(backend, dataset, args)
+            configure_search_params(index, args)
+            print(f" {build_stats['build_seconds']:.2f}s, 内存 +{build_stats['memory_mb']:.1f}MB")
+
+            for batch_size in args.batch_sizes:
+                stats = measure_search(index, queries, truth, args.k, batch_size)
+                row = {'size': size, 'backend': backend, 'batch_size': batch_size, **build_stats, **stats}
+                results.append(row)
+                print(f"    batch={batch_size:<4} QPS={stats['qps']:>10.1f}  p50={stats['p50_ms']:.3f}ms  "
+                      f"p95={stats['p95_ms']:.3f}ms  p99={stats['p99_ms']:.3f}ms  "
+                      f"recall@{args.k}={stats[f'recall@{args.k}']:.4f}")
+            del index
+            gc.collect()
+
+    payload = {'environment': environment_info(args), 'results': results}
+    json_path, csv_path = write_results(args.output_dir, payload)
+    print(f"\n结果已写入: {json_path}\n            {csv_path}")
+
+    if baseline is not None:
+        print(f"\n与基线对比: {args.baseline}")
+        regressions = compare_with_baseline(results, baseline, args.k,
+                                            args.qps_tolerance, args.recall_tolerance)
+        if regressions:
+            print(f"\n发现 {len(regressions)} 项性能回退")
+            sys.exit(1)
+        print("\n未发现性能回退")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+以图搜图接口的端到端 HTTP 压测工具
+
+启动真实的 Flask 应用（gunicorn 多 worker/多线程，未安装 gunicorn 时退化为 werkzeug 线程服务器），
+数据库使用本地 SQLite 文件代替 MySQL，DashScope embedding 调用替换为可配置延迟的假实现，
+然后用多个并发客户端以 multipart 方式上传真实 JPEG 图片请求 POST /api/products/search，
+输出每种 worker/线程配置下的吞吐量、延迟分位数、错误率以及服务端各阶段平均耗时。
+
+示例:
+    python test/load_test_search.py --configs 1x4,2x4,4x2 --concurrency 16 --requests 400
+    python test/load_test_search.py --embed-latency 0.3 --no-cache --output load_test.json
+
+注意: 服务端仍保留 extract_feature 中调用 API 前的随机等待（0.1~0.6 秒），与线上行为一致。
+"""
+import argparse
+import importlib.util
+import io
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+import requests
+from PIL import Image
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(TEST_DIR)
+sys.path.append(BACKEND_DIR)
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+
+# 服务端进程通过环境变量接收压测参数
+ENV_EMBED_LATENCY = 'LOADTEST_EMBED_LATENCY'
+ENV_PRODUCTS = 'LOADTEST_PRODUCTS'
+ENV_IMAGES_PER_PRODUCT = 'LOADTEST_IMAGES_PER_PRODUCT'
+ENV_DIMENSION = 'LOADTEST_DIMENSION'
+ENV_UPLOAD_FOLDER = 'LOADTEST_UPLOAD_FOLDER'
+
+SEED = 20240601
+
+
+# ---------------------------------------------------------------------------
+# 服务端：应用工厂与假 embedding
+# ---------------------------------------------------------------------------
+
+class FakeEmbeddingResponse:
+    """模拟 dashscope.MultiModalEmbedding.call 的返回值"""
+
+    def __init__(self, embedding):
+        self.status_code = HTTPStatus.OK
+        self.message = ''
+        self.output = {'embeddings': [{'embedding': embedding}]}
+
+
+def install_fake_embedder(latency: float, dimension: int):
+    """把 DashScope 调用替换为固定延迟的假实现，向量由输入内容确定性生成"""
+    import dashscope
+
+    def fake_call(model, input, **kwargs):
+        time.sleep(latency)
+        payload = json.dumps(input, sort_keys=True).encode('utf-8')
+        rng = np.random.default_rng(np.frombuffer(payload[-64:].ljust(64, b'\0'), dtype=np.uint32))
+        return FakeEmbeddingResponse(rng.standard_normal(dimension).astype(np.float32).tolist())
+
+    dashscope.MultiModalEmbedding.call = staticmethod(fake_call)
+
+
+def catalog_rows(products: int, images_per_product: int, dimension: int):
+    """生成与 seed_database 对应的图片向量行（各 worker 结果完全一致）"""
+    rng = np.random.default_rng(SEED)
+    rows = []
+    image_id = 1
+    for product_id in range(1, products + 1):
+        for _ in range(images_per_product):
+            vector = rng.standard_normal(dimension).astype(np.float32)
+            vector /= np.linalg.norm(vector)
+            rows.append((image_id, product_id, f'/uploads/good_images/{image_id}.jpg', None,
+                         f'https://cdn.example.com/{image_id}.jpg', vector))
+            image_id += 1
+    return rows
+
+
+def build_app():
+    """gunicorn 入口：load_test_search:build_app()"""
+    from app import create_app
+    from product_search import VectorProductIndex
+
+    dimension = int(os.getenv(ENV_DIMENSION, 1024))
+    install_fake_embedder(float(os.getenv(ENV_EMBED_LATENCY, 0.2)), dimension)
+
+    application = create_app('testing')
+    application.config['UPLOAD_FOLDER'] = os.getenv(ENV_UPLOAD_FOLDER, tempfile.mkdtemp())
+    index = VectorProductIndex(dimension=dimension, autoload=False)
+    index.load_rows(catalog_rows(int(os.getenv(ENV_PRODUCTS, 2000)),
+                                 int(os.getenv(ENV_IMAGES_PER_PRODUCT, 3)), dimension))
+    application.config['PRODUCT_INDEX'] = index
+    return application
+
+
+def seed_database(products: int):
+    """在 TEST_DATABASE_URL 指向的数据库中建表并写入商品"""
+    from app import create_app
+    from models import db, Product
+
+    application = create_app('testing')
+    with application.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.bulk_insert_mappings(Product, [
+            {'id': i, 'name': f'压测商品{i}', 'description': '压测数据', 'price': float(i % 500),
+             'product_code': f'LT{i:06d}'}
+            for i in range(1, products + 1)
+        ])
+        db.session.commit()
+
+
+def serve_with_werkzeug(port: int):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', port, build_app(), threaded=True)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    server.serve_forever()
+
+
+# ---------------------------------------------------------------------------
+# 客户端
+# ---------------------------------------------------------------------------
+
+def make_query_images(count: int, size: int):
+    """生成若干张内容不同的 JPEG 图片（渐变 + 噪声，压缩后大小接近真实照片）"""
+    rng = np.random.default_rng(SEED + 1)
+    gradient = np.linspace(0, 255, size, dtype=np.float32)
+    images = []
+    for _ in range(count):
+        base = rng.integers(0, 255, size=3).astype(np.float32)
+        pixels = (gradient[None, :, None] * 0.5 + base * 0.5
+                  + rng.normal(0, 25, size=(size, size, 3))).clip(0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def run_clients(base_url: str, images, concurrency: int, total_requests: int, top_k: int, timeout: float):
+    """并发发送搜索请求，返回 (每个请求的 (耗时, 状态), 总耗时)"""
+    counter = iter(range(total_requests))
+    counter_lock = threading.Lock()
+    results = []
+
+    def worker():
+        session = requests.Session()
+        local = []
+        while True:
+            with counter_lock:
+                n = next(counter, None)
+            if n is None:
+                break
+            start = time.perf_counter()
+            try:
+                response = session.post(
+                    f'{base_url}/api/products/search',
+                    files={'image': (f'query_{n}.jpg', images[n % len(images)], 'image/jpeg')},
+                    data={'top_k': str(top_k)},
+                    timeout=timeout,
+                )
+                status = response.status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            local.append((time.perf_counter() - start, status))
+        session.close()
+        results.extend(local)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return results, time.perf_counter() - start
+
+
+def stage_means(metrics_text: str):
+    """从 /api/metrics 输出中计算各搜索阶段的平均耗时（毫秒）"""
+    sums, counts = {}, {}
+    pattern = re.compile(r'^search_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+    for line in metrics_text.splitlines():
+        match = pattern.match(line)
+        if match:
+            kind, stage, value = match.groups()
+            (sums if kind == 'sum' else counts)[stage] = float(value)
+    return {stage: round(sums[stage] / counts[stage] * 1000, 2) for stage in sums if counts.get(stage)}
+
+
+def summarize(results, elapsed: float):
+    latencies = np.array([latency for latency, status in results if status == 200]) * 1000
+    errors = [status for _, status in results if status != 200]
+    summary = {
+        'requests': len(results),
+        'errors': len(errors),
+        'error_rate': round(len(errors) / len(results), 4) if results else 0,
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0,
+    }
+    if len(latencies):
+        for p in (50, 90, 95, 99):
+            summary[f'p{p}_ms'] = round(float(np.percentile(latencies, p)), 1)
+        summary['max_ms'] = round(float(latencies.max()), 1)
+    if errors:
+        summary['error_kinds'] = {str(k): errors.count(k) for k in set(errors)}
+    return summary
+
+
+# ---------------------------------------------------------------------------
+# 服务进程管理
+# ---------------------------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, threads: int, port: int, env: dict, use_gunicorn: bool):
+    if use_gunicorn:
+        command = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '--threads', str(threads),
+                   '-b', f'127.0.0.1:{port}', '--timeout', '120', '--chdir', TEST_DIR,
+                   '--log-level', 'warning', 'load_test_search:build_app()']
+    else:
+        command = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port)]
+    return subprocess.Popen(command, env=env, cwd=TEST_DIR)
+
+
+def wait_ready(process, base_url: str, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'服务进程异常退出，返回码 {process.returncode}')
+        try:
+            if requests.get(f'{base_url}/api/metrics', timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.3)
+    raise TimeoutError('等待服务启动超时')
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# ---------------------------------------------------------------------------
+# 主流程
+# ---------------------------------------------------------------------------
+
+def parse_configs(value: str):
+    configs = []
+    for item in value.split(','):
+        workers, _, threads = item.strip().partition('x')
+        configs.append((int(workers), int(threads or 1)))
+    return configs
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='以图搜图接口 HTTP 压测')
+    parser.add_argument('--configs', type=parse_configs, default=[(1, 4), (2, 4), (4, 2)],
+                        help='worker x 线程 配置列表，如 1x4,2x4,4x2')
+    parser.add_argument('--concurrency', type=int, default=16, help='并发客户端数，默认 16')
+    parser.add_argument('--requests', type=int, default=200, help='每种配置的请求总数，默认 200')
+    parser.add_argument('--warmup', type=int, default=10, help='每种配置的预热请求数，默认 10')
+    parser.add_argument('--embed-latency', type=float, default=0.2, help='假 embedding 调用延迟（秒），默认 0.2')
+    parser.add_argument('--products', type=int, default=2000, help='商品数量，默认 2000')
+    parser.add_argument('--images-per-product', type=int, default=3, help='每个商品的图片数，默认 3')
+    parser.add_argument('--dimension', type=int, default=1024, help='向量维度，默认 1024')
+    parser.add_argument('--distinct-images', type=int, default=50, help='客户端轮流上传的不同图片数，默认 50')
+    parser.add_argument('--image-size', type=int, default=800, help='上传图片边长（像素），默认 800')
+    parser.add_argument('--top-k', type=int, default=10, help='请求的 top_k，默认 10')
+    parser.add_argument('--timeout', type=float, default=60, help='单个请求超时（秒），默认 60')
+    parser.add_argument('--no-cache', action='store_true', help='关闭搜索结果缓存')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'werkzeug'], default='auto',
+                        help='服务器类型，auto 时优先使用 gunicorn')
+    parser.add_argument('--output', help='将结果写入 JSON 文件')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    args = create_parser().parse_args()
+    if args.serve:
+        serve_with_werkzeug(args.port)
+        return
+
+    use_gunicorn = args.server == 'gunicorn' or (
+        args.server == 'auto' and importlib.util.find_spec('gunicorn') is not None)
+    if not use_gunicorn:
+        print('未安装 gunicorn，使用 werkzeug 线程服务器（只支持单进程）')
+
+    workdir = tempfile.mkdtemp(prefix='xiangyi-loadtest-')
+    db_url = f"sqlite:///{os.path.join(workdir, 'loadtest.db')}"
+    os.environ['TEST_DATABASE_URL'] = db_url
+    seed_database(args.products)
+    images = make_query_images(args.distinct_images, args.image_size)
+    print(f"测试数据: {args.products} 个商品, {args.products * args.images_per_product} 个向量, "
+          f"上传图片平均 {sum(map(len, images)) / len(images) / 1024:.0f}KB")
+
+    reports = []
+    try:
+        for workers, threads in args.configs:
+            if not use_gunicorn:
+                workers = 1
+            port = free_port()
+            base_url = f'http://127.0.0.1:{port}'
+            metrics_dir = tempfile.mkdtemp(dir=workdir)
+            env = dict(os.environ, **{
+                'PYTHONPATH': os.pathsep.join(filter(None, [BACKEND_DIR, os.getenv('PYTHONPATH')])),
+                'FLASK_CONFIG': 'testing',
+                'TEST_DATABASE_URL': db_url,
+                'METRICS_MULTIPROC_DIR': metrics_dir,
+                ENV_EMBED_LATENCY: str(args.embed_latency),
+                ENV_PRODUCTS: str(args.products),
+                ENV_IMAGES_PER_PRODUCT: str(args.images_per_product),
+                ENV_DIMENSION: str(args.dimension),
+                ENV_UPLOAD_FOLDER: os.path.join(workdir, 'uploads'),
+            })
+            if args.no_cache:
+                env['SEARCH_CACHE_SIZE'] = '0'
+
+            label = f'{workers}x{threads}' if use_gunicorn else 'werkzeug'
+            print(f"\n[{label}] 启动服务...")
+            process = start_server(workers, threads, port, env, use_gunicorn)
+            try:
+                wait_ready(process, base_url)
+                if args.warmup:
+                    run_clients(base_url, images, min(args.concurrency, args.warmup), args.warmup,
+                                args.top_k, args.timeout)
+                results, elapsed = run_clients(base_url, images, args.concurrency, args.requests,
+                                               args.top_k, args.timeout)
+                report = {'server': label, 'workers': workers, 'threads': threads,
+                          'concurrency': args.concurrency, **summarize(results, elapsed)}
+                try:
+                    report['stage_mean_ms'] = stage_means(requests.get(f'{base_url}/api/metrics', timeout=5).text)
+                except requests.RequestException:
+                    pass
+            finally:
+                stop_server(process)
+
+            reports.append(report)
+            print(f"  吞吐量 {report['throughput_rps']:.1f} req/s, 错误率 {report['error_rate']:.2%}, "
+                  f"p50 {report.get('p50_ms', 0):.0f}ms, p95 {report.get('p95_ms', 0):.0f}ms, "
+                  f"p99 {report.get('p99_ms', 0):.0f}ms")
+            if report.get('stage_mean_ms'):
+                print('  阶段平均耗时(ms): ' + ', '.join(f'{k}={v}' for k, v in report['stage_mean_ms'].items()))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print('\n' + '=' * 80)
+    print(f"{'配置':<10}{'吞吐(req/s)':>12}{'错误率':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for r in reports:
+        print(f"{r['server']:<10}{r['throughput_rps']:>12.1f}{r['error_rate']:>10.2%}"
+              f"{r.get('p50_ms', 0):>10.0f}{r.get('p95_ms', 0):>10.0f}{r.get('p99_ms', 0):>10.0f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'parameters': {k: v for k, v in vars(args).items() if k not in ('serve', 'port')},
+                       'results': reports}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
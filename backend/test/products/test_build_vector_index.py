@@ -0,0 +1,209 @@
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+from models import db, Product, ProductImage
+from product_search import VectorProductIndex
+from blueprints import products as products_module
+from blueprints.products import products_bp
+from services.index_build import BuildCheckpoint, IndexBuildPipeline
+
+DIMENSION = 8
+
+
+def fake_feature(path):
+    if 'broken' in path:
+        raise RuntimeError('embedding failed')
+    vector = np.random.default_rng(abs(hash(os.path.basename(path))) % 2**32).random(DIMENSION).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def parse_events(body):
+    return [json.loads(line[len('data: '):]) for line in body.splitlines() if line.startswith('data: ')]
+
+
+class TestBuildVectorIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmpdir, 'test.db')}"
+        self.app.config['UPLOAD_FOLDER'] = self.tmpdir
+        self.app.config['INDEX_BUILD_CHECKPOINT'] = os.path.join(self.tmpdir, 'checkpoint.json')
+        db.init_app(self.app)
+        self.app.register_blueprint(products_bp)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        # 商品 1~5 各两张图片；商品 6 没有图片；商品 4 的图片全部提取失败
+        for product_id in range(1, 7):
+            names = [] if product_id == 6 else [f'p{product_id}_{n}.jpg' for n in range(2)]
+            if product_id == 4:
+                names = ['broken_a.jpg', 'broken_b.jpg']
+            product_dir = os.path.join(self.tmpdir, 'good_images', str(product_id))
+            os.makedirs(product_dir, exist_ok=True)
+            for name in names:
+                with open(os.path.join(product_dir, name), 'wb') as f:
+                    f.write(b'fake')
+            urls = [f'/uploads/good_images/{product_id}/{name}' for name in names]
+            db.session.add(Product(id=product_id, name=f'商品{product_id}', price=1.0,
+                                   good_img=json.dumps(urls) if urls else '[]'))
+        db.session.commit()
+
+        self.index = VectorProductIndex(dimension=DIMENSION, autoload=False)
+        self.index.extract_feature = fake_feature
+        self.app.config['PRODUCT_INDEX'] = self.index
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_build_writes_rows_and_updates_live_index(self):
+        """测试构建后图片记录落库，且新向量立即进入内存索引"""
+        events = parse_events(self.client.get('/api/products/build-vector-index').get_data(as_text=True))
+        self.assertEqual(events[0], {'type': 'total', 'value': 6})
+        progress = {e['current_product_id']: e['status'] for e in events if e['type'] == 'progress'}
+        self.assertEqual(progress, {1: 'processed', 2: 'processed', 3: 'processed', 4: 'error',
+                                    5: 'processed', 6: 'skipped_no_images'})
+        complete = events[-1]
+        self.assertEqual(complete['type'], 'complete')
+        self.assertEqual(complete['images_indexed'], 8)
+        self.assertEqual(len(complete['errors']), 1)
+
+        self.assertEqual(ProductImage.query.count(), 8)
+        self.assertEqual(self.index.index.ntotal, 8)
+        self.assertEqual(sorted(self.index.faiss_id_to_db_id_map.tolist()),
+                         sorted(image.id for image in ProductImage.query.all()))
+        hit = self.index.search_by_feature(fake_feature('/x/p3_1.jpg'), top_k=1)[0]
+        self.assertEqual(hit['product_id'], 3)
+
+    def test_update_product_reindexes_changed_images(self):
+        """测试编辑商品图片后：移除的图片从数据库和内存索引删除，新上传的图片经构建流水线写入"""
+        self.client.get('/api/products/build-vector-index').get_data()
+        kept = ProductImage.query.filter_by(image_path='/uploads/good_images/1/p1_1.jpg').one()
+        response = self.client.put('/api/products/1', data={
+            'product': json.dumps({'name': '商品1', 'good_img': [{'url': kept.image_path, 'tag': None}]}),
+            'good_images': [(io.BytesIO(b'new'), 'new.jpg')],
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200, response.get_json())
+
+        images = ProductImage.query.filter_by(product_id=1).order_by(ProductImage.id).all()
+        self.assertEqual(len(images), 2)
+        self.assertEqual(images[0].id, kept.id)
+        self.assertTrue(images[1].image_path.startswith('/uploads/good_images/1/') and
+                        images[1].image_path.endswith('_new.jpg'))
+        self.assertEqual(self.index.index.ntotal, 8)
+        self.assertEqual(sorted(self.index.faiss_id_to_db_id_map.tolist()),
+                         sorted(image.id for image in ProductImage.query.all()))
+        hit = self.index.search_by_feature(fake_feature(images[1].original_path), top_k=1)[0]
+        self.assertEqual(hit['image_path'], images[1].image_path)
+
+    def test_candidates_use_keyset_chunks_and_anti_join(self):
+        """测试候选商品按 keyset 分块读取、使用 NOT EXISTS 反连接且只查询需要的列"""
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        original_chunk_size = products_module.INDEX_BUILD_CHUNK_SIZE
+        products_module.INDEX_BUILD_CHUNK_SIZE = 2
+        try:
+            total, candidates = products_module._index_build_candidates(0)
+            ids = [product_id for product_id, _ in candidates]
+        finally:
+            products_module.INDEX_BUILD_CHUNK_SIZE = original_chunk_size
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        self.assertEqual(total, 6)
+        self.assertEqual(ids, [1, 2, 3, 4, 5, 6])
+        selects = [s for s in statements if 'products.good_img' in s and 'count(' not in s.lower()]
+        self.assertEqual(len(selects), 4)
+        for statement in statements:
+            self.assertIn('EXISTS', statement)
+            self.assertNotIn(' IN (', statement)
+            self.assertNotIn('products.description', statement)
+
+    def test_interrupted_build_resumes_from_checkpoint(self):
+        """测试构建中断后，已完成的商品落库并记录断点，再次构建从断点继续且不重复写入"""
+        checkpoint = BuildCheckpoint(self.app.config['INDEX_BUILD_CHECKPOINT'])
+        candidates = [(pid, [(f'/uploads/good_images/{pid}/p{pid}_0.jpg', f'/x/p{pid}_0.jpg')]) for pid in (1, 2, 3)]
+        pipeline = IndexBuildPipeline(self.index, checkpoint, max_workers=1, max_pending_images=1, batch_size=1)
+        events = pipeline.run(iter(candidates), total=3)
+        next(events)  # total
+        next(events)  # 商品 1 完成
+        events.close()  # 模拟客户端断开
+
+        state = checkpoint.load()
+        self.assertEqual(state['status'], 'running')
+        self.assertGreaterEqual(state['watermark'], 1)
+        written = {image.product_id for image in ProductImage.query.all()}
+        self.assertTrue(written >= {1})
+
+        # 再次通过接口构建：从断点之后继续，最终每个商品只写入一次
+        events = parse_events(self.client.get('/api/products/build-vector-index/sse').get_data(as_text=True))
+        self.assertEqual(events[-1]['type'], 'complete')
+        processed = {e['current_product_id'] for e in events if e['type'] == 'progress'}
+        self.assertFalse(processed & written)
+        self.assertEqual(len({image.image_path for image in ProductImage.query.all()}), ProductImage.query.count())
+        self.assertEqual(checkpoint.load()['status'], 'complete')
+
+    def test_duplicate_and_existing_paths_do_not_abort_build(self):
+        """测试同一商品内重复的图片路径、已在其他商品下建立索引的路径被跳过，构建继续完成"""
+        db.session.add(ProductImage(id=100, product_id=1, image_path='/uploads/good_images/1/p1_0.jpg',
+                                    original_path='/x', vector=fake_feature('/x/p1_0.jpg').tobytes()))
+        db.session.commit()
+        checkpoint = BuildCheckpoint(self.app.config['INDEX_BUILD_CHECKPOINT'])
+        candidates = [
+            (2, [('/uploads/good_images/2/a.jpg', '/x/a.jpg'), ('/uploads/good_images/2/a.jpg', '/x/a.jpg')]),
+            (3, [('/uploads/good_images/1/p1_0.jpg', '/x/p1_0.jpg'), ('/uploads/good_images/3/b.jpg', '/x/b.jpg')]),
+        ]
+        pipeline = IndexBuildPipeline(self.index, checkpoint, max_workers=2, batch_size=32)
+        complete = list(pipeline.run(iter(candidates), total=2))[-1]
+
+        self.assertEqual(complete['type'], 'complete')
+        self.assertEqual(complete['images_indexed'], 2)
+        self.assertEqual(complete['errors'], [])
+        paths = sorted(image.image_path for image in ProductImage.query.filter(ProductImage.id != 100))
+        self.assertEqual(paths, ['/uploads/good_images/2/a.jpg', '/uploads/good_images/3/b.jpg'])
+        self.assertEqual(sorted(self.index.faiss_id_to_db_id_map.tolist()),
+                         sorted(image.id for image in ProductImage.query.filter(ProductImage.id != 100)))
+
+    def test_integrity_error_falls_back_to_per_product_inserts(self):
+        """测试批量写入冲突时逐个商品重试，只有冲突的商品记为错误"""
+        checkpoint = BuildCheckpoint(self.app.config['INDEX_BUILD_CHECKPOINT'])
+        candidates = [(pid, [(f'/uploads/good_images/{pid}/p{pid}_0.jpg', f'/x/p{pid}_0.jpg')]) for pid in (1, 2, 3)]
+        pipeline = IndexBuildPipeline(self.index, checkpoint, max_workers=1, batch_size=32)
+        real_insert = pipeline._insert_images
+
+        def insert(records):
+            # 模拟批量写入与并发写入冲突，以及商品 2 的记录单独写入时仍然冲突
+            if len(records) > 1 or records[0][0] == 2:
+                raise IntegrityError('INSERT', {}, Exception('Duplicate entry'))
+            return real_insert(records)
+
+        with mock.patch.object(pipeline, '_insert_images', side_effect=insert):
+            complete = list(pipeline.run(iter(candidates), total=3))[-1]
+
+        self.assertEqual(complete['images_indexed'], 2)
+        self.assertEqual(len(complete['errors']), 1)
+        self.assertIn('商品 2', complete['errors'][0])
+        self.assertEqual(sorted(image.product_id for image in ProductImage.query.all()), [1, 3])
+        self.assertEqual(self.index.index.ntotal, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import event
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+from models import db, Product
+from blueprints.products import products_bp
+
+BASE_TIME = datetime(2025, 1, 1, 12, 0, 0)
+
+
+class TestListProducts(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
+        db.init_app(self.app)
+        self.app.register_blueprint(products_bp)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        # 商品 1~12：每两个商品的 created_at 相同，用 id 区分先后
+        for product_id in range(1, 13):
+            db.session.add(Product(
+                id=product_id, name=f'连衣裙{product_id}' if product_id % 3 else f'外套{product_id}',
+                price=10.0 * product_id, product_code=f'XY-{product_id:03d}',
+                sales_status='sold_out' if product_id % 4 == 0 else 'on_sale',
+                good_img=json.dumps([{'url': f'/uploads/good_images/{product_id}/a.jpg', 'tag': None}]),
+                description='很长的描述' * 100, created_at=BASE_TIME + timedelta(hours=product_id // 2)))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def collect_pages(self, **params):
+        ids, cursor, pages = [], None, 0
+        while True:
+            query = dict(params, **({'cursor': cursor} if cursor else {}))
+            body = self.client.get('/api/products', query_string=query).get_json()
+            ids.extend(item['id'] for item in body['items'])
+            pages += 1
+            if not body['has_more']:
+                self.assertIsNone(body['next_cursor'])
+                return ids, pages
+            cursor = body['next_cursor']
+
+    def test_legacy_response_without_params(self):
+        response = self.client.get('/api/products')
+        data = response.get_json()
+        self.assertIsInstance(data, list)
+        self.assertEqual(len(data), 12)
+        self.assertEqual(data[0]['id'], 12)
+        self.assertIn('description', data[0])
+
+    def test_keyset_pages_cover_catalog_in_order(self):
+        ids, pages = self.collect_pages(limit=5)
+        self.assertEqual(ids, [12, 11, 10, 9, 8, 7, 6, 5, 4, 3, 2, 1])
+        self.assertEqual(pages, 3)
+
+    def test_projection_and_lightweight_items(self):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            body = self.client.get('/api/products?limit=2').get_json()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(body['items'][0], {
+            'id': 12, 'name': '外套12', 'price': 120.0, 'sale_price': None, 'product_code': 'XY-012',
+            'sales_status': 'sold_out', 'thumbnail': '/uploads/good_images/12/a.jpg',
+            'created_at': (BASE_TIME + timedelta(hours=6)).isoformat()})
+        self.assertEqual(len(statements), 1)
+        self.assertNotIn('description', statements[0])
+        self.assertIn('LIMIT', statements[0])
+
+        body = self.client.get('/api/products?fields=id,good_img&limit=1').get_json()
+        self.assertEqual(body['items'], [{'id': 12, 'good_img': [{'url': '/uploads/good_images/12/a.jpg', 'tag': None}]}])
+
+    def test_server_side_filters(self):
+        ids, _ = self.collect_pages(limit=2, q='外套', sales_status='on_sale')
+        self.assertEqual(ids, [9, 6, 3])
+        ids, _ = self.collect_pages(q='XY-00', min_price=30, max_price=60)
+        self.assertEqual(ids, [6, 5, 4, 3])
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get('/api/products?fields=id,secret').status_code, 400)
+        self.assertEqual(self.client.get('/api/products?cursor=not-a-cursor').status_code, 400)
+        self.assertEqual(self.client.get('/api/products?min_price=abc').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from flask import Flask
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+from models import db, Product
+from blueprints.products import products_bp
+from services.storage import LocalStorage, get_storage, set_storage
+
+
+class TestProductImageStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmpdir, 'test.db')}"
+        self.app.config['UPLOAD_FOLDER'] = os.path.join(self.tmpdir, 'uploads')
+        db.init_app(self.app)
+        self.app.register_blueprint(products_bp)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_add_product_saves_images_through_local_storage(self):
+        response = self.client.post('/api/products', data={
+            'product': json.dumps({'id': 7, 'name': '外套', 'price': 10}),
+            'good_images': [(io.BytesIO(b'good-1'), 'a.jpg'), (io.BytesIO(b'good-2'), 'b.png'),
+                            (io.BytesIO(b'text'), 'notes.txt')],
+            'size_images': [(io.BytesIO(b'size'), 'size.jpg')],
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200, response.get_json())
+
+        product = db.session.get(Product, 7)
+        urls = [img['url'] for img in json.loads(product.good_img)]
+        self.assertEqual(len(urls), 2)
+        storage = get_storage('local')
+        for url, content in zip(urls, (b'good-1', b'good-2')):
+            self.assertTrue(url.startswith('/uploads/good_images/7/'))
+            with open(storage.local_path(url[len('/uploads/'):]), 'rb') as f:
+                self.assertEqual(f.read(), content)
+        self.assertEqual(len(os.listdir(os.path.join(self.app.config['UPLOAD_FOLDER'], 'size_images', '7'))), 1)
+
+        # 删除图片同样经过存储层
+        key = urls[0][len('/uploads/'):]
+        response = self.client.delete(f'/api/products/images/7/{key}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(storage.exists(key))
+        self.assertEqual([img['url'] for img in response.get_json()['good_images']], urls[1:])
+        self.assertEqual(self.client.delete(f'/api/products/images/7/{key}').status_code, 404)
+
+    def test_custom_storage_backend(self):
+        other_root = os.path.join(self.tmpdir, 'other')
+        set_storage(self.app, 'local', LocalStorage(other_root, '/media'))
+        self.client.post('/api/products', data={
+            'product': json.dumps({'id': 8, 'name': '裙子', 'price': 10}),
+            'good_images': [(io.BytesIO(b'good'), 'a.jpg')],
+        }, content_type='multipart/form-data')
+        url = json.loads(db.session.get(Product, 8).good_img)[0]['url']
+        self.assertTrue(url.startswith('/media/good_images/8/'))
+        self.assertTrue(os.path.isdir(os.path.join(other_root, 'good_images', '8')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import base64
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from flask import Flask
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+from models import db, Product
+from product_search import VectorProductIndex
+from blueprints.products import products_bp
+
+DIMENSION = 8
+
+
+def unit_vector(seed):
+    vector = np.random.default_rng(seed).random(DIMENSION).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class TestSearchProducts(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+        db.init_app(self.app)
+        self.app.register_blueprint(products_bp)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        rows = []
+        for product_id in (1, 2, 3):
+            db.session.add(Product(id=product_id, name=f'商品{product_id}', price=10.0 * product_id,
+                                   description='测试描述', product_code=f'XY-{product_id}0{product_id}'))
+            for n in range(2):
+                image_id = product_id * 10 + n
+                rows.append((image_id, product_id, f'/uploads/good_images/{image_id}.jpg', None,
+                             f'https://cdn.example.com/{image_id}.jpg', unit_vector(image_id)))
+        db.session.commit()
+
+        index = VectorProductIndex(dimension=DIMENSION, autoload=False)
+        index.load_rows(rows)
+        index.extract_feature = lambda path: unit_vector(21)
+        index._embed_inputs = lambda inputs, kind: unit_vector(30)
+        self.app.config['PRODUCT_INDEX'] = index
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.app.config['UPLOAD_FOLDER'], ignore_errors=True)
+
+    def post_image(self, **form):
+        form['image'] = (io.BytesIO(b'fake-image'), 'query.jpg')
+        return self.client.post('/api/products/search', data=form, content_type='multipart/form-data')
+
+    def test_default_schema_deduplicated_by_product(self):
+        """测试默认返回字段不变，且每个商品只出现一次"""
+        response = self.post_image(top_k='6')
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()
+        self.assertEqual(results[0]['id'], 2)
+        self.assertEqual(results[0]['image_path'], '/uploads/good_images/21.jpg')
+        self.assertEqual(len({r['id'] for r in results}), len(results))
+        self.assertEqual(set(results[0]), {'id', 'name', 'description', 'price', 'similarity',
+                                          'image_path', 'original_path', 'oss_path'})
+        similarities = [r['similarity'] for r in results]
+        self.assertEqual(similarities, sorted(similarities, reverse=True))
+
+    def test_field_projection(self):
+        """测试 fields 参数只返回请求的字段"""
+        response = self.post_image(fields='id,name,price,thumbnail')
+        self.assertEqual(response.status_code, 200)
+        first = response.get_json()[0]
+        self.assertEqual(first, {'id': 2, 'name': '商品2', 'price': 20.0,
+                                 'thumbnail': 'https://cdn.example.com/21.jpg'})
+
+    def test_unknown_field_rejected(self):
+        """测试未知字段返回 400"""
+        response = self.post_image(fields='id,vector')
+        self.assertEqual(response.status_code, 400)
+
+    def test_top_k_out_of_range_rejected(self):
+        for top_k in ('0', '-3', '101', 'abc'):
+            self.assertEqual(self.post_image(top_k=top_k).status_code, 400)
+        response = self.client.post('/api/products/search', json={'query': '白色连衣裙', 'top_k': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_text_query(self):
+        """测试 JSON 文本查询通过多模态 embedding 检索图片索引"""
+        response = self.client.post('/api/products/search', json={'query': '白色连衣裙', 'fields': 'id,name'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()[0], {'id': 3, 'name': '商品3'})
+
+    def test_hybrid_mode_fuses_keyword_and_vector_scores(self):
+        """测试混合搜索：关键词命中的商品即使不在向量候选前列也会被召回并补算向量得分"""
+        response = self.post_image(mode='hybrid', keyword='xy-101', keyword_weight='1.0', vector_weight='0.1',
+                                   fields='id,score,vector_score,keyword_score,image_path')
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()
+        self.assertEqual(results[0]['id'], 1)
+        self.assertAlmostEqual(results[0]['keyword_score'], 1.0)
+        self.assertGreater(results[0]['vector_score'], 0)
+        self.assertIn(results[0]['image_path'], ('/uploads/good_images/10.jpg', '/uploads/good_images/11.jpg'))
+        scores = [r['score'] for r in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_hybrid_zero_weight_disables_score(self):
+        response = self.client.post('/api/products/search', json={
+            'query': '白色连衣裙', 'mode': 'hybrid', 'keyword': 'xy-101', 'vector_weight': 0,
+            'fields': 'id,score,keyword_score'})
+        self.assertEqual(response.status_code, 200)
+        for hit in response.get_json():
+            self.assertAlmostEqual(hit['score'], 0.3 * hit['keyword_score'])
+
+    def test_hybrid_invalid_weights_rejected(self):
+        for weights in ({'vector_weight': -1}, {'keyword_weight': 'nan'}, {'vector_weight': 'inf'},
+                        {'vector_weight': 0, 'keyword_weight': 0}):
+            response = self.client.post('/api/products/search', json={
+                'query': '白色连衣裙', 'mode': 'hybrid', 'keyword': 'xy-101', **weights})
+            self.assertEqual(response.status_code, 400, weights)
+
+    def test_hybrid_mode_requires_keyword(self):
+        response = self.post_image(mode='hybrid')
+        self.assertEqual(response.status_code, 400)
+
+    def post_outfit(self, **form):
+        """上半部分红色、下半部分蓝色的图片；假 embedding 按主色映射到商品 1 / 商品 3 的图片向量"""
+        pixels = np.zeros((60, 40, 3), dtype=np.uint8)
+        pixels[:30, :, 0] = 255
+        pixels[30:, :, 2] = 255
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG')
+
+        def fake_embed(inputs, kind):
+            data = base64.b64decode(inputs[0]['image'].split(',', 1)[1])
+            red, _, blue = np.asarray(Image.open(io.BytesIO(data))).reshape(-1, 3).mean(axis=0)
+            if red > 200:
+                return unit_vector(11)
+            if blue > 200:
+                return unit_vector(31)
+            return unit_vector(21)
+
+        self.app.config['PRODUCT_INDEX']._embed_inputs = fake_embed
+        data = {'mode': 'multi_crop', 'grid': '2x1', 'overlap': '0', **form}
+        data['image'] = (io.BytesIO(buffer.getvalue()), 'outfit.jpg')
+        return self.client.post('/api/products/search', data=data, content_type='multipart/form-data')
+
+    def test_multi_crop_grouped(self):
+        """测试多裁剪搜索按裁剪分组返回：整图与上下两块分别命中不同商品"""
+        response = self.post_outfit(top_k='2', fields='id')
+        self.assertEqual(response.status_code, 200)
+        groups = response.get_json()
+        self.assertEqual([g['crop'] for g in groups], ['full', 'r0c0', 'r1c0'])
+        self.assertEqual(groups[1]['box'], [0, 0, 40, 30])
+        self.assertEqual([g['results'][0]['id'] for g in groups], [2, 1, 3])
+
+    def test_multi_crop_fused(self):
+        response = self.post_outfit(group='fused', fields='id,crop,similarity')
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()
+        self.assertEqual({(r['id'], r['crop']) for r in results}, {(1, 'r0c0'), (2, 'full'), (3, 'r1c0')})
+        self.assertTrue(all(r['similarity'] > 0.99 for r in results))
+
+    def test_multi_crop_invalid_grid(self):
+        response = self.post_outfit(grid='9x9')
+        self.assertEqual(response.status_code, 400)
+
+    def test_empty_text_query_rejected(self):
+        response = self.client.post('/api/products/search', json={'query': '  '})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import qiniu
+    from qiniu.utils import etag_stream, urlsafe_base64_decode
+except ImportError:  # 未安装 qiniu SDK 时跳过
+    qiniu = None
+
+
+class FakeKodo:
+    """本地模拟的 Kodo 表单上传（POST /）与批量 stat（POST /batch）接口"""
+
+    def __init__(self):
+        self.objects = {}
+        self.upload_calls = []
+        self.batch_calls = 0
+        self.fail_next = 0
+        self.app = Flask(__name__)
+        self.app.add_url_rule('/', 'upload', self.upload, methods=['POST'])
+        self.app.add_url_rule('/batch', 'batch', self.batch, methods=['POST'])
+        self.server = make_server('127.0.0.1', 0, self.app, threaded=True)
+        self.host = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _reply(self, payload, status=200):
+        response = jsonify(payload)
+        response.status_code = status
+        response.headers['X-Reqid'] = 'fake'
+        return response
+
+    def upload(self):
+        key = request.form['key']
+        self.upload_calls.append(key)
+        if self.fail_next:
+            self.fail_next -= 1
+            return self._reply({'error': 'service unavailable'}, 503)
+        data = request.files['file'].read()
+        self.objects[key] = data
+        return self._reply({'key': key, 'hash': etag_stream(io.BytesIO(data))})
+
+    def batch(self):
+        self.batch_calls += 1
+        results = []
+        for op in parse_qs(request.get_data(as_text=True))['op']:
+            bucket, key = urlsafe_base64_decode(op.strip('/').split('/')[1]).decode().split(':', 1)
+            if key in self.objects:
+                data = self.objects[key]
+                results.append({'code': 200, 'data': {'fsize': len(data), 'hash': etag_stream(io.BytesIO(data))}})
+            else:
+                results.append({'code': 612, 'data': {'error': 'no such file or directory'}})
+        return self._reply(results)
+
+    def close(self):
+        self.server.shutdown()
+
+
+@unittest.skipIf(qiniu is None, '未安装 qiniu SDK')
+class TestBatchUploadKodo(unittest.TestCase):
+    def setUp(self):
+        from scripts import batch_upload_kodo
+
+        self.module = batch_upload_kodo
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.root = self.tmpdir / 'shoot'
+        for relative, content in (('a/1.jpg', b'one' * 100), ('a/2.jpg', b'two' * 100), ('b/3.png', b'three'),
+                                  ('b/notes.txt', b'skip')):
+            path = self.root / relative
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+
+        self.kodo = FakeKodo()
+        self.regions = [qiniu.Region(up_host=self.kodo.host, up_host_backup=self.kodo.host, rs_host=self.kodo.host)]
+        self.manifest = batch_upload_kodo.UploadManifest(self.tmpdir / 'manifest.sqlite')
+
+    def tearDown(self):
+        self.manifest.close()
+        self.kodo.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def upload(self, **overrides):
+        kwargs = dict(root=self.root, auth=qiniu.Auth('ak', 'sk'), bucket='bucket', domain='https://cdn.example.com',
+                      prefix='raw', expires=3600, extensions=self.module.DEFAULT_EXTENSIONS, dry_run=False,
+                      manifest=self.manifest, workers=3, retries=2, regions=self.regions, report_interval=60)
+        kwargs.update(overrides)
+        return self.module.upload_files(**kwargs)
+
+    def test_concurrent_upload_and_cheap_rerun(self):
+        uploads = self.upload()
+        self.assertEqual(uploads, {'a': ['https://cdn.example.com/raw/a/1.jpg', 'https://cdn.example.com/raw/a/2.jpg'],
+                                   'b': ['https://cdn.example.com/raw/b/3.png']})
+        self.assertEqual(sorted(self.kodo.objects), ['raw/a/1.jpg', 'raw/a/2.jpg', 'raw/b/3.png'])
+        self.assertEqual(self.manifest.status_counts('bucket'), {'uploaded': 3})
+
+        # 再次运行：清单命中，不上传也不访问远端
+        self.kodo.upload_calls.clear()
+        self.assertEqual(self.upload(), uploads)
+        self.assertEqual(self.kodo.upload_calls, [])
+
+    def test_skips_remote_objects_with_matching_hash(self):
+        """清单为空时，远端已存在且哈希一致的对象跳过上传，哈希不一致的重新上传"""
+        self.kodo.objects['raw/a/1.jpg'] = b'one' * 100
+        self.kodo.objects['raw/a/2.jpg'] = b'stale'
+        self.upload()
+        self.assertEqual(sorted(self.kodo.upload_calls), ['raw/a/2.jpg', 'raw/b/3.png'])
+        self.assertEqual(self.manifest.status_counts('bucket'), {'exists': 1, 'uploaded': 2})
+        self.assertEqual(self.kodo.objects['raw/a/2.jpg'], b'two' * 100)
+
+        # 再次运行：远端已存在（exists）的文件同样命中清单，不重新计算哈希也不查询远端
+        self.kodo.upload_calls.clear()
+        self.kodo.batch_calls = 0
+        with mock.patch.object(self.module, 'etag', side_effect=AssertionError('should be cached')):
+            self.upload()
+        self.assertEqual((self.kodo.upload_calls, self.kodo.batch_calls), ([], 0))
+
+    def test_retries_with_backoff_and_resumes_failures(self):
+        self.kodo.fail_next = 1
+        uploader = self.module.KodoUploader(qiniu.Auth('ak', 'sk'), 'bucket', self.manifest, workers=1,
+                                            retries=1, backoff=0, regions=self.regions)
+        task = self.module.UploadTask(self.root / 'b' / '3.png', 'raw/b/3.png', 5, 0)
+        self.assertEqual(list(uploader.run([task])), [(task, 'uploaded')])
+        self.assertEqual(self.kodo.upload_calls, ['raw/b/3.png', 'raw/b/3.png'])
+
+        # 重试耗尽后记录为失败，下次运行重新上传
+        self.kodo.fail_next = 10
+        changed = self.root / 'a' / '1.jpg'
+        changed.write_bytes(b'changed')
+        self.upload(retries=0, workers=1)
+        self.assertEqual(self.manifest.status_counts('bucket'), {'exists': 1, 'failed': 2})
+        self.kodo.fail_next = 0
+        self.kodo.upload_calls.clear()
+        self.upload()
+        self.assertEqual(sorted(self.kodo.upload_calls), ['raw/a/1.jpg', 'raw/a/2.jpg'])
+        self.assertEqual(self.manifest.status_counts('bucket'), {'exists': 1, 'uploaded': 2})
+        self.assertEqual(self.kodo.objects['raw/a/1.jpg'], b'changed')
+
+
+if __name__ == '__main__':
+    unittest.main()
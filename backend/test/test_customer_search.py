@@ -0,0 +1,138 @@
+import os
+import sys
+import unittest
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import event, text, update
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+from models import db, Customer
+from models.customer import pinyin_keys
+from blueprints.customers import customers_bp
+from scripts.backfill_customer_pinyin import backfill, ensure_schema
+
+NAMES = ['张三', '张珊珊', '赵四', '李娜', 'Lucy王', '郑爽']
+
+
+class TestCustomerSearch(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        db.init_app(self.app)
+        self.app.register_blueprint(customers_bp)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        for index, name in enumerate(NAMES, start=1):
+            db.session.add(Customer(id=index, name=name, phone=f'1380000{index:04d}'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def search(self, **params):
+        return [c['name'] for c in self.client.get('/api/customers', query_string=params).get_json()]
+
+    def test_pinyin_keys(self):
+        self.assertEqual(pinyin_keys('张三'), ('zhangsan', 'zs'))
+        self.assertEqual(pinyin_keys('Lucy王'), ('lucywang', 'lucyw'))
+        self.assertEqual(pinyin_keys(''), ('', ''))
+
+    def test_keys_follow_name_changes(self):
+        customer = db.session.get(Customer, 4)
+        self.assertEqual((customer.name_pinyin, customer.name_initials), ('lina', 'ln'))
+        customer.name = '王五'
+        db.session.commit()
+        self.assertEqual(self.search(name='ww'), ['王五'])
+        self.assertEqual(self.search(name='lina'), [])
+
+    def test_prefix_queries(self):
+        self.assertEqual(self.search(name='zhang'), ['张珊珊', '张三'])
+        self.assertEqual(self.search(name='Zhang San'), ['张三'])
+        self.assertEqual(self.search(name='zs'), ['郑爽', '赵四', '张珊珊', '张三'])
+        self.assertEqual(self.search(name='张'), ['张珊珊', '张三'])
+        self.assertEqual(self.search(name='Lucy'), ['Lucy王'])
+        self.assertEqual(self.search(phone='13800000003'), ['赵四'])
+        self.assertEqual(self.search(name='z', phone='138000000'), ['郑爽', '赵四', '张珊珊', '张三'])
+        self.assertEqual(self.search(name='%'), [])
+        self.assertEqual(self.client.get('/api/customers').get_json()[0]['pinyin'], 'zhengshuang')
+
+    def test_chinese_query_ignores_homophones(self):
+        db.session.add(Customer(id=7, name='章丽', phone='13900000007'))
+        db.session.commit()
+        self.assertEqual(self.search(name='张'), ['张珊珊', '张三'])
+        self.assertEqual(self.search(name='章'), ['章丽'])
+        self.assertEqual(self.search(name='zhang'), ['章丽', '张珊珊', '张三'])
+
+    def test_mixed_chinese_and_latin_query(self):
+        db.session.add(Customer(id=7, name='孙丽', phone='13900000007'))
+        db.session.commit()
+        self.assertEqual(self.search(name='张s'), ['张珊珊', '张三'])
+        self.assertEqual(self.search(name='张shan'), ['张珊珊'])
+        self.assertEqual(self.search(name='孙l'), ['孙丽'])
+        self.assertEqual(self.search(name='李s'), [])
+
+    def test_filtering_happens_in_sql(self):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            self.client.get('/api/customers?name=zs&limit=2')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(len(statements), 1)
+        self.assertIn('name_initials LIKE', statements[0])
+        self.assertIn('LIMIT', statements[0])
+
+    def test_keyset_pagination(self):
+        names, cursor = [], None
+        while True:
+            params = {'limit': 4, 'name': 'z'}
+            if cursor:
+                params['cursor'] = cursor
+            body = self.client.get('/api/customers', query_string=params).get_json()
+            names.extend(c['name'] for c in body['items'])
+            if not body['has_more']:
+                self.assertIsNone(body['next_cursor'])
+                break
+            cursor = body['next_cursor']
+        self.assertEqual(names, ['郑爽', '赵四', '张珊珊', '张三'])
+        self.assertEqual(self.client.get('/api/customers?limit=abc').status_code, 400)
+
+    def test_backfill_existing_rows(self):
+        updated_at = datetime(2024, 5, 1)
+        db.session.execute(update(Customer).values(name_pinyin=None, name_initials=None, updated_at=updated_at))
+        db.session.commit()
+
+        self.assertEqual(backfill(chunk_size=4), {'scanned': 6, 'updated': 6})
+        self.assertEqual(backfill(chunk_size=4), {'scanned': 0, 'updated': 0})
+        db.session.expire_all()
+        customer = db.session.get(Customer, 2)
+        self.assertEqual((customer.name_pinyin, customer.name_initials), ('zhangshanshan', 'zss'))
+        self.assertEqual(customer.updated_at, updated_at)
+
+    def test_ensure_schema_adds_missing_columns(self):
+        db.drop_all()
+        with db.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE customers (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, '
+                              'wechat VARCHAR(100), phone VARCHAR(20) NOT NULL, default_address TEXT, '
+                              'address_history JSON, created_at DATETIME, updated_at DATETIME, '
+                              'balance NUMERIC(10, 2) NOT NULL DEFAULT 0)'))
+            conn.execute(text("INSERT INTO customers (id, name, phone, created_at, updated_at) "
+                              "VALUES (1, '李娜', '139', '2024-05-01 00:00:00', '2024-05-01 00:00:00')"))
+        self.assertEqual(ensure_schema(), {'columns': 2, 'indexes': 4})
+        self.assertEqual(ensure_schema(), {'columns': 0, 'indexes': 0})
+        backfill()
+        self.assertEqual(self.search(name='ln'), ['李娜'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+from app import create_app
+from models import db, Product, ProductImage
+from scripts.dataset_sync import DatasetManifest, DatasetSync, scan_changes
+
+
+class FakeIndex:
+    def __init__(self):
+        self.calls = []
+
+    def extract_feature(self, path):
+        self.calls.append(os.path.basename(path))
+        with Image.open(path) as image:
+            red = image.convert('RGB').getpixel((0, 0))[0]
+        return np.full(8, red, dtype=np.float32)
+
+
+def write_image(path: Path, color):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new('RGB', (32, 32), color).save(path)
+
+
+def bump_mtime(path: Path):
+    """文件系统 mtime 精度有限，测试中显式推进目录 mtime"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+class TestDatasetSync(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.root = self.tmpdir / 'dataset'
+        write_image(self.root / 'a' / '1.jpg', (10, 0, 0))
+        write_image(self.root / 'a' / '2.jpg', (20, 0, 0))
+        write_image(self.root / 'b' / 'c' / '3.jpg', (30, 0, 0))
+
+        os.environ['TEST_DATABASE_URL'] = f"sqlite:///{self.tmpdir / 'test.db'}"
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.manifest = DatasetManifest(str(self.tmpdir / 'manifest.sqlite'))
+        self.index = FakeIndex()
+        self.sync = DatasetSync(self.root, self.manifest, self.index, workers=2, rate_limit=0)
+
+    def tearDown(self):
+        self.manifest.close()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        os.environ.pop('TEST_DATABASE_URL', None)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def vectors_by_path(self):
+        return {Path(image.original_path).name: np.frombuffer(image.vector, dtype=np.float32)[0]
+                for image in ProductImage.query.all()}
+
+    def test_initial_sync_then_noop(self):
+        """测试首次同步导入全部图片，之后无变化时跳过全部目录且不调用向量服务"""
+        self.assertEqual(self.sync.sync_once()['added'], 3)
+        self.assertEqual(Product.query.count(), 3)
+        self.assertEqual(self.vectors_by_path(), {'1.jpg': 10, '2.jpg': 20, '3.jpg': 30})
+
+        self.index.calls.clear()
+        changes = scan_changes(str(self.root), self.manifest)
+        self.assertEqual((changes.added, changes.modified, changes.deleted), ([], [], []))
+        self.assertEqual(changes.dirs_listed, 0)
+        self.assertEqual(changes.dirs_pruned, 4)
+        self.sync.sync_once()
+        self.assertEqual(self.index.calls, [])
+
+    def test_add_modify_delete_and_move(self):
+        self.sync.sync_once()
+        product_ids = {Path(i.original_path).name: i.product_id for i in ProductImage.query.all()}
+        self.index.calls.clear()
+
+        write_image(self.root / 'a' / '4.jpg', (40, 0, 0))
+        write_image(self.root / 'a' / '1.jpg', (50, 0, 0))
+        os.utime(self.root / 'a' / '1.jpg', ns=(0, 10**9))
+        (self.root / 'a' / '2.jpg').unlink()
+        shutil.move(self.root / 'b' / 'c' / '3.jpg', self.root / 'b' / '3-renamed.jpg')
+        for directory in ('a', 'b', 'b/c'):
+            bump_mtime(self.root / directory)
+
+        stats = self.sync.sync_once()
+        self.assertEqual(stats['added'], 1)
+        self.assertEqual(stats['modified'], 1)
+        self.assertEqual(stats['deleted'], 1)
+        self.assertEqual(stats['moved'], 1)
+        # 只为新增和内容变化的图片调用向量服务，移动的图片沿用原向量和商品
+        self.assertEqual(sorted(self.index.calls), ['1.jpg', '4.jpg'])
+        self.assertEqual(self.vectors_by_path(), {'1.jpg': 50, '4.jpg': 40, '3-renamed.jpg': 30})
+        moved = ProductImage.query.filter(ProductImage.original_path.like('%3-renamed.jpg')).one()
+        self.assertEqual(moved.product_id, product_ids['3.jpg'])
+        self.assertEqual(moved.image_path, '/dataset-images/b/3-renamed.jpg')
+        self.assertIsNone(db.session.get(Product, product_ids['2.jpg']))
+
+    def test_touch_without_content_change_skips_embedding(self):
+        self.sync.sync_once()
+        self.index.calls.clear()
+        os.utime(self.root / 'a' / '1.jpg', ns=(0, time.time_ns() + 10**9))
+        stats = self.sync.sync_once(force_dirs={str(self.root / 'a')})
+        self.assertEqual(stats['unchanged'], 1)
+        self.assertEqual(self.index.calls, [])
+
+    def test_removed_directory_and_failed_embedding_retry(self):
+        self.sync.sync_once()
+        shutil.rmtree(self.root / 'b')
+        bump_mtime(self.root)
+        write_image(self.root / 'a' / '5.jpg', (60, 0, 0))
+        bump_mtime(self.root / 'a')
+
+        original = self.index.extract_feature
+        self.index.extract_feature = lambda path: (_ for _ in ()).throw(RuntimeError('quota exceeded'))
+        stats = self.sync.sync_once()
+        self.assertEqual(stats['deleted'], 1)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(set(self.vectors_by_path()), {'1.jpg', '2.jpg'})
+
+        # 失败的文件未写入清单，其目录 mtime 也未记录，下次同步重试
+        self.index.extract_feature = original
+        self.assertEqual(self.sync.sync_once()['added'], 1)
+        self.assertEqual(set(self.vectors_by_path()), {'1.jpg', '2.jpg', '5.jpg'})
+
+    def test_bootstraps_manifest_from_database(self):
+        """测试清单为空时根据已导入图片初始化，不重复导入"""
+        path = str(self.root / 'a' / '1.jpg')
+        product = Product(name='已导入', price=1.0)
+        product.images.append(ProductImage(image_path='/dataset-images/a/1.jpg', original_path=path,
+                                           vector=np.zeros(8, dtype=np.float32).tobytes()))
+        db.session.add(product)
+        db.session.commit()
+
+        stats = self.sync.sync_once()
+        self.assertEqual(stats['added'], 2)
+        self.assertEqual(sorted(self.index.calls), ['2.jpg', '3.jpg'])
+        self.assertEqual(ProductImage.query.filter_by(original_path=path).count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
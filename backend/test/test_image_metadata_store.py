@@ -0,0 +1,90 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+from services.image_metadata_store import ImageMetadataStore
+from product_search import VectorProductIndex
+
+
+def make_rows(count, dimension=8, start_id=1):
+    rng = np.random.default_rng(start_id)
+    rows = []
+    for offset in range(count):
+        image_id = start_id + offset
+        vector = rng.random(dimension).astype(np.float32)
+        vector /= np.linalg.norm(vector)
+        rows.append((
+            image_id,
+            1000 + image_id // 2,
+            f'/uploads/good_images/{image_id}.jpg',
+            None if image_id % 2 else f'/data/{image_id}.jpg',
+            f'https://cdn.example.com/{image_id}.jpg',
+            vector.tobytes(),
+        ))
+    return rows
+
+
+class TestImageMetadataStore(unittest.TestCase):
+    def test_load_append_remove_keeps_alignment(self):
+        """测试追加与删除后各列仍按位置对齐"""
+        store = ImageMetadataStore()
+        store.load(row[:5] for row in make_rows(4))
+        store.append(row[:5] for row in make_rows(2, start_id=10))
+        self.assertEqual(len(store), 6)
+
+        store.remove_positions(store.positions_for_image_ids([2, 10]))
+        self.assertEqual(store.image_ids.tolist(), [1, 3, 4, 11])
+        self.assertEqual(store.get(2), {
+            'id': 4,
+            'product_id': 1002,
+            'image_path': '/uploads/good_images/4.jpg',
+            'original_path': '/data/4.jpg',
+            'oss_path': 'https://cdn.example.com/4.jpg',
+        })
+        self.assertIsNone(store.get(1)['original_path'])
+
+    def test_strings_are_interned(self):
+        """测试相同路径只在字符串表中保存一次"""
+        store = ImageMetadataStore()
+        store.load([(1, 1, '/a.jpg', '/a.jpg', None), (2, 1, '/a.jpg', '/b.jpg', None)])
+        self.assertEqual(len(store.strings), 2)
+
+
+class TestVectorProductIndexInMemory(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_rows(6)
+        self.index = VectorProductIndex(dimension=8, autoload=False)
+        self.index.load_rows(self.rows)
+        self.index.extract_feature = lambda path: np.frombuffer(self.rows[3][5], dtype=np.float32)
+
+    def test_search_needs_no_database(self):
+        """测试搜索完全由内存元数据组装"""
+        results = self.index.search_similar_images('query.jpg', top_k=3)
+        self.assertEqual(results[0]['product_id'], self.rows[3][1])
+        self.assertEqual(results[0]['image_path'], self.rows[3][2])
+        self.assertEqual(results[0]['original_path'], self.rows[3][3] or self.rows[3][2])
+        self.assertIsNone(self.index._conn)
+
+    def test_incremental_add_and_remove(self):
+        """测试增量增删后 FAISS 位置与元数据保持一致"""
+        self.index.add_images(make_rows(2, start_id=20))
+        self.assertEqual(self.index.index.ntotal, 8)
+
+        removed = self.index.remove_products([self.rows[3][1]])
+        self.assertEqual(removed, 2)
+        self.assertEqual(self.index.index.ntotal, len(self.index.metadata))
+        self.assertNotIn(self.rows[3][0], self.index.faiss_id_to_db_id_map.tolist())
+
+        results = self.index.search('query.jpg', top_k=8)
+        self.assertNotIn(self.rows[3][1], [r['product_id'] for r in results])
+        for result in results:
+            row = next(r for r in self.rows + make_rows(2, start_id=20) if r[2] == result['image_path'])
+            self.assertEqual(result['product_id'], row[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import uuid
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+from app import create_app
+from services.image_variants import ImageVariantCache
+
+
+def write_image(path, size=(1200, 800), color=(200, 30, 30)):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', size, color).save(path, format='JPEG', quality=95)
+
+
+class ImageServingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['UPLOAD_FOLDER'] = os.path.join(self.tmpdir, 'uploads')
+        self.app.config['DATASET_ROOT'] = os.path.join(self.tmpdir, 'dataset')
+        self.app.config['IMAGE_VARIANT_CACHE_DIR'] = os.path.join(self.tmpdir, 'variants')
+        self.client = self.app.test_client()
+
+        self.upload_name = f'{uuid.uuid4()}_photo.jpg'
+        write_image(os.path.join(self.app.config['UPLOAD_FOLDER'], 'good_images', '1', self.upload_name))
+        write_image(os.path.join(self.app.config['DATASET_ROOT'], 'shoot', 'a.jpg'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+class TestImageVariants(ImageServingTestCase):
+    def test_resized_variant_is_cached_on_disk(self):
+        response = self.client.get('/dataset-images/shoot/a.jpg?w=256')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/jpeg')
+        self.assertEqual(Image.open(BytesIO(response.data)).size, (256, 171))
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=3600')
+        etag = response.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        cached = [os.path.join(d, f) for d, _, files in os.walk(self.app.config['IMAGE_VARIANT_CACHE_DIR']) for f in files]
+        self.assertEqual(len(cached), 1)
+        # 分片目录：<key[:2]>/<key[2:4]>/<key>.jpg
+        key = os.path.basename(cached[0])
+        self.assertTrue(cached[0].endswith(os.path.join(key[:2], key[2:4], key)))
+
+        again = self.client.get('/dataset-images/shoot/a.jpg?w=256')
+        self.assertEqual(again.headers['ETag'], etag)
+        self.assertEqual(again.data, response.data)
+
+    def test_conditional_get_and_immutable_uploads(self):
+        url = f'/uploads/good_images/1/{self.upload_name}'
+        response = self.client.get(url, query_string={'w': 128})
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+        not_modified = self.client.get(url, query_string={'w': 128},
+                                       headers={'If-None-Match': response.headers['ETag'], **PROXY_HEADERS})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.data, b'')
+
+        original = self.client.get(url)
+        self.assertEqual(original.status_code, 200)
+        self.assertNotEqual(original.headers['ETag'], response.headers['ETag'])
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': original.headers['ETag']}).status_code, 304)
+
+    def test_rejects_unknown_width_and_traversal(self):
+        self.assertEqual(self.client.get('/dataset-images/shoot/a.jpg?w=300').status_code, 400)
+        self.assertEqual(self.client.get('/uploads/../dataset/shoot/a.jpg').status_code, 404)
+
+    def test_lru_eviction_keeps_recent_variants(self):
+        source = os.path.join(self.app.config['DATASET_ROOT'], 'shoot', 'a.jpg')
+        stat = os.stat(source)
+        cache = ImageVariantCache(os.path.join(self.tmpdir, 'lru'), max_bytes=1)
+        first, _, _ = cache.get(source, stat, 128)
+        os.utime(first, (1, 1))
+        second, _, _ = cache.get(source, stat, 256)
+        # 超出上限时淘汰最久未访问的变体，刚生成的变体保留
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+        self.assertEqual(cache.total_bytes(), os.path.getsize(second))
+
+
+OFFLOAD_SECRET = 'proxy-secret'
+PROXY_HEADERS = {'X-Image-Offload': OFFLOAD_SECRET}
+
+
+class TestImageOffload(ImageServingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['IMAGE_OFFLOAD_SECRET'] = OFFLOAD_SECRET
+
+    def test_range_request_without_offload(self):
+        response = self.client.get('/dataset-images/shoot/a.jpg', headers={'Range': 'bytes=0-99'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(len(response.data), 100)
+        self.assertTrue(response.headers['Content-Range'].startswith('bytes 0-99/'))
+
+    def test_x_accel_redirect(self):
+        self.app.config['IMAGE_OFFLOAD'] = 'x-accel'
+        write_image(os.path.join(self.app.config['DATASET_ROOT'], '外套', 'b.jpg'))
+        response = self.client.get('/dataset-images/外套/b.jpg', headers={'Range': 'bytes=0-99', **PROXY_HEADERS})
+        # 只返回响应头，Range 与 Content-Length 由代理处理
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.content_length, 0)
+        self.assertEqual(response.headers['X-Accel-Redirect'],
+                         '/_protected/dataset-images/%E5%A4%96%E5%A5%97/b.jpg')
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(response.mimetype, 'image/jpeg')
+
+        variant = self.client.get(f'/uploads/good_images/1/{self.upload_name}?w=256', headers=PROXY_HEADERS)
+        self.assertTrue(variant.headers['X-Accel-Redirect'].startswith('/_protected/image-variants/'))
+        self.assertEqual(variant.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        not_modified = self.client.get('/dataset-images/外套/b.jpg',
+                                       headers={'If-None-Match': response.headers['ETag'], **PROXY_HEADERS})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertNotIn('X-Accel-Redirect', not_modified.headers)
+
+    def test_direct_request_not_offloaded(self):
+        # 直接访问后端端口（未经过代理）时即使配置了 IMAGE_OFFLOAD 也由 Flask 发送内容
+        self.app.config['IMAGE_OFFLOAD'] = 'x-accel'
+        path = os.path.join(self.app.config['UPLOAD_FOLDER'], 'good_images', '1', self.upload_name)
+        response = self.client.get(f'/uploads/good_images/1/{self.upload_name}')
+        self.assertNotIn('X-Accel-Redirect', response.headers)
+        self.assertEqual(len(response.data), os.path.getsize(path))
+
+        partial = self.client.get(f'/uploads/good_images/1/{self.upload_name}', headers={'Range': 'bytes=0-99'})
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(len(partial.data), 100)
+
+    def test_forged_or_unconfigured_header_not_offloaded(self):
+        self.app.config['IMAGE_OFFLOAD'] = 'x-accel'
+        url = f'/uploads/good_images/1/{self.upload_name}'
+        self.assertNotIn('X-Accel-Redirect', self.client.get(url, headers={'X-Image-Offload': '1'}).headers)
+        self.app.config['IMAGE_OFFLOAD_SECRET'] = ''
+        self.assertNotIn('X-Accel-Redirect', self.client.get(url, headers={'X-Image-Offload': ''}).headers)
+        self.assertNotIn('X-Accel-Redirect', self.client.get(url, headers=PROXY_HEADERS).headers)
+
+    def test_x_sendfile(self):
+        self.app.config['IMAGE_OFFLOAD'] = 'x-sendfile'
+        response = self.client.get(f'/uploads/good_images/1/{self.upload_name}', headers=PROXY_HEADERS)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['X-Sendfile'], os.path.realpath(
+            os.path.join(self.app.config['UPLOAD_FOLDER'], 'good_images', '1', self.upload_name)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import argparse
+import base64
+import io
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+from app import create_app
+from models import db, Product, ProductImage
+from product_search import VectorProductIndex
+from scripts.ingest_dataset import ParallelIngestor, iter_image_files, prepare_image
+
+
+def write_image(path: Path, color):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new('RGB', (200, 120), color).save(path)
+
+
+class TestAppImport(unittest.TestCase):
+    def test_import_does_not_build_app(self):
+        # 脚本 `from app import create_app` 时不应创建应用或加载向量索引
+        import app as app_module
+        self.assertFalse(hasattr(app_module, 'app'))
+
+
+class TestIterImageFiles(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_streams_images_depth_first(self):
+        for relative in ('b/2.jpg', 'a/z.PNG', 'a/sub/1.webp', 'top.jpeg', 'a/notes.txt'):
+            path = self.root / relative
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b'x')
+        files = iter_image_files(self.root)
+        self.assertIsInstance(files, types.GeneratorType)
+        self.assertEqual([p.relative_to(self.root).as_posix() for p in files],
+                         ['top.jpeg', 'a/z.PNG', 'a/sub/1.webp', 'b/2.jpg'])
+
+
+class TestParallelIngestor(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.root = self.tmpdir / 'dataset'
+        for n in range(5):
+            write_image(self.root / f'shoot{n % 2}' / f'{n}.jpg', (n * 40, 0, 0))
+        (self.root / 'shoot0' / 'broken.jpg').write_bytes(b'not an image')
+
+        os.environ['TEST_DATABASE_URL'] = f"sqlite:///{self.tmpdir / 'test.db'}"
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(Product(id=5, name='已有商品', price=1.0))
+        db.session.commit()
+
+        self.index = VectorProductIndex(dimension=8, autoload=False)
+        self.index._embed_inputs = lambda inputs, kind: np.ones(8, dtype=np.float32) / np.sqrt(8)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        os.environ.pop('TEST_DATABASE_URL', None)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def make_args(self, **overrides):
+        args = dict(batch_size=2, workers=2, decode_workers=2, max_side=0, rate_limit=0,
+                    report_interval=60, limit=None, reprocess=False, start_id=None)
+        args.update(overrides)
+        return argparse.Namespace(**args)
+
+    def test_bulk_insert_with_preassigned_ids(self):
+        """测试并行导入以顺延的预分配 id 批量写入，并同步追加到内存索引"""
+        created = ParallelIngestor(self.make_args(), self.root, self.index, set()).run()
+        self.assertEqual(created, 5)
+        self.assertEqual(sorted(p.id for p in Product.query.all()), [5, 6, 7, 8, 9, 10])
+        images = ProductImage.query.all()
+        self.assertEqual(len(images), 5)
+        self.assertTrue(all(image.image_path.startswith('/dataset-images/shoot') for image in images))
+        self.assertEqual(self.index.index.ntotal, 5)
+        self.assertEqual(sorted(self.index.faiss_id_to_db_id_map.tolist()), sorted(i.id for i in images))
+
+    def test_prepare_image_matches_query_preprocessing(self):
+        """测试并行导入默认与 extract_feature 使用相同的预处理，只有指定 max_side 时才缩放"""
+        path = str(self.root / 'shoot0' / '0.jpg')
+        self.assertEqual(prepare_image(path), self.index._image_to_base64(path))
+        resized = prepare_image(path, max_side=16)
+        with Image.open(io.BytesIO(base64.b64decode(resized.split(',', 1)[1]))) as image:
+            self.assertLessEqual(max(image.size), 16)
+
+    def test_skips_existing_and_validates_start_id(self):
+        existing = {str((self.root / 'shoot0' / '0.jpg').resolve())}
+        created = ParallelIngestor(self.make_args(start_id=100), self.root, self.index, existing).run()
+        self.assertEqual(created, 4)
+        self.assertEqual(min(p.id for p in Product.query.filter(Product.id != 5)), 100)
+        with self.assertRaises(SystemExit):
+            ParallelIngestor(self.make_args(start_id=3), self.root, self.index, set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+from services.lexical_index import LexicalIndex, char_ngrams
+from product_search import VectorProductIndex
+from test_image_metadata_store import make_rows
+
+
+def make_index():
+    return LexicalIndex([
+        (1, {'name': '白色连衣裙', 'product_code': 'XY-A2301', 'description': '夏季新款', 'factory_name': '杭州一厂'}),
+        (2, {'name': '黑色西装裤', 'product_code': 'XY-B1102', 'description': None, 'factory_name': '广州二厂'}),
+        (3, {'name': '白色衬衫', 'product_code': 'XY-A2399', 'description': '白色连衣裙同款面料', 'factory_name': None}),
+    ])
+
+
+class TestLexicalIndex(unittest.TestCase):
+    def test_char_ngrams(self):
+        self.assertEqual(char_ngrams('A b'), {'a', 'b', 'ab'})
+        self.assertEqual(char_ngrams(None), set())
+
+    def test_partial_product_code(self):
+        """测试货号片段匹配，完整匹配的字段得分最高"""
+        scores = make_index().search('a23')
+        self.assertEqual(set(scores), {1, 3})
+        self.assertAlmostEqual(scores[1], 1.0)
+
+    def test_field_weights_rank_name_above_description(self):
+        """测试名称命中的商品排在仅描述命中的商品之前"""
+        scores = make_index().search('白色连衣裙')
+        self.assertEqual(list(scores)[0], 1)
+        self.assertGreater(scores[1], scores[3])
+
+    def test_limit_and_no_match(self):
+        index = make_index()
+        self.assertEqual(len(index.search('白色', limit=1)), 1)
+        self.assertEqual(index.search('羽绒服'), {})
+
+
+class TestHybridSearch(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_rows(400)
+        self.index = VectorProductIndex(dimension=8, autoload=False)
+        self.index.load_rows(self.rows)
+        self.query = np.frombuffer(self.rows[0][5], dtype=np.float32)
+
+    def test_keyword_only_candidate_gets_exact_vector_score(self):
+        """测试不在向量候选中的关键词商品通过取回向量精确补算得分"""
+        vector_ids = {hit['product_id'] for hit in self.index.search_by_feature(self.query, 50)}
+        outsider = next(row[1] for row in self.rows if row[1] not in vector_ids)
+        expected = max(
+            1 / (1 + float(((np.frombuffer(row[5], dtype=np.float32) - self.query) ** 2).sum()))
+            for row in self.rows if row[1] == outsider
+        )
+
+        results = self.index.hybrid_search(self.query, {outsider: 1.0}, top_k=3,
+                                           vector_weight=0.5, keyword_weight=0.5)
+        self.assertEqual(results[0]['product_id'], outsider)
+        self.assertAlmostEqual(results[0]['vector_score'], expected, places=5)
+        self.assertAlmostEqual(results[0]['score'], 0.5 * expected + 0.5, places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
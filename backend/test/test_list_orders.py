@@ -0,0 +1,140 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import event, update
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+from models import db, Customer, Order
+from blueprints.orders import order_count_cache, orders_bp
+from services.search_cache import TTLCache
+
+BASE_TIME = datetime(2025, 3, 1, 9, 0, 0)
+
+
+class FakeRedis:
+    """多个 worker 共享的 Redis（只实现缓存用到的命令）"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, b'0')) + 1).encode()
+
+
+class TestListOrders(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        db.init_app(self.app)
+        self.app.register_blueprint(orders_bp)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        order_count_cache.clear()
+
+        db.session.add_all([Customer(id=1, name='张三', phone='13800000001'),
+                            Customer(id=2, name='李四', phone='13800000002')])
+        # 订单 1~9：每两个订单的 created_at 相同，用 id 区分先后
+        for order_id in range(1, 10):
+            db.session.add(Order(
+                id=order_id, order_number=f'ORD{order_id:03d}', customer_id=1 if order_id % 3 else 2,
+                total_amount=Decimal('10') * order_id, status='paid' if order_id % 2 else 'unpaid',
+                shipping_address='上海', products=[{'product_id': order_id, 'quantity': 1}],
+                created_at=BASE_TIME + timedelta(days=order_id // 2)))
+        db.session.commit()
+
+    def tearDown(self):
+        order_count_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def capture_statements(self, path):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            body = self.client.get(path).get_json()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return body, statements
+
+    def test_page_response_loads_customers_in_one_query(self):
+        body, statements = self.capture_statements('/api/orders?per_page=4&page=2')
+        self.assertEqual([o['id'] for o in body['orders']], [5, 4, 3, 2])
+        self.assertEqual((body['total'], body['pages'], body['current_page'], body['per_page']), (9, 3, 2, 4))
+        self.assertEqual((body['orders'][2]['customer_name'], body['orders'][2]['customer_phone']),
+                         ('李四', '13800000002'))
+        # 订单 + 客户一条查询，总数一条查询
+        self.assertEqual(len(statements), 2)
+
+        body, statements = self.capture_statements('/api/orders?per_page=4&page=3')
+        self.assertEqual([o['id'] for o in body['orders']], [1])
+        self.assertEqual(len(statements), 1)
+
+    def test_counts_cached_per_filter_and_invalidated_on_write(self):
+        self.assertEqual(self.client.get('/api/orders?status=paid').get_json()['total'], 5)
+        self.assertEqual(self.client.get('/api/orders?customer_id=2').get_json()['total'], 3)
+
+        order = db.session.get(Order, 2)
+        order.status = 'paid'
+        db.session.commit()
+        self.assertEqual(self.client.get('/api/orders?status=paid').get_json()['total'], 6)
+
+        db.session.delete(db.session.get(Order, 3))
+        db.session.commit()
+        self.assertEqual(self.client.get('/api/orders?customer_id=2').get_json()['total'], 2)
+
+        # 回滚的修改不会清空缓存
+        self.client.get('/api/orders')
+        db.session.delete(db.session.get(Order, 1))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(len(order_count_cache), 2)
+
+    def test_write_in_another_worker_invalidates_counts(self):
+        redis = FakeRedis()
+        other_worker = TTLCache(namespace='order_count')
+        with mock.patch.object(order_count_cache, '_redis', redis), mock.patch.object(other_worker, '_redis', redis):
+            self.assertEqual(self.client.get('/api/orders?status=paid').get_json()['total'], 5)
+            # 其他 worker 提交了订单写入：只递增了 Redis 中的代数，本进程的本地条目仍在
+            db.session.execute(update(Order).where(Order.id == 2).values(status='paid'))
+            db.session.commit()
+            other_worker.invalidate()
+            self.assertEqual(self.client.get('/api/orders?status=paid').get_json()['total'], 6)
+
+    def test_keyset_pages(self):
+        ids, cursor = [], None
+        while True:
+            path = '/api/orders?limit=4&status=paid' + (f'&cursor={cursor}' if cursor else '')
+            body = self.client.get(path).get_json()
+            ids.extend(o['id'] for o in body['items'])
+            self.assertEqual(body['total'], 5)
+            if not body['has_more']:
+                self.assertIsNone(body['next_cursor'])
+                break
+            cursor = body['next_cursor']
+        self.assertEqual(ids, [9, 7, 5, 3, 1])
+        self.assertEqual(body['items'][-1]['customer_name'], '张三')
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get('/api/orders?cursor=bad').status_code, 400)
+        self.assertEqual(self.client.get('/api/orders?start_date=2025/01/01').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
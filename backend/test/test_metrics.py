@@ -0,0 +1,92 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.metrics import MetricsRegistry, metrics, stage_timer, track_stages
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_histogram_rendering(self):
+        """测试直方图按累计分桶输出 Prometheus 文本"""
+        registry = MetricsRegistry(buckets=(0.01, 0.1, 1.0))
+        registry.describe('search_stage_seconds', 'histogram', 'stage latency')
+        registry.observe('search_stage_seconds', 0.005, stage='faiss')
+        registry.observe('search_stage_seconds', 0.05, stage='faiss')
+        registry.observe('search_stage_seconds', 5.0, stage='faiss')
+        registry.inc('embedding_retries_total', kind='image')
+
+        text = registry.render()
+        self.assertIn('# TYPE search_stage_seconds histogram', text)
+        self.assertIn('search_stage_seconds_bucket{stage="faiss",le="0.01"} 1', text)
+        self.assertIn('search_stage_seconds_bucket{stage="faiss",le="0.1"} 2', text)
+        self.assertIn('search_stage_seconds_bucket{stage="faiss",le="1.0"} 2', text)
+        self.assertIn('search_stage_seconds_bucket{stage="faiss",le="+Inf"} 3', text)
+        self.assertIn('search_stage_seconds_count{stage="faiss"} 3', text)
+        self.assertIn('embedding_retries_total{kind="image"} 1', text)
+
+    def test_multiprocess_aggregation(self):
+        """测试多个 worker 写入的快照会被求和"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        workers = []
+        for pid in (101, 102):
+            registry = MetricsRegistry(multiproc_dir=directory, flush_interval=60, buckets=(0.1, 1.0))
+            registry._snapshot_path = lambda pid=pid: os.path.join(directory, f'metrics_{pid}_a.json')
+            registry.observe('index_load_seconds', 0.5)
+            registry.inc('embedding_calls_total', 2, kind='image')
+            registry._maybe_flush(force=True)
+            workers.append(registry)
+
+        text = workers[0].render()
+        self.assertIn('index_load_seconds_count 2', text)
+        self.assertIn('index_load_seconds_bucket{le="1.0"} 2', text)
+        self.assertIn('embedding_calls_total{kind="image"} 4', text)
+
+    def test_exited_worker_archived(self):
+        """测试退出的 worker 并入归档后，PID 被新 worker 复用时计数不重复也不倒退"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        master = MetricsRegistry(multiproc_dir=directory, buckets=(0.1, 1.0))
+
+        def run_worker(calls):
+            registry = MetricsRegistry(multiproc_dir=directory, flush_interval=60, buckets=(0.1, 1.0))
+            registry.inc('embedding_calls_total', calls, kind='image')
+            registry.flush()
+            return registry
+
+        old_worker = run_worker(3)
+        run_worker(1)
+        master.mark_process_dead(os.getpid())
+        self.assertEqual(os.listdir(directory), ['metrics_archived.json'])
+        self.assertIn('embedding_calls_total{kind="image"} 4', master.render())
+
+        # 复用同一个 PID 的新 worker；已归档的旧快照即使还在也不会被重复计算
+        new_worker = run_worker(2)
+        old_worker.flush()
+        self.assertIn('embedding_calls_total{kind="image"} 6', new_worker.render())
+        master.mark_process_dead(os.getpid())
+        self.assertIn('embedding_calls_total{kind="image"} 6', master.render())
+
+        master.reset_multiproc_dir()
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_stage_timer_requires_tracking(self):
+        """测试未开启 track_stages 时 stage_timer 不记录数据"""
+        with stage_timer('untracked_stage'):
+            pass
+        with track_stages('test_stage_seconds'):
+            with stage_timer('tracked_stage'):
+                pass
+        histograms = metrics.snapshot()['histograms']
+        self.assertNotIn('search_stage_seconds', {
+            name for name, series in histograms.items()
+            if any(['stage', 'untracked_stage'] in key for key, _ in series)
+        })
+        self.assertIn('test_stage_seconds', histograms)
+
+
+if __name__ == '__main__':
+    unittest.main()
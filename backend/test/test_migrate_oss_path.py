@@ -0,0 +1,116 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from sqlalchemy import event
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+from app import create_app
+from models import db, Product, ProductImage
+from scripts.migrate_oss_path import OSS_BASE_URL, bulk_migrate, compute_oss_paths, generate_oss_path
+from services.index_build import BuildCheckpoint
+
+ORIGINAL_PATHS = [
+    '/Users/richardzhang/github/xiangyipackage/image-search-engine/backend/data/摄像师拍摄素材/2025.4.18海报照片/加拍照片/DSC01390.jpg',
+    '/app/data/摄像师拍摄素材/新品/外套/1.png',
+    '/mnt/other/shoot/2.jpg',
+    'single.jpg',
+    '/app/data/摄像师拍摄素材/旧/摄像师拍摄素材/3.jpg',
+]
+
+
+class TestMigrateOssPathBulk(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.environ['TEST_DATABASE_URL'] = f"sqlite:///{os.path.join(self.tmpdir, 'test.db')}"
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(Product(id=1, name='商品', price=1.0))
+        for n in range(12):
+            original = ORIGINAL_PATHS[n % len(ORIGINAL_PATHS)]
+            db.session.add(ProductImage(id=n + 1, product_id=1, image_path=f'/img/{n}.jpg', vector=b'',
+                                        original_path=original,
+                                        oss_path=f'{OSS_BASE_URL}/stale/{n}.jpg' if n == 3 else None))
+        db.session.add(ProductImage(id=13, product_id=1, image_path='/img/empty.jpg', original_path='', vector=b''))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        os.environ.pop('TEST_DATABASE_URL', None)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def oss_paths(self):
+        return {image.id: image.oss_path for image in ProductImage.query.order_by(ProductImage.id)}
+
+    def test_compiled_regex_matches_row_by_row_conversion(self):
+        rows = [(n, path, None) for n, path in enumerate(ORIGINAL_PATHS)]
+        self.assertEqual([new for _, _, new in compute_oss_paths(rows)], [generate_oss_path(p) for p in ORIGINAL_PATHS])
+        # 新旧相同的记录不产生更新
+        self.assertEqual(compute_oss_paths([(1, ORIGINAL_PATHS[1], generate_oss_path(ORIGINAL_PATHS[1]))]), [])
+
+    def test_bulk_updates_in_chunked_executemany_transactions(self):
+        statements = []
+        listener = lambda conn, cursor, statement, parameters, context, executemany: statements.append(
+            (statement, executemany))
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            stats = bulk_migrate(chunk_size=5, force=True)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        self.assertEqual(stats, {'scanned': 12, 'updated': 12, 'unchanged': 0})
+        expected = {n + 1: generate_oss_path(ORIGINAL_PATHS[n % len(ORIGINAL_PATHS)]) for n in range(12)}
+        expected[13] = None
+        self.assertEqual(self.oss_paths(), expected)
+        updates = [(sql, many) for sql, many in statements if sql.lstrip().upper().startswith('UPDATE')]
+        self.assertEqual(len(updates), 3)
+        self.assertTrue(all(many for _, many in updates))
+        selects = [sql for sql, _ in statements if 'product_images.original_path' in sql]
+        self.assertTrue(all('product_images.id >' in sql for sql in selects))
+
+    def test_dry_run_diff_and_default_skips_existing(self):
+        diff = io.StringIO()
+        stats = bulk_migrate(chunk_size=4, dry_run=True, diff_out=diff)
+        self.assertEqual(stats['updated'], 11)
+        self.assertIn(f'@@ id=2\n- \n+ {OSS_BASE_URL}/新品/外套/1.png\n', diff.getvalue())
+        self.assertNotIn('@@ id=4\n', diff.getvalue())
+        self.assertTrue(all(path is None for image_id, path in self.oss_paths().items() if image_id != 4))
+
+    def test_resumes_from_checkpoint(self):
+        checkpoint = BuildCheckpoint(os.path.join(self.tmpdir, 'checkpoint.json'))
+        checkpoint.save(6, status='running')
+        stats = bulk_migrate(chunk_size=4, force=True, checkpoint=checkpoint)
+        self.assertEqual(stats['scanned'], 6)
+        paths = self.oss_paths()
+        self.assertTrue(all(paths[i] is None for i in (1, 2, 3, 5, 6)))
+        self.assertTrue(all(paths[i] for i in range(7, 13)))
+        self.assertEqual(checkpoint.load()['status'], 'complete')
+
+
+class TestScriptImports(unittest.TestCase):
+    def test_importing_scripts_does_not_build_index(self):
+        # 新进程中（未设置 FLASK_CONFIG）导入脚本，向量索引一旦被构建就会报错
+        code = ('import product_search\n'
+                'def boom(*args, **kwargs):\n'
+                '    raise SystemExit("VectorProductIndex built on import")\n'
+                'product_search.VectorProductIndex.__init__ = boom\n'
+                'import scripts.migrate_oss_path, scripts.backfill_customer_pinyin\n')
+        env = {k: v for k, v in os.environ.items() if k != 'FLASK_CONFIG'}
+        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-c', code], cwd=backend_dir, env=env,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import json
+import os
+import sys
+import time
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+from services.search_cache import TTLCache, normalize_text_query, search_cache_key
+from product_search import VectorProductIndex
+from test_image_metadata_store import make_rows
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        """测试超过容量时淘汰最久未使用的条目"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_ttl_expiry(self):
+        """测试条目过期后不再返回"""
+        cache = TTLCache(maxsize=10, ttl=0.05)
+        cache.set('a', [1])
+        self.assertEqual(cache.get('a'), [1])
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('a'))
+
+    def test_disabled_when_size_zero(self):
+        cache = TTLCache(maxsize=0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_key_depends_on_version_and_params(self):
+        feature = np.ones(4, dtype=np.float32)
+        base = search_cache_key(feature, 'v1', top_k=10)
+        self.assertEqual(base, search_cache_key(feature.copy(), 'v1', top_k=10))
+        self.assertNotEqual(base, search_cache_key(feature, 'v2', top_k=10))
+        self.assertNotEqual(base, search_cache_key(feature, 'v1', top_k=20))
+
+
+class TestVersionedSearchCache(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_rows(6)
+        self.index = VectorProductIndex(dimension=8, autoload=False)
+        self.index.load_rows(self.rows)
+        self.query = np.frombuffer(self.rows[2][5], dtype=np.float32)
+        self.index.extract_feature = lambda path: self.query
+
+    def test_repeated_and_paginated_searches_hit_cache(self):
+        """测试重复请求及不同 top_k 的分页请求命中同一缓存条目"""
+        first = self.index.search_similar_images('q.jpg', top_k=3)
+        second = self.index.search_similar_images('q.jpg', top_k=3)
+        page = self.index.search_similar_images('q.jpg', top_k=5)
+        self.assertEqual(first, second)
+        self.assertEqual(page[:3], first)
+        self.assertEqual(self.index.result_cache.hits, 2)
+
+    def test_version_changes_invalidate(self):
+        """测试索引增删后版本号变化，旧缓存不再命中"""
+        version = self.index.index_version
+        self.index.search('q.jpg', top_k=3)
+
+        self.index.add_images(make_rows(1, start_id=50))
+        self.assertNotEqual(self.index.index_version, version)
+        self.index.search('q.jpg', top_k=3)
+        self.assertEqual(self.index.result_cache.hits, 0)
+
+        self.index.remove_images([50])
+        self.assertNotEqual(self.index.index_version, version)
+
+    def test_reload_with_same_ids_invalidates(self):
+        """测试重新加载后 id 集合不变、但 oss_path 等元数据变化时版本号同样变化，不再返回旧路径"""
+        first = self.index.search('q.jpg', top_k=1)[0]
+        version = self.index.index_version
+        rows = [row[:4] + (f'https://cdn.example.com/{row[0]}.jpg',) + row[5:] for row in self.rows]
+        self.index.load_rows(rows)
+        self.assertNotEqual(self.index.index_version, version)
+        hit = self.index.search('q.jpg', top_k=1)[0]
+        self.assertEqual(hit['product_id'], first['product_id'])
+        self.assertEqual(self.index.result_cache.hits, 0)
+        self.assertIn('cdn.example.com', json.dumps(hit))
+
+    def test_version_is_order_independent(self):
+        """测试相同内容的索引在不同加载顺序下版本号一致"""
+        other = VectorProductIndex(dimension=8, autoload=False)
+        other.load_rows(list(reversed(self.rows)))
+        self.assertEqual(other.index_version, self.index.index_version)
+
+
+class TestTextEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.rows = make_rows(6)
+        self.index = VectorProductIndex(dimension=8, autoload=False)
+        self.index.load_rows(self.rows)
+        self.calls = []
+
+        def fake_embed(inputs, kind):
+            self.calls.append((inputs, kind))
+            return np.frombuffer(self.rows[4][5], dtype=np.float32).copy()
+
+        self.index._embed_inputs = fake_embed
+
+    def test_normalize_text_query(self):
+        self.assertEqual(normalize_text_query('  白色　连衣裙 '), '白色 连衣裙')
+        self.assertEqual(normalize_text_query('ＡＢＣ  Dress'), 'abc dress')
+
+    def test_repeated_queries_skip_api(self):
+        """测试相同（规范化后）的文本查询只调用一次 embedding 接口"""
+        first = self.index.search_by_text('白色连衣裙', top_k=3)
+        second = self.index.search_by_text(' 白色连衣裙 ', top_k=3)
+        self.assertEqual(first, second)
+        self.assertEqual(first[0]['product_id'], self.rows[4][1])
+        self.assertEqual(self.calls, [([{'text': '白色连衣裙'}], 'text')])
+
+    def test_empty_query_rejected(self):
+        with self.assertRaises(ValueError):
+            self.index.search_by_text('   ')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import json
+import os
+import sys
+import time
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import update
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DASHSCOPE_API_KEY', 'test-key')
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+from app import create_app
+from models import db, Customer, Order, Product
+from services.serialization import OrjsonProvider, dumps_bytes, row_cache
+
+
+class TestOrjsonProvider(unittest.TestCase):
+    def test_matches_default_provider(self):
+        app = Flask(__name__)
+        payload = {'b': [1, 2.5, None, True], 'a': '中文', 'when': datetime(2025, 3, 1, 8, 30),
+                   'amount': Decimal('12.30')}
+        default = DefaultJSONProvider(app)
+        fast = OrjsonProvider(app)
+        self.assertEqual(json.loads(fast.dumps(payload)), json.loads(default.dumps(payload)))
+        with app.app_context():
+            response = fast.response(payload)
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(json.loads(response.data), json.loads(default.dumps(payload)))
+        self.assertEqual(fast.loads('{"x": [1, "二"]}'), {'x': [1, '二']})
+
+    def test_falls_back_for_unsupported_values(self):
+        self.assertEqual(json.loads(dumps_bytes({'big': 2 ** 70})), {'big': 2 ** 70})
+
+
+class TestRowSerializationCache(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing', load_index=False)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        row_cache.clear()
+
+        created = datetime(2025, 1, 1)
+        for product_id in range(1, 4):
+            db.session.add(Product(id=product_id, name=f'商品{product_id}', price=10.0 * product_id,
+                                   good_img=json.dumps([{'url': f'/uploads/good_images/{product_id}/a.jpg', 'tag': '正面'}]),
+                                   created_at=created + timedelta(days=product_id), updated_at=created))
+        customer = Customer(name='张三', phone='13800000000', default_address='上海')
+        db.session.add(customer)
+        db.session.flush()
+        db.session.add(Order(order_number='O1', customer_id=customer.id, total_amount=Decimal('30'),
+                             shipping_address='上海', products=[{'product_id': 1, 'quantity': 2}]))
+        db.session.commit()
+
+    def tearDown(self):
+        row_cache.clear()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_product_list_reuses_serialized_rows(self):
+        expected = [p.to_dict() for p in Product.query.order_by(Product.created_at.desc()).all()]
+        first = self.client.get('/api/products')
+        self.assertEqual(first.get_json(), expected)
+
+        with mock.patch.object(Product, 'to_dict', side_effect=AssertionError('should be cached')):
+            self.assertEqual(self.client.get('/api/products').data, first.data)
+
+    def test_orm_update_invalidates_row(self):
+        self.client.get('/api/products')
+        product = db.session.get(Product, 2)
+        product.name = '改名'
+        db.session.commit()
+        names = [item['name'] for item in self.client.get('/api/products').get_json()]
+        self.assertEqual(names, ['商品3', '改名', '商品1'])
+
+    def test_updated_at_change_from_another_writer(self):
+        self.client.get('/api/products')
+        # 绕过 ORM 会话的写入（例如其他进程）：只能依赖 updated_at 版本失效
+        db.session.execute(update(Product).where(Product.id == 1)
+                           .values(price=99.0, updated_at=datetime(2025, 6, 1)))
+        db.session.commit()
+        db.session.expire_all()
+        prices = {item['id']: item['price'] for item in self.client.get('/api/products').get_json()}
+        self.assertEqual(prices, {1: 99.0, 2: 20.0, 3: 30.0})
+
+    def test_entries_expire_after_ttl(self):
+        self.client.get('/api/products')
+        # 其他进程在同一秒内再次修改：updated_at 不变，只能靠 TTL 过期
+        db.session.execute(update(Product).where(Product.id == 1)
+                           .values(price=99.0, updated_at=datetime(2025, 1, 1)))
+        db.session.commit()
+        db.session.expire_all()
+        now = time.monotonic()
+        with mock.patch('services.serialization.time.monotonic', return_value=now + 1):
+            prices = {item['id']: item['price'] for item in self.client.get('/api/products').get_json()}
+        self.assertEqual(prices[1], 10.0)
+        with mock.patch('services.serialization.time.monotonic', return_value=now + row_cache.ttl + 1):
+            prices = {item['id']: item['price'] for item in self.client.get('/api/products').get_json()}
+        self.assertEqual(prices[1], 99.0)
+
+    def test_order_and_customer_lists_use_cached_dicts(self):
+        orders = self.client.get('/api/orders').get_json()['orders']
+        self.assertEqual(orders[0]['products'], [{'product_id': 1, 'quantity': 2}])
+        self.assertEqual(orders[0]['customer_name'], '张三')
+        customers = self.client.get('/api/customers').get_json()
+        self.assertEqual(customers[0]['pinyin'], 'zhangsan')
+        # 追加的字段不会写回缓存
+        self.assertNotIn('customer_name', row_cache.as_dict(Order.query.first()))
+        self.assertNotIn('pinyin', row_cache.as_dict(Customer.query.first()))
+
+
+if __name__ == '__main__':
+    unittest.main()
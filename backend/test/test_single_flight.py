@@ -0,0 +1,78 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        """测试相同 key 的并发调用只执行一次"""
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def slow_embed():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return 'feature'
+
+        results = []
+
+        def worker():
+            results.append(flight.do('same-image', slow_embed))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        threads[0].start()
+        started.wait(1)
+        for t in threads[1:]:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['feature'] * 8)
+        self.assertEqual(flight.inflight_count(), 0)
+
+    def test_exception_propagates_to_all_waiters(self):
+        """测试执行失败时所有等待者都收到异常，且之后可以重新执行"""
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            time.sleep(0.1)
+            raise RuntimeError('rate limit exceeded')
+
+        errors = []
+
+        def worker():
+            try:
+                flight.do('k', failing)
+            except RuntimeError as exc:
+                errors.append(str(exc))
+
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        threads[0].start()
+        started.wait(1)
+        for t in threads[1:]:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, ['rate limit exceeded'] * 3)
+        self.assertEqual(flight.do('k', lambda: 'ok'), 'ok')
+
+    def test_different_keys_run_independently(self):
+        """测试不同 key 互不影响"""
+        flight = SingleFlight()
+        self.assertEqual(flight.do('a', lambda: 1), 1)
+        self.assertEqual(flight.do('b', lambda: 2), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
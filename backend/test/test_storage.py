@@ -0,0 +1,311 @@
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from flask import Flask, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.serving import make_server
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.storage import (FormFileStream, HashingReader, KodoStorage, KodoStreamUploader, LocalStorage,
+                              OSSStorage, OSSStreamUploader, Storage, StreamUploader, get_storage)
+
+try:
+    import qiniu
+    from qiniu.utils import urlsafe_base64_decode
+except ImportError:  # 未安装 qiniu SDK 时跳过
+    qiniu = None
+
+PART_SIZE = 100 * 1024
+
+
+def multipart_body(fields, file_field, filename, content, boundary='----testboundary'):
+    lines = []
+    for name, value in fields:
+        lines.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    lines.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                 f'Content-Type: image/jpeg\r\n\r\n'.encode() + content + b'\r\n')
+    lines.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(lines), boundary
+
+
+class TrickleStream(io.BytesIO):
+    """每次最多返回 7 KB，模拟网络输入流的短读"""
+
+    def read(self, size=-1):
+        return super().read(min(size, 7 * 1024) if size and size > 0 else 7 * 1024)
+
+
+class FakeBucket:
+    def __init__(self, fail_part=None):
+        self.objects = {}
+        self.parts = {}
+        self.aborted = []
+        self.fail_part = fail_part
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self.lock = threading.Lock()
+
+    def put_object(self, key, data, headers=None):
+        self.objects[key] = bytes(data)
+        return SimpleNamespace(etag='single')
+
+    def init_multipart_upload(self, key, headers=None):
+        return SimpleNamespace(upload_id='upload-1')
+
+    def upload_part(self, key, upload_id, part_number, data):
+        with self.lock:
+            self.concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        time.sleep(0.01)
+        with self.lock:
+            self.concurrent -= 1
+        if part_number == self.fail_part:
+            raise IOError('part failed')
+        self.parts[part_number] = bytes(data)
+        return SimpleNamespace(etag=f'etag-{part_number}')
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        self.completed_parts = [(p.part_number, p.etag) for p in parts]
+        self.objects[key] = b''.join(self.parts[n] for n, _ in self.completed_parts)
+        return SimpleNamespace(etag='multipart')
+
+    def abort_multipart_upload(self, key, upload_id):
+        self.aborted.append(upload_id)
+
+
+class TestStreamingReaders(unittest.TestCase):
+    def test_form_file_stream_reads_fields_before_file(self):
+        content = os.urandom(300 * 1024)
+        body, boundary = multipart_body([('folder', '新品')], 'file', 'a.jpg', content)
+        form_file = FormFileStream(TrickleStream(body), boundary.encode(), 'file')
+        self.assertEqual(form_file.form['folder'], '新品')
+        self.assertEqual(form_file.filename, 'a.jpg')
+        self.assertEqual(form_file.content_type, 'image/jpeg')
+        reader = HashingReader(form_file)
+        self.assertEqual(reader.read_exact(len(content) + 10), content)
+        self.assertEqual(reader.size, len(content))
+        self.assertEqual(reader.sha256, hashlib.sha256(content).hexdigest())
+
+    def test_hashing_reader_enforces_max_size(self):
+        reader = HashingReader(io.BytesIO(b'x' * 2000), max_size=1000)
+        with self.assertRaises(RequestEntityTooLarge):
+            reader.read_exact(2000)
+
+
+class TestOSSStreamUploader(unittest.TestCase):
+    def test_small_file_uses_single_put(self):
+        bucket = FakeBucket()
+        result = OSSStreamUploader(bucket, part_size=PART_SIZE).upload_stream('k', HashingReader(io.BytesIO(b'abc')))
+        self.assertEqual((result.parts, result.etag, result.size), (1, 'single', 3))
+        self.assertEqual(bucket.objects['k'], b'abc')
+
+    def test_large_file_uploads_parts_concurrently(self):
+        content = os.urandom(PART_SIZE * 5 + 123)
+        bucket = FakeBucket()
+        uploader = OSSStreamUploader(bucket, part_size=PART_SIZE, max_workers=3)
+        result = uploader.upload_stream('big', HashingReader(TrickleStream(content)), 'image/jpeg')
+        self.assertEqual(result.parts, 6)
+        self.assertEqual(result.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(bucket.objects['big'], content)
+        self.assertEqual([n for n, _ in bucket.completed_parts], [1, 2, 3, 4, 5, 6])
+        self.assertGreater(bucket.max_concurrent, 1)
+        self.assertLessEqual(bucket.max_concurrent, 3)
+
+    def test_failed_part_aborts_upload(self):
+        bucket = FakeBucket(fail_part=2)
+        uploader = OSSStreamUploader(bucket, part_size=PART_SIZE, max_workers=2)
+        with self.assertRaises(IOError):
+            uploader.upload_stream('big', HashingReader(io.BytesIO(os.urandom(PART_SIZE * 4))))
+        self.assertEqual(bucket.aborted, ['upload-1'])
+        self.assertNotIn('big', bucket.objects)
+
+
+class FakeKodoUploads:
+    """本地模拟的 Kodo 表单上传、分片上传 v2 与批量 stat/delete 接口"""
+
+    def __init__(self):
+        self.objects = {}
+        self.parts = {}
+        self.app = Flask(__name__)
+        self.app.add_url_rule('/', 'form', self.form_upload, methods=['POST'])
+        self.app.add_url_rule('/buckets/<bucket>/objects/<key>/uploads', 'init', self.init, methods=['POST'])
+        self.app.add_url_rule('/buckets/<bucket>/objects/<key>/uploads/<upload_id>/<int:number>', 'part',
+                              self.part, methods=['PUT'])
+        self.app.add_url_rule('/buckets/<bucket>/objects/<key>/uploads/<upload_id>', 'complete',
+                              self.complete, methods=['POST', 'DELETE'])
+        self.app.add_url_rule('/batch', 'batch', self.batch, methods=['POST'])
+        self.batch_sizes = []
+        self.server = make_server('127.0.0.1', 0, self.app, threaded=True)
+        self.host = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def form_upload(self):
+        self.objects[request.form['key']] = request.files['file'].read()
+        return jsonify({'key': request.form['key'], 'hash': 'form'})
+
+    def init(self, bucket, key):
+        assert request.headers['Authorization'].startswith('UpToken ')
+        return jsonify({'uploadId': 'u1'})
+
+    def part(self, bucket, key, upload_id, number):
+        self.parts[number] = request.get_data()
+        return jsonify({'etag': f'e{number}'})
+
+    def complete(self, bucket, key, upload_id):
+        import base64
+
+        parts = request.get_json()['parts']
+        name = base64.urlsafe_b64decode(key).decode()
+        self.objects[name] = b''.join(self.parts[p['partNumber']] for p in parts)
+        return jsonify({'key': name, 'hash': 'multipart'})
+
+    def batch(self):
+        ops = request.form.getlist('op')
+        self.batch_sizes.append(len(ops))
+        results = []
+        for op in ops:
+            action, encoded = op.strip('/').split('/')[:2]
+            key = urlsafe_base64_decode(encoded).decode().split(':', 1)[1]
+            if key not in self.objects:
+                results.append({'code': 612, 'data': {'error': 'no such file or directory'}})
+            elif action == 'delete':
+                del self.objects[key]
+                results.append({'code': 200})
+            else:
+                results.append({'code': 200, 'data': {'fsize': len(self.objects[key]), 'hash': 'h'}})
+        response = jsonify(results)
+        response.headers['X-Reqid'] = 'fake'
+        return response
+
+
+class TestKodoStreamUploader(unittest.TestCase):
+    def setUp(self):
+        self.kodo = FakeKodoUploads()
+        auth = SimpleNamespace(upload_token=lambda bucket, key, expires: 'ak:sign:policy')
+        self.uploader = KodoStreamUploader(auth, 'bucket', self.kodo.host, part_size=PART_SIZE, max_workers=2)
+
+    def tearDown(self):
+        self.kodo.server.shutdown()
+
+    def test_small_and_multipart_uploads(self):
+        self.assertEqual(self.uploader.upload_stream('a/small.jpg', HashingReader(io.BytesIO(b'tiny'))).etag, 'form')
+        content = os.urandom(PART_SIZE * 2 + 5)
+        result = self.uploader.upload_stream('a/大图.jpg', HashingReader(io.BytesIO(content)), 'image/jpeg')
+        self.assertEqual((result.etag, result.parts), ('multipart', 3))
+        self.assertEqual(self.kodo.objects, {'a/small.jpg': b'tiny', 'a/大图.jpg': content})
+
+
+class TestLocalStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.storage = LocalStorage(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_put_many_and_delete_many(self):
+        source = os.path.join(self.tmpdir, 'source.jpg')
+        with open(source, 'wb') as f:
+            f.write(b'from-path')
+        results = self.storage.put_many([('good_images/1/a.jpg', b'bytes'), ('good_images/1/b.jpg', source),
+                                         ('size_images/c.jpg', io.BytesIO(b'stream'))])
+        self.assertEqual([r.key for r in results], ['good_images/1/a.jpg', 'good_images/1/b.jpg', 'size_images/c.jpg'])
+        self.assertEqual(results[1].sha256, hashlib.sha256(b'from-path').hexdigest())
+        with open(self.storage.local_path('size_images/c.jpg'), 'rb') as f:
+            self.assertEqual(f.read(), b'stream')
+        self.assertEqual(self.storage.url('good_images/1/a.jpg'), '/uploads/good_images/1/a.jpg')
+
+        self.assertEqual(self.storage.delete_many(['good_images/1/a.jpg', 'good_images/1/b.jpg']),
+                         ['good_images/1/a.jpg', 'good_images/1/b.jpg'])
+        self.assertFalse(self.storage.exists('good_images/1/a.jpg'))
+        self.assertTrue(self.storage.exists('size_images/c.jpg'))
+        # 没有遗留的临时文件
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir, 'good_images', '1')), [])
+
+    def test_rejects_path_traversal(self):
+        with self.assertRaises(ValueError):
+            self.storage.put('../outside.jpg', b'x')
+
+
+    def test_incomplete_backends_fail_on_creation(self):
+        class NoUrlStorage(Storage):
+            upload_stream = LocalStorage.upload_stream
+            delete = LocalStorage.delete
+            exists = LocalStorage.exists
+
+        class NoAbortUploader(StreamUploader):
+            _put_single = _init_multipart = _upload_part = _complete_multipart = OSSStreamUploader._put_single
+
+        with self.assertRaisesRegex(TypeError, 'url'):
+            NoUrlStorage()
+        with self.assertRaisesRegex(TypeError, '_abort_multipart'):
+            NoAbortUploader()
+
+
+class TestStorageRegistry(unittest.TestCase):
+    def test_clients_are_reused(self):
+        from flask import Flask
+
+        app = Flask(__name__)
+        app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
+        env = {'OSS_ACCESS_KEY_ID': 'id', 'OSS_ACCESS_KEY_SECRET': 'secret',
+               'OSS_ENDPOINT': 'https://oss-cn-hangzhou.aliyuncs.com', 'OSS_BUCKET_NAME': 'bucket'}
+        saved = {name: os.environ.get(name) for name in env}
+        os.environ.update(env)
+        try:
+            with app.app_context():
+                oss = get_storage('oss')
+                self.assertIs(get_storage('oss'), oss)
+                self.assertIsInstance(get_storage('local'), LocalStorage)
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        self.assertIsInstance(oss, OSSStorage)
+        self.assertEqual(oss.url('products/a.jpg'), 'https://bucket.oss-cn-hangzhou.aliyuncs.com/products/a.jpg')
+
+    def test_oss_delete_many_batches_by_1000(self):
+        storage = OSSStorage('id', 'secret', 'https://oss-cn-hangzhou.aliyuncs.com', 'bucket')
+        calls = []
+        storage.bucket = SimpleNamespace(batch_delete_objects=lambda keys: calls.append(len(keys)) or
+                                         SimpleNamespace(deleted_keys=list(keys)))
+        keys = [f'k{n}' for n in range(2500)]
+        self.assertEqual(storage.delete_many(keys), keys)
+        self.assertEqual(calls, [1000, 1000, 500])
+
+
+@unittest.skipIf(qiniu is None, '未安装 qiniu SDK')
+class TestKodoStorage(unittest.TestCase):
+    def setUp(self):
+        self.kodo = FakeKodoUploads()
+        regions = [qiniu.Region(up_host=self.kodo.host, rs_host=self.kodo.host)]
+        self.storage = KodoStorage(qiniu.Auth('ak', 'sk'), 'bucket', 'https://cdn.example.com/', regions)
+
+    def tearDown(self):
+        self.kodo.server.shutdown()
+
+    def test_put_stat_and_batch_delete(self):
+        self.storage.put_many([(f'raw/{n}.jpg', b'data') for n in range(3)])
+        self.assertEqual(sorted(self.kodo.objects), ['raw/0.jpg', 'raw/1.jpg', 'raw/2.jpg'])
+        self.assertTrue(self.storage.exists('raw/1.jpg'))
+        self.assertEqual(self.storage.url('raw/1.jpg'), 'https://cdn.example.com/raw/1.jpg')
+
+        self.kodo.batch_sizes.clear()
+        self.assertEqual(self.storage.delete_many(['raw/0.jpg', 'raw/2.jpg', 'raw/missing.jpg']),
+                         ['raw/0.jpg', 'raw/2.jpg'])
+        self.assertEqual(self.kodo.batch_sizes, [3])
+        self.assertEqual(list(self.kodo.objects), ['raw/1.jpg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,11 @@
+"""
+WSGI 入口：gunicorn wsgi:app
+
+应用（及全量向量索引）只在这里创建；离线脚本和测试 `from app import create_app` 时不会构建应用，
+可以按需传入 load_index=False。
+"""
+import os
+
+from app import create_app
+
+app = create_app(os.getenv('FLASK_CONFIG', 'development'))
@@ -92,7 +92,7 @@ const OrderCreation: React.FC<OrderCreationProps> = ({ onOrderCreate }) => {
           }
         }
 
-        const thumbnailUrl = firstPath ? getImageUrl(firstPath) : '';
+        const thumbnailUrl = firstPath ? getImageUrl(firstPath, 256) : '';
 
         setCurrentProduct({
           ...product,
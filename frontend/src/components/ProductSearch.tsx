@@ -352,7 +352,7 @@ export const ProductSearch: React.FC = () => {
               >
                 <div className="w-full h-48 bg-gray-100 flex items-center justify-center">
                   <img
-                    src={getImageUrl(result.oss_path)}
+                    src={getImageUrl(result.oss_path, 512)}
                     alt={result.oss_path ? `缩略图 ${result.id}` : '缩略图'}
                     className="max-w-full max-h-full object-contain"
                   />
@@ -402,7 +402,7 @@ export const ProductSearch: React.FC = () => {
                     {/* 小缩略图 */}
                     {(result.image_path) && (
                       <img
-                        src={getImageUrl(result.image_path)}
+                        src={getImageUrl(result.image_path, 128)}
                         alt={result.image_path ? `缩略图 ${result.id}` : '缩略图'}
                         className="w-8 h-8 object-cover rounded mr-2 border border-gray-200"
                       />
@@ -432,7 +432,7 @@ export const ProductSearch: React.FC = () => {
                     return (
                       <Image
                         key={index}
-                        src={`${API_BASE_URL}${path}`}
+                        src={getImageUrl(path)}
                         alt={`商品图片 ${index + 1}`}
                         style={{ width: '100%', height: 'auto' }}
                       />
@@ -453,7 +453,7 @@ export const ProductSearch: React.FC = () => {
                         return (
                           <Image
                             key={index}
-                            src={`${API_BASE_URL}                <Descriptions.Item label="成本价">¥{product.price}</Descriptions.Item>${path}`}
+                            src={getImageUrl(path)}
                             alt={`尺码图片 ${index + 1}`}
                             style={{ width: '100%', height: 'auto' }}
                           />
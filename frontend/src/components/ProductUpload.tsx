@@ -1,7 +1,7 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { Table, Button, Modal, Form, Input, InputNumber, message, Popconfirm, Upload, Image, Select, Progress, AutoComplete } from 'antd';
 import { PlusOutlined, EditOutlined, DeleteOutlined, UploadOutlined, SearchOutlined, LoadingOutlined, ReloadOutlined, CloseCircleFilled } from '@ant-design/icons';
-import { uploadProductCSV, ProductInfo, getProducts, addProduct, updateProduct, deleteProduct, deleteProductImage, API_BASE_URL, buildVectorIndexSSE, batchDeleteProductsAPI } from '../services/api';
+import { uploadProductCSV, ProductInfo, ProductListPage, listProducts, getProductById, addProduct, updateProduct, deleteProduct, deleteProductImage, API_BASE_URL, getImageUrl, buildVectorIndexSSE, batchDeleteProductsAPI } from '../services/api';
 import type { UploadFile, UploadProps } from 'antd/es/upload/interface';
 
 // Add interface for image with tag
@@ -10,9 +10,37 @@ interface ImageWithTag {
   tag?: '尺码图' | '上身图' | '实物图';
 }
 
+// 表格每页条数，与服务端分页的 limit 一致
+const PRODUCT_PAGE_SIZE = 10;
+// 表格只需要的轻量字段；完整字段（含全部商品图）在打开编辑弹窗时再按 ID 获取
+const PRODUCT_LIST_FIELDS = [
+  'id', 'name', 'size', 'color', 'thumbnail', 'sale_price', 'factory_name', 'sales_status',
+];
+
+type ProductRow = ProductInfo & { thumbnail?: string | null };
+type TableFilters = Record<string, React.Key[] | null>;
+
+// 只比较有值的筛选项，避免 antd 回传的 null 项被当成筛选变化
+const filtersKey = (filters: TableFilters) =>
+  JSON.stringify(Object.entries(filters).filter(([, value]) => value && value.length).sort());
+
+// 优先取标记为尺码图的图片，否则取第一张
+const pickImagePath = (goodImg: ProductInfo['good_img']): string => {
+  const imagesRaw = Array.isArray(goodImg) ? goodImg : (goodImg ? JSON.parse(goodImg as string) : []);
+  if (!Array.isArray(imagesRaw) || imagesRaw.length === 0) return '';
+  const sizeImage = imagesRaw.find((img: any) => typeof img === 'object' && img?.tag === '尺码图');
+  if (sizeImage?.url) return sizeImage.url;
+  return typeof imagesRaw[0] === 'string' ? imagesRaw[0] : (imagesRaw[0]?.url || '');
+};
+
 export const ProductUpload: React.FC = () => {
-  const [products, setProducts] = useState<ProductInfo[]>([]);
+  const [products, setProducts] = useState<ProductRow[]>([]);
+  const [currentPage, setCurrentPage] = useState(1);
+  // pageCursors[i] 为第 i + 1 页的游标（第一页为 null）
+  const [pageCursors, setPageCursors] = useState<(string | null)[]>([null]);
+  const [hasMore, setHasMore] = useState(false);
   const [loading, setLoading] = useState(false);
+  const fetchRequestId = useRef(0);
   
   // 生成6位数字水印：售价和商品ID交替组合，不足位数用x补齐
   const generateWatermark = (salePrice: number, productId: string | number) => {
@@ -45,7 +73,7 @@ export const ProductUpload: React.FC = () => {
   const [indexingLoading, setIndexingLoading] = useState(false);
   const [searchName, setSearchName] = useState('');
   const [searchId, setSearchId] = useState('');
-  const [filteredInfo, setFilteredInfo] = useState<Record<string, string[] | null>>({});
+  const [filteredInfo, setFilteredInfo] = useState<TableFilters>({});
   const [selectedRowKeys, setSelectedRowKeys] = useState<React.Key[]>([]);
   const [batchDeleteLoading, setBatchDeleteLoading] = useState(false);
   const [progressPercent, setProgressPercent] = useState<number>(0);
@@ -89,26 +117,58 @@ export const ProductUpload: React.FC = () => {
     };
   }, []);
 
+  // 筛选条件变化（含首次加载）时从第一页重新查询
   useEffect(() => {
-    fetchProducts();
-  }, []);
+    fetchProducts(1, [null]);
+  }, [filteredInfo]);
 
-  const fetchProducts = async () => {
+  // 只加载当前页：名称、销售状态、工厂筛选交给服务端，商品ID按 ID 精确获取
+  const fetchProducts = async (page: number = currentPage, cursors: (string | null)[] = pageCursors) => {
+    const requestId = ++fetchRequestId.current;
     setLoading(true);
     try {
-      const data = await getProducts();
-      setProducts(data);
-      
-      // 提取所有唯一的工厂名称
-      const uniqueFactoryNames = Array.from(
-        new Set(data.map(p => p.factory_name).filter(Boolean))
-      ).filter((name): name is string => name !== undefined);
-      
-      setFactoryNames(uniqueFactoryNames);
+      let items: ProductRow[] = [];
+      let nextCursor: string | null = null;
+      const productId = filteredInfo.id?.[0];
+      if (productId) {
+        try {
+          items = [await getProductById(String(productId).trim())];
+        } catch (err) {
+          if (!(err instanceof Error && err.message.includes('不存在'))) throw err;
+        }
+      } else {
+        const result: ProductListPage = await listProducts({
+          limit: PRODUCT_PAGE_SIZE,
+          cursor: cursors[page - 1] ?? null,
+          fields: PRODUCT_LIST_FIELDS,
+          q: filteredInfo.name?.[0] ? String(filteredInfo.name[0]).trim() : undefined,
+          sales_status: filteredInfo.sales_status?.join(','),
+          factory_name: filteredInfo.factory_name?.[0] ? String(filteredInfo.factory_name[0]) : undefined,
+        });
+        items = result.items as ProductRow[];
+        nextCursor = result.has_more ? result.next_cursor : null;
+      }
+      if (requestId !== fetchRequestId.current) return;  // 已有更新的刷新请求
+
+      // 当前页为空（例如删除了最后一页的全部商品）时退回上一页
+      if (items.length === 0 && page > 1) {
+        fetchProducts(page - 1, cursors);
+        return;
+      }
+      setProducts(items);
+      setCurrentPage(page);
+      setPageCursors(nextCursor ? [...cursors.slice(0, page), nextCursor] : cursors.slice(0, page));
+      setHasMore(!!nextCursor);
+
+      // 工厂名称（筛选项和编辑弹窗的自动补全）从已加载的页累积
+      setFactoryNames(prev => Array.from(new Set([
+        ...prev,
+        ...items.map(p => p.factory_name).filter((name): name is string => !!name),
+      ])));
     } catch (err) {
       message.error('获取产品列表失败');
     } finally {
-      setLoading(false);
+      if (requestId === fetchRequestId.current) setLoading(false);
     }
   };
 
@@ -186,7 +246,17 @@ export const ProductUpload: React.FC = () => {
     }
   };
 
-  const showModal = (product?: ProductInfo) => {
+  const showModal = async (row?: ProductInfo) => {
+    let product: ProductInfo | undefined;
+    if (row) {
+      // 列表只有轻量字段，编辑时按 ID 获取完整商品（含全部商品图）
+      try {
+        product = await getProductById(row.id as string);
+      } catch (err) {
+        message.error(err instanceof Error ? err.message : '获取商品详情失败');
+        return;
+      }
+    }
     setEditingProduct(product || null);
     if (product) {
       // 编辑模式，回填图片
@@ -207,7 +277,7 @@ export const ProductUpload: React.FC = () => {
                 uid: `good_img_${idx}`,
                 name: item.split('/').pop() || '',
                 status: 'done',
-                url: `${API_BASE_URL}${item}`,
+                url: getImageUrl(item),
                 response: item,
               };
             } else {
@@ -220,7 +290,7 @@ export const ProductUpload: React.FC = () => {
                 uid,
                 name: item.url.split('/').pop() || '',
                 status: 'done',
-                url: `${API_BASE_URL}${item.url}`,
+                url: getImageUrl(item.url),
                 response: item.url,
               };
             }
@@ -393,10 +463,6 @@ export const ProductUpload: React.FC = () => {
           )}
         </span>
       ),
-      onFilter: (value: boolean | React.Key, record: ProductInfo) => {
-        const searchValue = String(value).toLowerCase();
-        return record.id?.toString().toLowerCase() === searchValue;
-      },
     },
     {
       title: '商品名称',
@@ -416,7 +482,7 @@ export const ProductUpload: React.FC = () => {
       }) => (
         <div style={{ padding: 8 }}>
           <Input
-            placeholder="搜索商品名称"
+            placeholder="搜索商品名称或货号"
             value={selectedKeys[0] as string}
             onChange={e => setSelectedKeys(e.target.value ? [e.target.value] : [])}
             onPressEnter={confirm}
@@ -456,10 +522,6 @@ export const ProductUpload: React.FC = () => {
           )}
         </span>
       ),
-      onFilter: (value: boolean | React.Key, record: ProductInfo) => {
-        const searchValue = String(value).toLowerCase();
-        return !!record.name?.toString().toLowerCase().includes(searchValue);
-      },
     },
     {
       title: '尺码',
@@ -473,33 +535,15 @@ export const ProductUpload: React.FC = () => {
     },
     {
       title: '商品图片',
-      dataIndex: 'good_img',
-      key: 'good_img',
-      render: (good_img: string | string[], record: ProductInfo) => {
-        if (!good_img) return <span>无图片</span>;
-        
+      dataIndex: 'thumbnail',
+      key: 'thumbnail',
+      render: (thumbnail: string | null | undefined, record: ProductRow) => {
         try {
-          const imagesRaw = Array.isArray(good_img) ? good_img : JSON.parse(good_img as string);
-          if (!imagesRaw || imagesRaw.length === 0) return <span>无图片</span>;
-          
-          // Handle both old format (array of strings) and new format (array of objects)
-          let firstPath = '';
-          if (imagesRaw.length > 0) {
-            // First try to find an image with tag '尺码图'
-            const sizeImage = imagesRaw.find((img: any) => 
-              typeof img === 'object' && img?.tag === '尺码图'
-            );
-            
-            if (sizeImage && sizeImage.url) {
-              firstPath = sizeImage.url;
-            } else {
-              // Fallback to first image
-              if (typeof imagesRaw[0] === 'string') firstPath = imagesRaw[0];
-              else if (imagesRaw[0]?.url) firstPath = imagesRaw[0].url;
-            }
-          }
-          
-          const thumbnailUrl = firstPath ? `${API_BASE_URL}${firstPath}` : '';
+          // 列表接口返回 thumbnail；按商品ID查到的完整商品只有 good_img
+          const firstPath = thumbnail || pickImagePath(record.good_img);
+          if (!firstPath) return <span>无图片</span>;
+
+          const thumbnailUrl = getImageUrl(firstPath);
           
           // 生成水印文本
           const watermarkText = generateWatermark(record.sale_price || 0, record.id || '');
@@ -649,15 +693,16 @@ export const ProductUpload: React.FC = () => {
         { text: '预售', value: 'pre_sale' },
       ],
       filteredValue: filteredInfo.sales_status || null,
-      onFilter: (value: boolean | React.Key, record: ProductInfo) => record.sales_status === String(value),
       render: (text: string, record: ProductInfo) => (
         <Select
           defaultValue={text || 'on_sale'}
           style={{ width: 100 }}
           onChange={async (value) => {
             try {
+              // 更新接口按提交的 good_img 重建商品图，需要先取完整商品
+              const product = await getProductById(record.id as string);
               const formData = new FormData();
-              const productData = { ...record, sales_status: value };
+              const productData = { ...product, sales_status: value };
               formData.append('product', JSON.stringify(productData));
               
               await updateProduct(record.id as string, formData);
@@ -698,14 +743,12 @@ export const ProductUpload: React.FC = () => {
       title: '工厂名称',
       dataIndex: 'factory_name',
       key: 'factory_name',
-      filters: Array.from(new Set(products.map(p => p.factory_name).filter(Boolean)))
-        .filter((name): name is string => name !== undefined)
-        .map(name => ({
-          text: name,
-          value: name,
-        })),
+      filters: factoryNames.map(name => ({
+        text: name,
+        value: name,
+      })),
+      filterMultiple: false,
       filteredValue: filteredInfo.factory_name || null,
-      onFilter: (value: boolean | React.Key, record: ProductInfo) => record.factory_name === String(value),
     },
     {
       title: '操作',
@@ -858,13 +901,20 @@ export const ProductUpload: React.FC = () => {
         rowSelection={rowSelection} // 启用行选择
         loading={loading}
         onChange={(pagination, filters) => {
-          setFilteredInfo(filters as Record<string, string[] | null>);
+          if (filtersKey(filters as TableFilters) !== filtersKey(filteredInfo)) {
+            setFilteredInfo(filters as TableFilters);
+          } else if (pagination.current && pagination.current !== currentPage) {
+            fetchProducts(pagination.current);
+          }
         }}
         pagination={{
-          total: products.length,
-          pageSize: 10,
-          showQuickJumper: true,
-          showTotal: (total) => `共 ${total} 条`,
+          current: currentPage,
+          pageSize: PRODUCT_PAGE_SIZE,
+          // 游标分页没有总数：已加载的页加上"下一页"（还有更多时）
+          total: hasMore
+            ? currentPage * PRODUCT_PAGE_SIZE + 1
+            : (currentPage - 1) * PRODUCT_PAGE_SIZE + products.length,
+          showSizeChanger: false,
         }}
       />
 
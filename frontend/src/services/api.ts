@@ -13,6 +13,9 @@ const getApiBaseUrl = () => {
 };
 // export const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:5000';
 export const API_BASE_URL = getApiBaseUrl();
+// 图片使用相对路径，经前端所在站点访问：生产环境由 nginx 转发到后端并通过 X-Accel-Redirect 发送文件，
+// 开发环境由 vite 的 server.proxy 转发（见 vite.config.ts）
+export const IMAGE_BASE_URL = '';
 
 export interface ProductInfo {
   id?: number | string;
@@ -74,7 +77,8 @@ export interface AddressInfo {
 }
 
 // Helper function to get full image URL
-export const getImageUrl = (imagePath: string): string => {
+// width: request a server-side resized variant (must be one of IMAGE_VARIANT_WIDTHS on the backend)
+export const getImageUrl = (imagePath: string, width?: number): string => {
   // If the path already starts with http or https, return it as is
   if (imagePath.startsWith('http://') || imagePath.startsWith('https://')) {
     return imagePath;
@@ -102,8 +106,13 @@ export const getImageUrl = (imagePath: string): string => {
     imagePath = '/' + imagePath;
   }
   
+  // Resized variants are only available for files served by the backend itself
+  if (width && (imagePath.startsWith('/uploads/') || imagePath.startsWith('/dataset-images/'))) {
+    imagePath = `${imagePath}${imagePath.includes('?') ? '&' : '?'}w=${width}`;
+  }
+
   // Log the constructed URL for debugging
-  const fullUrl = `${API_BASE_URL}${imagePath}`;
+  const fullUrl = `${IMAGE_BASE_URL}${imagePath}`;
   console.log('Constructed image URL:', fullUrl);
   
   return fullUrl;
@@ -290,6 +299,38 @@ export const getProducts = async (): Promise<ProductInfo[]> => {
   return response.json();
 };
 
+// 分页获取产品列表（游标分页、服务端筛选、字段投影）
+export interface ProductListParams {
+  limit?: number;
+  cursor?: string | null;
+  fields?: string[];
+  q?: string;
+  sales_status?: string;
+  factory_name?: string;
+  min_price?: number;
+  max_price?: number;
+}
+
+export interface ProductListPage {
+  items: Partial<ProductInfo & { thumbnail: string | null }>[];
+  next_cursor: string | null;
+  has_more: boolean;
+}
+
+export const listProducts = async (params: ProductListParams = {}): Promise<ProductListPage> => {
+  const query = new URLSearchParams({ limit: String(params.limit ?? 50) });
+  Object.entries(params).forEach(([key, value]) => {
+    if (key === 'limit' || value === undefined || value === null || value === '') return;
+    query.set(key, Array.isArray(value) ? value.join(',') : String(value));
+  });
+  const response = await fetch(`${API_BASE_URL}/api/products?${query}`);
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.error || '获取产品列表失败');
+  }
+  return response.json();
+};
+
 // 添加产品
 export const addProduct = async (formData: FormData): Promise<{ message: string; id: string }> => {
   const response = await fetch(`${API_BASE_URL}/api/products`, {
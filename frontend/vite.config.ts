@@ -13,10 +13,19 @@ export default defineConfig({
     strictPort: true, // 如果端口被占用，则会抛出错误而不是尝试下一个可用端口
     open: false, // 禁用自动打开浏览器（局域网环境下可能不需要）
     cors: true, // 启用 CORS
+    // 图片使用相对路径（与生产环境的 nginx 一致），开发时转发到后端
+    proxy: {
+      '/uploads': 'http://localhost:5000',
+      '/dataset-images': 'http://localhost:5000',
+    },
   },
   preview: {
     host: '0.0.0.0', // 预览模式也支持局域网访问
     port: 4173,
     strictPort: true,
+    proxy: {
+      '/uploads': 'http://localhost:5000',
+      '/dataset-images': 'http://localhost:5000',
+    },
   },
 });
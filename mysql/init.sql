@@ -9,6 +9,8 @@ SET CHARACTER SET utf8mb4;
 CREATE TABLE IF NOT EXISTS customers (
     id INT AUTO_INCREMENT PRIMARY KEY,
     name VARCHAR(100) NOT NULL,
+    name_pinyin VARCHAR(255) COMMENT '姓名全拼，用于拼音前缀检索',
+    name_initials VARCHAR(100) COMMENT '姓名拼音首字母',
     wechat VARCHAR(100),
     phone VARCHAR(20) NOT NULL,
     default_address TEXT,
@@ -17,7 +19,9 @@ CREATE TABLE IF NOT EXISTS customers (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     balance DECIMAL(10,2) NOT NULL DEFAULT 0 COMMENT '客户余额',
     INDEX idx_name (name),
-    INDEX idx_phone (phone)
+    INDEX idx_phone (phone),
+    INDEX ix_customers_name_pinyin (name_pinyin),
+    INDEX ix_customers_name_initials (name_initials)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 创建产品表
@@ -59,7 +63,8 @@ CREATE TABLE IF NOT EXISTS products (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
 
     INDEX idx_product_code (product_code),
-    INDEX idx_sales_status (sales_status)
+    INDEX idx_sales_status (sales_status),
+    INDEX idx_products_created_at_id (created_at, id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 创建订单表